@@ -0,0 +1,199 @@
+"""partition expenses by month
+
+Revision ID: 0fd92231dc13
+Revises: 9c683a3d19c8
+Create Date: 2026-10-17 22:24:48.692670
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0fd92231dc13'
+down_revision: Union[str, Sequence[str], None] = '9c683a3d19c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The partitions and maintenance functions as of this revision, copied from
+# home_budget_api/partitions.py so that later changes there do not change
+# what this migration creates.
+CREATE_CATCH_ALL_PARTITIONS = [
+    "CREATE TABLE expenses_archive PARTITION OF expenses FOR VALUES FROM (MINVALUE) TO ('{month_start}')",
+    "CREATE TABLE expenses_future PARTITION OF expenses FOR VALUES FROM ('{month_start}') TO (MAXVALUE)"
+]
+
+CREATE_MONTH_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_expense_month(source text, month_start date) RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    next_month date := (month_start + interval '1 month')::date;
+    partition_name text := 'expenses_' || to_char(month_start, '"y"YYYY"m"MM');
+BEGIN
+    EXECUTE format('CREATE TABLE %I (LIKE expenses INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE date >= $1 AND date < $2 RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved', source, partition_name
+    ) USING month_start, next_month;
+    EXECUTE format(
+        'ALTER TABLE expenses ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, next_month
+    );
+END
+$$
+"""
+
+EXTEND_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION extend_expense_partitions(first_month date, last_month date) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    covered_from date;
+    covered_to date;
+    month_start date;
+    created integer := 0;
+BEGIN
+    -- App workers and cron may run this at the same time.
+    PERFORM pg_advisory_xact_lock(hashtext('extend_expense_partitions'));
+    first_month := date_trunc('month', first_month)::date;
+    last_month := date_trunc('month', last_month)::date;
+    SELECT substring(pg_get_expr(relpartbound, oid) FROM 'TO \(''(.*)''\)')::date INTO covered_from
+    FROM pg_class WHERE oid = 'expenses_archive'::regclass;
+    SELECT substring(pg_get_expr(relpartbound, oid) FROM 'FROM \(''(.*)''\)')::date INTO covered_to
+    FROM pg_class WHERE oid = 'expenses_future'::regclass;
+
+    IF last_month >= covered_to THEN
+        ALTER TABLE expenses DETACH PARTITION expenses_future;
+        FOR month_start IN SELECT generate_series(covered_to, last_month, interval '1 month')::date LOOP
+            PERFORM create_expense_month('expenses_future', month_start);
+            created := created + 1;
+        END LOOP;
+        EXECUTE format(
+            'ALTER TABLE expenses ATTACH PARTITION expenses_future FOR VALUES FROM (%L) TO (MAXVALUE)',
+            (last_month + interval '1 month')::date
+        );
+    END IF;
+
+    IF first_month < covered_from THEN
+        ALTER TABLE expenses DETACH PARTITION expenses_archive;
+        FOR month_start IN SELECT generate_series(first_month, covered_from - 1, interval '1 month')::date LOOP
+            PERFORM create_expense_month('expenses_archive', month_start);
+            created := created + 1;
+        END LOOP;
+        EXECUTE format(
+            'ALTER TABLE expenses ATTACH PARTITION expenses_archive FOR VALUES FROM (MINVALUE) TO (%L)',
+            first_month
+        );
+    END IF;
+    RETURN created;
+END
+$$
+"""
+
+ENSURE_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_expense_partitions(months_ahead integer) RETURNS integer
+LANGUAGE sql AS $$
+    SELECT extend_expense_partitions(current_date, (current_date + make_interval(months => months_ahead))::date)
+$$
+"""
+
+FUNCTIONS = [CREATE_MONTH_FUNCTION, EXTEND_FUNCTION, ENSURE_FUNCTION]
+MONTHS_AHEAD = 3
+
+
+def _rename_old_table(new_name: str) -> None:
+    # Index names are unique per schema, so the old table's indexes are moved
+    # out of the way of the new table's. Its foreign keys keep their names,
+    # the new table's are named explicitly to get the same ones.
+    op.execute(f"ALTER TABLE expenses RENAME TO {new_name}")
+    op.execute(f"ALTER INDEX expenses_pkey RENAME TO {new_name}_pkey")
+    op.drop_index('ix_expenses_user_id_date_id', table_name=new_name)
+    op.drop_index('ix_expenses_category_id_user_id_date', table_name=new_name)
+
+
+def _create_indexes() -> None:
+    # Built once the rows are in, which is cheaper than maintaining them
+    # during the copy.
+    op.create_index('ix_expenses_user_id_date_id', 'expenses', ['user_id', 'date', 'id'], unique=False)
+    op.create_index('ix_expenses_category_id_user_id_date', 'expenses', ['category_id', 'user_id', 'date'], unique=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The table is rebuilt in this transaction: it is renamed (which blocks
+    # all access to it until the migration commits), its rows are copied into
+    # the partitioned table and it is dropped.
+    _rename_old_table('expenses_unpartitioned')
+    op.drop_index(op.f('ix_expenses_id'), table_name='expenses_unpartitioned')
+
+    op.create_table('expenses',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('expenses_id_seq'::regclass)"), nullable=False),
+    sa.Column('description', sa.String(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('date', sa.Date(), server_default=sa.text('CURRENT_DATE'), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], name='expenses_category_id_fkey', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='expenses_user_id_fkey', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'date'),
+    postgresql_partition_by='RANGE (date)'
+    )
+    op.execute("ALTER SEQUENCE expenses_id_seq OWNED BY expenses.id")
+
+    # Monthly partitions from the oldest expense through the months ahead,
+    # later dates go to expenses_future.
+    bind = op.get_bind()
+    oldest = bind.execute(sa.text("SELECT min(date) FROM expenses_unpartitioned")).scalar()
+    month_start = min(oldest or date.today(), date.today()).replace(day=1).isoformat()
+    for ddl in CREATE_CATCH_ALL_PARTITIONS:
+        op.execute(ddl.format(month_start=month_start))
+    for ddl in FUNCTIONS:
+        op.execute(ddl)
+    op.execute(f"SELECT ensure_expense_partitions({MONTHS_AHEAD})")
+
+    # The partition key cannot be NULL. The API always sets a date, so rows
+    # without one were written directly; they are dated today and counted in
+    # today's rollup, which skipped them so far.
+    op.execute(
+        "INSERT INTO expenses (id, description, amount, date, category_id, user_id) "
+        "SELECT id, description, amount, coalesce(date, CURRENT_DATE), category_id, user_id "
+        "FROM expenses_unpartitioned"
+    )
+    op.execute(
+        "INSERT INTO expense_daily_totals (user_id, category_id, day, total, count) "
+        "SELECT user_id, category_id, CURRENT_DATE, sum(amount), count(*) FROM expenses_unpartitioned "
+        "WHERE user_id IS NOT NULL AND category_id IS NOT NULL AND date IS NULL "
+        "GROUP BY user_id, category_id "
+        "ON CONFLICT (user_id, category_id, day) DO UPDATE SET "
+        "total = expense_daily_totals.total + excluded.total, count = expense_daily_totals.count + excluded.count"
+    )
+    op.drop_table('expenses_unpartitioned')
+    _create_indexes()
+    op.execute("ANALYZE expenses")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rename_old_table('expenses_partitioned')
+
+    op.create_table('expenses',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('expenses_id_seq'::regclass)"), nullable=False),
+    sa.Column('description', sa.String(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('date', sa.Date(), server_default=sa.text('CURRENT_DATE'), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], name='expenses_category_id_fkey', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='expenses_user_id_fkey', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("ALTER SEQUENCE expenses_id_seq OWNED BY expenses.id")
+    op.execute("INSERT INTO expenses SELECT id, description, amount, date, category_id, user_id FROM expenses_partitioned")
+    op.drop_table('expenses_partitioned')
+    op.execute("DROP FUNCTION ensure_expense_partitions(integer)")
+    op.execute("DROP FUNCTION extend_expense_partitions(date, date)")
+    op.execute("DROP FUNCTION create_expense_month(text, date)")
+
+    op.create_index(op.f('ix_expenses_id'), 'expenses', ['id'], unique=False)
+    _create_indexes()
@@ -0,0 +1,57 @@
+"""store converted expense amounts
+
+Revision ID: 313eb8ca1ff5
+Revises: a93e61f0c2d8
+Create Date: 2026-10-18 16:02:11.408527
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '313eb8ca1ff5'
+down_revision: Union[str, Sequence[str], None] = 'a93e61f0c2d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable without a default, so adding it rewrites nothing: expenses in
+    # their user's currency keep NULL.
+    op.add_column('expenses', sa.Column('converted_amount', sa.Numeric(precision=12, scale=2), nullable=True))
+    # The others get the amount their balance was debited, converted at the
+    # rate of their date and rounded as fx.convert does. One without a rate
+    # could not have been written through the API; it keeps NULL and counts
+    # at its amount.
+    op.execute(
+        "UPDATE expenses e SET converted_amount = round(e.amount * target.rate / source.rate, 2) "
+        "FROM users u, fx_rates source, fx_rates target "
+        "WHERE u.id = e.user_id AND e.currency <> u.currency "
+        "AND source.currency = e.currency AND source.day = e.date "
+        "AND target.currency = u.currency AND target.day = e.date"
+    )
+
+    op.add_column('expense_daily_totals', sa.Column('converted', sa.Numeric(precision=14, scale=2), nullable=True))
+    op.execute(
+        "UPDATE expense_daily_totals d SET converted = d.total FROM users u "
+        "WHERE u.id = d.user_id AND d.currency = u.currency"
+    )
+    op.execute(
+        "UPDATE expense_daily_totals d SET converted = f.converted FROM ("
+        "    SELECT user_id, category_id, date, currency, sum(coalesce(converted_amount, amount)) AS converted "
+        "    FROM expenses e WHERE e.currency <> (SELECT u.currency FROM users u WHERE u.id = e.user_id) "
+        "    GROUP BY user_id, category_id, date, currency"
+        ") f "
+        "WHERE d.user_id = f.user_id AND d.category_id = f.category_id AND d.day = f.date AND d.currency = f.currency"
+    )
+    op.alter_column('expense_daily_totals', 'converted', nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('expense_daily_totals', 'converted')
+    op.drop_column('expenses', 'converted_amount')
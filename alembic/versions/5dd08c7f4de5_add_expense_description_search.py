@@ -0,0 +1,105 @@
+"""add expense description search
+
+Revision ID: 5dd08c7f4de5
+Revises: 0fd92231dc13
+Create Date: 2026-10-17 22:38:19.083943
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '5dd08c7f4de5'
+down_revision: Union[str, Sequence[str], None] = '0fd92231dc13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX = 'ix_expenses_description_search'
+
+# create_expense_month() as of this revision (copied from
+# home_budget_api/partitions.py): generated columns are computed again on
+# insert, so they are left out of the copy.
+CREATE_MONTH_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_expense_month(source text, month_start date) RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    next_month date := (month_start + interval '1 month')::date;
+    partition_name text := 'expenses_' || to_char(month_start, '"y"YYYY"m"MM');
+    columns text;
+BEGIN
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO columns
+    FROM pg_attribute
+    WHERE attrelid = 'expenses'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE expenses INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)', partition_name
+    );
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE date >= $1 AND date < $2 RETURNING %s) '
+        'INSERT INTO %I (%s) SELECT * FROM moved', source, columns, partition_name, columns
+    ) USING month_start, next_month;
+    EXECUTE format(
+        'ALTER TABLE expenses ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, next_month
+    );
+END
+$$
+"""
+
+# The version of 0fd92231dc13, restored on downgrade.
+PREVIOUS_CREATE_MONTH_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_expense_month(source text, month_start date) RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    next_month date := (month_start + interval '1 month')::date;
+    partition_name text := 'expenses_' || to_char(month_start, '"y"YYYY"m"MM');
+BEGIN
+    EXECUTE format('CREATE TABLE %I (LIKE expenses INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE date >= $1 AND date < $2 RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved', source, partition_name
+    ) USING month_start, next_month;
+    EXECUTE format(
+        'ALTER TABLE expenses ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, next_month
+    );
+END
+$$
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A stored generated column rewrites every partition, holding an exclusive
+    # lock on expenses until this transaction commits.
+    op.add_column('expenses', sa.Column(
+        'description_search',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('simple', description)", persisted=True)
+    ))
+    # New months have to be created with the generated column.
+    op.execute(CREATE_MONTH_FUNCTION)
+
+    # A partitioned index cannot be built CONCURRENTLY. It is created on the
+    # parent alone (invalid until every partition has one), each partition's
+    # index is built CONCURRENTLY so the table stays writable, and attached.
+    op.execute(f"CREATE INDEX {INDEX} ON ONLY expenses USING gin (description_search)")
+    names = op.get_bind().execute(sa.text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'expenses'::regclass"
+    )).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in names:
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_description_search "
+                f"ON {partition} USING gin (description_search)"
+            )
+            op.execute(f"ALTER INDEX {INDEX} ATTACH PARTITION {partition}_description_search")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(INDEX, table_name='expenses')
+    op.drop_column('expenses', 'description_search')
+    op.execute(PREVIOUS_CREATE_MONTH_FUNCTION)
@@ -0,0 +1,45 @@
+"""add expense daily totals rollup
+
+Revision ID: 9c683a3d19c8
+Revises: d19b05e118bd
+Create Date: 2026-10-17 21:40:21.057216
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c683a3d19c8'
+down_revision: Union[str, Sequence[str], None] = 'd19b05e118bd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('expense_daily_totals',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('total', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'category_id', 'day')
+    )
+    op.create_index('ix_expense_daily_totals_category_id', 'expense_daily_totals', ['category_id'], unique=False)
+    op.execute(
+        "INSERT INTO expense_daily_totals (user_id, category_id, day, total, count) "
+        "SELECT user_id, category_id, date, sum(amount), count(*) FROM expenses "
+        "WHERE user_id IS NOT NULL AND category_id IS NOT NULL AND date IS NOT NULL "
+        "GROUP BY user_id, category_id, date"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_expense_daily_totals_category_id', table_name='expense_daily_totals')
+    op.drop_table('expense_daily_totals')
@@ -0,0 +1,75 @@
+"""add currencies and fx rates
+
+Revision ID: a93e61f0c2d8
+Revises: f2b7d4e80a39
+Create Date: 2026-10-18 11:26:05.774913
+
+Existing users and expenses get the currency given with
+`alembic -x currency=USD upgrade head`, EUR by default.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a93e61f0c2d8'
+down_revision: Union[str, Sequence[str], None] = 'f2b7d4e80a39'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DEFAULT = 'EUR'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = context.get_x_argument(as_dictionary=True).get('currency', DEFAULT).upper()
+
+    op.create_table('fx_rates',
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('rate', sa.Numeric(precision=18, scale=8), nullable=False),
+    sa.PrimaryKeyConstraint('currency', 'day')
+    )
+
+    # A constant default fills the existing rows without rewriting them,
+    # partitions of `expenses` included; changing it later keeps their value.
+    for table in ('users', 'expenses', 'expense_daily_totals'):
+        op.add_column(table, sa.Column('currency', sa.String(length=3), nullable=False, server_default=existing))
+    for table in ('users', 'expenses'):
+        if existing != DEFAULT:
+            op.alter_column(table, 'currency', server_default=DEFAULT)
+    op.alter_column('expense_daily_totals', 'currency', server_default=None)
+
+    # The rollup's key gains the currency. The new index is built without
+    # blocking the expense writes and then becomes the primary key.
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS expense_daily_totals_currency_key "
+            "ON expense_daily_totals (user_id, category_id, day, currency)"
+        )
+    op.drop_constraint('expense_daily_totals_pkey', 'expense_daily_totals', type_='primary')
+    op.execute(
+        "ALTER TABLE expense_daily_totals ADD CONSTRAINT expense_daily_totals_pkey "
+        "PRIMARY KEY USING INDEX expense_daily_totals_currency_key"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Amounts in different currencies cannot be added up again: the rollup is
+    # rebuilt from the expenses as they are, as in 9c683a3d19c8.
+    op.drop_constraint('expense_daily_totals_pkey', 'expense_daily_totals', type_='primary')
+    op.drop_column('expense_daily_totals', 'currency')
+    op.execute("DELETE FROM expense_daily_totals")
+    op.execute(
+        "INSERT INTO expense_daily_totals (user_id, category_id, day, total, count) "
+        "SELECT user_id, category_id, date, sum(amount), count(*) FROM expenses "
+        "WHERE user_id IS NOT NULL AND category_id IS NOT NULL AND date IS NOT NULL "
+        "GROUP BY user_id, category_id, date"
+    )
+    op.create_primary_key('expense_daily_totals_pkey', 'expense_daily_totals', ['user_id', 'category_id', 'day'])
+    op.drop_column('expenses', 'currency')
+    op.drop_column('users', 'currency')
+    op.drop_table('fx_rates')
@@ -0,0 +1,65 @@
+"""make preset category names unique
+
+Revision ID: b7e3f1c92a4d
+Revises: 5dd08c7f4de5
+Create Date: 2026-10-17 23:52:11.406117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3f1c92a4d'
+down_revision: Union[str, Sequence[str], None] = '5dd08c7f4de5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Workers that started at the same time could each seed the presets, so a
+# name may exist more than once. The duplicates are merged into the oldest
+# row: their expenses and rollup totals move over before they are deleted.
+DUPLICATES = """
+    SELECT id, min(id) OVER (PARTITION BY name) AS keep_id
+    FROM categories WHERE user_id IS NULL
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(f"""
+        WITH duplicates AS ({DUPLICATES}),
+        moved AS (
+            DELETE FROM expense_daily_totals t USING duplicates d
+            WHERE t.category_id = d.id AND d.id <> d.keep_id
+            RETURNING t.user_id, d.keep_id, t.day, t.total, t.count
+        )
+        INSERT INTO expense_daily_totals (user_id, category_id, day, total, count)
+        SELECT user_id, keep_id, day, sum(total), sum(count) FROM moved GROUP BY user_id, keep_id, day
+        ON CONFLICT (user_id, category_id, day) DO UPDATE
+        SET total = expense_daily_totals.total + EXCLUDED.total,
+            count = expense_daily_totals.count + EXCLUDED.count
+    """)
+    op.execute(f"""
+        UPDATE expenses e SET category_id = d.keep_id FROM ({DUPLICATES}) d
+        WHERE e.category_id = d.id AND d.id <> d.keep_id
+    """)
+    op.execute(f"DELETE FROM categories c USING ({DUPLICATES}) d WHERE c.id = d.id AND d.id <> d.keep_id")
+
+    # The presets are a handful of rows, so rebuilding the index in the
+    # transaction only blocks writes to categories for a moment.
+    op.drop_index('ix_categories_preset_name', table_name='categories')
+    op.create_index(
+        'ix_categories_preset_name', 'categories', ['name'],
+        unique=True, postgresql_where=sa.text('user_id IS NULL')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_categories_preset_name', table_name='categories')
+    op.create_index(
+        'ix_categories_preset_name', 'categories', ['name'],
+        unique=False, postgresql_where=sa.text('user_id IS NULL')
+    )
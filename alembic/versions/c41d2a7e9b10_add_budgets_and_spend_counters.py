@@ -0,0 +1,48 @@
+"""add budgets and spend counters
+
+Revision ID: c41d2a7e9b10
+Revises: b7e3f1c92a4d
+Create Date: 2026-10-18 00:05:37.218604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41d2a7e9b10'
+down_revision: Union[str, Sequence[str], None] = 'b7e3f1c92a4d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('budgets',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'category_id', name='uq_budgets_user_id_category_id')
+    )
+    op.create_index('ix_budgets_category_id', 'budgets', ['category_id'], unique=False)
+    op.create_table('budget_spend',
+    sa.Column('budget_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('spent', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['budget_id'], ['budgets.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('budget_id', 'month')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('budget_spend')
+    op.drop_index('ix_budgets_category_id', table_name='budgets')
+    op.drop_table('budgets')
@@ -0,0 +1,50 @@
+"""add expense access path indexes
+
+Revision ID: d19b05e118bd
+Revises: 7f0c2f91f584
+Create Date: 2026-10-17 21:36:50.293539
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd19b05e118bd'
+down_revision: Union[str, Sequence[str], None] = '7f0c2f91f584'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY keeps the tables writable while the indexes build, but it
+    # cannot run inside the migration transaction.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_expenses_user_id_date_id', 'expenses', ['user_id', 'date', 'id'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_expenses_category_id_user_id_date', 'expenses', ['category_id', 'user_id', 'date'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_categories_user_id', 'categories', ['user_id'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_categories_preset_name', 'categories', ['name'],
+            unique=False, postgresql_where=sa.text('user_id IS NULL'), postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_categories_preset_name', table_name='categories', postgresql_concurrently=True)
+        op.drop_index('ix_categories_user_id', table_name='categories', postgresql_concurrently=True)
+        op.drop_index('ix_expenses_category_id_user_id_date', table_name='expenses', postgresql_concurrently=True)
+        op.drop_index('ix_expenses_user_id_date_id', table_name='expenses', postgresql_concurrently=True)
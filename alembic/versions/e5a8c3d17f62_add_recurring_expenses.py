@@ -0,0 +1,77 @@
+"""add recurring expenses
+
+Revision ID: e5a8c3d17f62
+Revises: c41d2a7e9b10
+Create Date: 2026-10-18 00:41:12.508361
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a8c3d17f62'
+down_revision: Union[str, Sequence[str], None] = 'c41d2a7e9b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX = 'uq_expenses_recurrence_id_date'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('recurring_expenses',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('description', sa.String(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('rule', sa.String(length=500), nullable=False),
+    sa.Column('start_date', sa.Date(), nullable=False),
+    sa.Column('next_date', sa.Date(), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_recurring_expenses_category_id', 'recurring_expenses', ['category_id'], unique=False)
+    op.create_index('ix_recurring_expenses_user_id', 'recurring_expenses', ['user_id'], unique=False)
+    op.create_index(
+        'ix_recurring_expenses_next_date', 'recurring_expenses', ['next_date'], unique=False,
+        postgresql_where=sa.text('next_date IS NOT NULL')
+    )
+
+    # A nullable column without a default is only a catalog change. The
+    # foreign key still scans every partition to validate the (NULL) values.
+    op.add_column('expenses', sa.Column('recurrence_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'expenses_recurrence_id_fkey', 'expenses', 'recurring_expenses', ['recurrence_id'], ['id'],
+        ondelete='SET NULL'
+    )
+
+    # Built per partition CONCURRENTLY and attached, as in 5dd08c7f4de5.
+    op.execute(f"CREATE UNIQUE INDEX {INDEX} ON ONLY expenses (recurrence_id, date)")
+    names = op.get_bind().execute(sa.text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'expenses'::regclass"
+    )).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in names:
+            op.execute(
+                f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {partition}_recurrence_id_date "
+                f"ON {partition} (recurrence_id, date)"
+            )
+            op.execute(f"ALTER INDEX {INDEX} ATTACH PARTITION {partition}_recurrence_id_date")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(INDEX, table_name='expenses')
+    op.drop_constraint('expenses_recurrence_id_fkey', 'expenses', type_='foreignkey')
+    op.drop_column('expenses', 'recurrence_id')
+    op.drop_index('ix_recurring_expenses_next_date', table_name='recurring_expenses',
+                  postgresql_where=sa.text('next_date IS NOT NULL'))
+    op.drop_index('ix_recurring_expenses_user_id', table_name='recurring_expenses')
+    op.drop_index('ix_recurring_expenses_category_id', table_name='recurring_expenses')
+    op.drop_table('recurring_expenses')
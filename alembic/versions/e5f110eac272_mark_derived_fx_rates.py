@@ -0,0 +1,36 @@
+"""mark derived fx rates
+
+Revision ID: e5f110eac272
+Revises: 313eb8ca1ff5
+Create Date: 2026-10-18 16:48:37.215904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f110eac272'
+down_revision: Union[str, Sequence[str], None] = '313eb8ca1ff5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('fx_rates', sa.Column('derived', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+    # Rates filled in so far cannot be told apart from quoted ones. A day with
+    # the same rate as the day before it was most likely filled in, so it is
+    # marked derived and the next file loaded can replace it. A quote marked
+    # so by mistake has the value it would be filled in with anyway.
+    op.execute(
+        "UPDATE fx_rates r SET derived = true FROM fx_rates p "
+        "WHERE p.currency = r.currency AND p.day = r.day - 1 AND p.rate = r.rate"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('fx_rates', 'derived')
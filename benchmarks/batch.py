@@ -0,0 +1,116 @@
+"""Syncing offline edits over HTTP: one POST /expenses/batch against the same
+creates and deletes sent one request each (POST /expenses/, DELETE /expenses/{id}).
+
+    python -m benchmarks.batch --sizes 10 50 200 --repeat 20
+
+Runs a uvicorn server (DB_ASYNC=1) against BENCH_DATABASE_URL seeded with
+seed_realistic(). A sync of size N is N/2 creates and N/2 deletes of
+expenses the previous sync created, for one user, from one client, as an app
+would upload its queue. The idempotent replay of a batch is timed too.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+
+import httpx
+
+from .common import BENCH_DATABASE_URL, get_engine, latency_stats, reset_schema, seed_realistic, write_results
+from .load import load_users, start_server, wait_until_ready
+
+
+def creates(category_id: int, count: int) -> list:
+    return [
+        {"description": f"sync {i}", "amount": round(random.uniform(1, 20), 2), "category_id": category_id}
+        for i in range(count)
+    ]
+
+
+async def sync_one_by_one(client: httpx.AsyncClient, headers: dict, category_id: int, size: int, pending: list) -> list:
+    created = []
+    for body in creates(category_id, size - size // 2):
+        response = await client.post("/expenses/", json=body, headers=headers)
+        response.raise_for_status()
+        created.append(response.json()["id"])
+    for expense_id in pending:
+        (await client.delete(f"/expenses/{expense_id}", headers=headers)).raise_for_status()
+    return created
+
+
+async def sync_batch(client: httpx.AsyncClient, headers: dict, category_id: int, size: int, pending: list) -> list:
+    operations = [{"op": "create", **body} for body in creates(category_id, size - size // 2)]
+    operations += [{"op": "delete", "id": expense_id} for expense_id in pending]
+    response = await client.post("/expenses/batch", json={"operations": operations}, headers=headers)
+    response.raise_for_status()
+    return [result["id"] for result in response.json()["results"] if result["op"] == "create"]
+
+
+async def measure_size(base_url: str, user, size: int, repeat: int) -> dict:
+    result = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        for name, sync in (("one_by_one", sync_one_by_one), ("batch", sync_batch)):
+            pending = await sync(client, user.headers, user.category_id, size, [])
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                pending = (await sync(client, user.headers, user.category_id, size, pending[:size // 2]))
+                samples.append((time.perf_counter() - start) * 1000)
+            result[name] = latency_stats(samples)
+
+        # Retrying a batch that was applied
+        operations = [{"op": "create", **body} for body in creates(user.category_id, size)]
+        headers = {**user.headers, "Idempotency-Key": uuid.uuid4().hex}
+        (await client.post("/expenses/batch", json={"operations": operations}, headers=headers)).raise_for_status()
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = await client.post("/expenses/batch", json={"operations": operations}, headers=headers)
+            samples.append((time.perf_counter() - start) * 1000)
+            assert response.headers.get("Idempotent-Replayed") == "true"
+        result["replay"] = latency_stats(samples)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--expenses-per-user", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--random-seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    reset_schema(engine)
+    print(f"Seeding {args.users} users x {args.expenses_per_user} expenses...")
+    seed_realistic(engine, args.users, args.expenses_per_user, random_seed=args.random_seed)
+    users = load_users(engine)
+    engine.dispose()
+    random.seed(args.random_seed)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = {**os.environ, "DATABASE_URL": BENCH_DATABASE_URL, "DB_ASYNC": "1"}
+    server = start_server(args.port, 1, env)
+    results = {}
+    try:
+        wait_until_ready(base_url)
+        for size, user in zip(args.sizes, users):
+            results[size] = asyncio.run(measure_size(base_url, user, size, args.repeat))
+            one_by_one, batch = results[size]["one_by_one"], results[size]["batch"]
+            print(
+                f"{size:>5} operations: one by one p50 {one_by_one['p50_ms']} ms, batch p50 {batch['p50_ms']} ms "
+                f"({one_by_one['p50_ms'] / batch['p50_ms']:.1f}x), replay p50 {results[size]['replay']['p50_ms']} ms"
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+    path = write_results("batch", {"config": vars(args), "results": results})
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Budgets: GET /budgets/status read from the budget_spend counters against
+aggregating the month's expenses, and what keeping the counters costs
+POST /expenses, for one user at several history sizes.
+
+    python -m benchmarks.budgets --sizes 10000 100000 1000000
+
+seed_realistic gives every category of the user a budget. The write cost is measured with
+those budgets and again after they are deleted, when the counter update
+finds nothing to do.
+"""
+import argparse
+import asyncio
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import Response
+
+from home_budget_api import models, schemas
+from home_budget_api.routers import budgets, expenses
+from home_budget_api.routers.auth import TokenUser
+
+from .common import get_async_engine, get_engine, measure_async, reset_schema, seed_realistic, write_results
+
+
+async def aggregated_status(db: AsyncSession, user_id: int, month: date) -> list:
+    """The month's spending per budget summed from `expenses`, as without counters."""
+    return (await db.execute(
+        select(models.Budget.id, models.Budget.amount, func.coalesce(func.sum(models.Expense.amount), 0))
+        .outerjoin(models.Expense, (models.Expense.user_id == models.Budget.user_id)
+                   & (models.Expense.category_id == models.Budget.category_id)
+                   & (models.Expense.date >= month) & (models.Expense.date < month + relativedelta(months=1)))
+        .where(models.Budget.user_id == user_id)
+        .group_by(models.Budget.id)
+    )).all()
+
+
+async def measure_user(repeat: int) -> dict:
+    async_engine = get_async_engine()
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            user = await db.scalar(select(models.User))
+            principal = TokenUser(id=user.id, username=user.username, currency=user.currency)  # type: ignore
+            category_id = await db.scalar(select(models.Category.id).where(models.Category.user_id == user.id))  # type: ignore
+            month = date.today().replace(day=1)
+
+            async def add_expense():
+                await expenses.create_expense(
+                    schemas.ExpenseCreate(description="bench", amount=1.5, category_id=category_id),  # type: ignore
+                    Response(), db=db, current_user=principal
+                )
+
+            result = {
+                "status_counters": await measure_async(
+                    lambda: budgets.get_budget_status(month=None, db=db, current_user=principal), repeat=repeat
+                ),
+                "status_aggregated": await measure_async(
+                    lambda: aggregated_status(db, principal.id, month), repeat=repeat
+                ),
+                "create_expense_with_budgets": await measure_async(add_expense, repeat=repeat)
+            }
+            await db.execute(text("DELETE FROM budgets"))
+            await db.commit()
+            result["create_expense_without_budgets"] = await measure_async(add_expense, repeat=repeat)
+            return result
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    results = {}
+    for size in args.sizes:
+        reset_schema(engine)
+        print(f"Seeding one user with {size} expenses...")
+        seed_realistic(engine, users=1, expenses_per_user=size)
+
+        results[size] = asyncio.run(measure_user(args.repeat))
+        print(
+            f"{size:>10} expenses: status p50 {results[size]['status_counters']['p50_ms']} ms from counters, "
+            f"{results[size]['status_aggregated']['p50_ms']} ms aggregated; POST /expenses p50 "
+            f"{results[size]['create_expense_with_budgets']['p50_ms']} ms with budgets, "
+            f"{results[size]['create_expense_without_budgets']['p50_ms']} ms without"
+        )
+
+    path = write_results("budgets", {"config": vars(args), "results": results})
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""DELETE /categories/{id} latency against the number of expenses in the
+category: the original ORM implementation (load every expense, refund in
+Python, delete row by row) against the current set-based one.
+
+    python -m benchmarks.category_delete --sizes 1000 10000 100000 --repeat 5
+
+Every run deletes a freshly loaded category, so only the delete is timed.
+The database still has to remove every row; what the rewrite makes flat is
+the work in the API process, so the Python memory peak of the first run of
+each variant (traced with tracemalloc, not timed) is reported as well.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from decimal import Decimal
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from home_budget_api import models, rollups
+from home_budget_api.routers import categories
+
+from .common import SEED_START_DATE, get_async_engine, get_engine, latency_stats, reset_schema, write_results
+
+
+def add_category(engine, user_id: int, size: int) -> int:
+    with engine.begin() as conn:
+        category_id = conn.execute(text(
+            "INSERT INTO categories (name, user_id) VALUES ('bench', :user_id) RETURNING id"
+        ), {"user_id": user_id}).scalar_one()
+        conn.execute(text(
+            "INSERT INTO expenses (description, amount, date, category_id, user_id) "
+            "SELECT 'expense ' || g, round((random() * 200 + 1)::numeric, 2), :start + g % 1800, :category_id, :user_id "
+            "FROM generate_series(1, :size) g"
+        ), {"start": SEED_START_DATE, "category_id": category_id, "user_id": user_id, "size": size})
+    with Session(engine) as db:
+        rollups.rebuild(db, user_id)
+        db.commit()
+    return category_id
+
+
+def legacy_delete(db: Session, user: models.User, category_id: int) -> None:
+    """The delete as it was before the set-based rewrite, for comparison."""
+    category = db.get(models.Category, category_id)
+    expenses = db.scalars(select(models.Expense).where(models.Expense.category_id == category_id)).all()
+
+    current_balance = Decimal(str(user.initial_balance))
+    for expense in expenses:
+        if expense.user_id == user.id:
+            current_balance += Decimal(str(expense.amount))
+    user.initial_balance = current_balance  # type: ignore
+
+    # What cascade="all, delete-orphan" did: one DELETE per loaded expense.
+    for expense in expenses:
+        db.delete(expense)
+    db.delete(category)
+    db.commit()
+
+
+def run_legacy(engine, user_id: int, size: int) -> float:
+    category_id = add_category(engine, user_id, size)
+    with Session(engine) as db:
+        user = db.get(models.User, user_id)
+        start = time.perf_counter()
+        legacy_delete(db, user, category_id)  # type: ignore
+        return (time.perf_counter() - start) * 1000
+
+
+async def run_current(engine, async_engine, user_id: int, size: int) -> float:
+    category_id = add_category(engine, user_id, size)
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        user = await db.get(models.User, user_id)
+        start = time.perf_counter()
+        await categories.delete_category(category_id, db=db, current_user=user)  # type: ignore
+        return (time.perf_counter() - start) * 1000
+
+
+def peak_memory_kib(fn) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    reset_schema(engine)
+    with engine.begin() as conn:
+        user_id = conn.execute(text(
+            "INSERT INTO users (username, password_hash, initial_balance) VALUES ('bench', 'x', 0) RETURNING id"
+        )).scalar_one()
+
+    async_engine = get_async_engine()
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for size in args.sizes:
+            variants = {
+                "legacy": lambda: run_legacy(engine, user_id, size),
+                "current": lambda: loop.run_until_complete(run_current(engine, async_engine, user_id, size))
+            }
+            results[size] = {}
+            for name, run in variants.items():
+                peak = peak_memory_kib(run)
+                samples = [run() for _ in range(args.repeat)]
+                results[size][name] = {**latency_stats(samples), "peak_memory_kib": peak}
+
+            legacy, current = results[size]["legacy"], results[size]["current"]
+            print(
+                f"{size:>10} expenses: legacy p50 {legacy['p50_ms']} ms / {legacy['peak_memory_kib']} KiB, "
+                f"current p50 {current['p50_ms']} ms / {current['peak_memory_kib']} KiB"
+            )
+    finally:
+        loop.run_until_complete(async_engine.dispose())
+        loop.close()
+        engine.dispose()
+
+    path = write_results("category_delete", results)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compare two result files of the same benchmark, e.g. before and after a change.
+
+    python -m benchmarks.compare benchmarks/results/load-A.json benchmarks/results/load-B.json
+    python -m benchmarks.compare OLD NEW --fail-over 10   # exit 1 on a regression over 10%
+
+Every latency (*_ms, *_s) and throughput (*_rps, *_per_s) value both files have
+at the same place is listed with its change; changes for the worse beyond
+--threshold percent are marked. The config of both runs is printed first,
+since results are only comparable for the same arguments.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+LOWER_IS_BETTER = ("_ms", "_s")
+HIGHER_IS_BETTER = ("_rps", "_per_s")
+SKIPPED = {"meta", "config", "runs", "plans"}
+
+
+def metrics(node, path: str = "") -> dict:
+    """Numeric latency and throughput leaves, keyed by their dotted path."""
+    found = {}
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in SKIPPED:
+                continue
+            child = f"{path}.{key}" if path else str(key)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                if key.endswith(LOWER_IS_BETTER + HIGHER_IS_BETTER):
+                    found[child] = value
+            else:
+                found.update(metrics(value, child))
+    return found
+
+
+def change(key: str, old: float, new: float) -> float:
+    """Percent change, positive when `new` is worse."""
+    if old == 0:
+        return 0.0
+    percent = (new - old) / old * 100
+    return -percent if key.endswith(HIGHER_IS_BETTER) else percent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=5, help="Percent worse that is marked as a regression")
+    parser.add_argument("--fail-over", type=float, help="Exit 1 if anything got this many percent worse")
+    args = parser.parse_args()
+
+    old, new = (json.loads(path.read_text()) for path in (args.old, args.new))
+    for label, run in (("old", old), ("new", new)):
+        meta = run.get("meta", {})
+        print(f"{label}: {meta.get('created_at')} commit {meta.get('git_commit')} config {run.get('config')}")
+
+    old_metrics, new_metrics = metrics(old), metrics(new)
+    print(f"{'':<60} {'old':>12}    {'new':>12}  worse by")
+    worst = 0.0
+    for key in sorted(old_metrics.keys() & new_metrics.keys()):
+        worse = change(key, old_metrics[key], new_metrics[key])
+        worst = max(worst, worse)
+        mark = "  REGRESSION" if worse > args.threshold else ""
+        print(f"{key:<60} {old_metrics[key]:>12} -> {new_metrics[key]:>12}  {worse:+7.1f}%{mark}")
+
+    if args.fail_over is not None and worst > args.fail_over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
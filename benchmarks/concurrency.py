@@ -0,0 +1,182 @@
+"""Concurrency stress test for balance updates: many parallel writes against a
+single account, then a check that no change was lost or applied twice.
+
+    python -m benchmarks.concurrency --modes sync async --requests 2000 --concurrency 64
+
+The writes are a random mix of expense creates, deletes (an expense is
+deleted by two requests at once right after it is created), balance top-ups
+and withdrawals, category deletes and small bulk imports. Afterwards the final
+balance must equal
+
+    starting balance + accepted balance changes - amounts of remaining expenses
+
+it must never be negative, and the daily rollup must match the expenses.
+tests/test_balance_concurrency.py checks the same invariants on every test
+run; this script is for measuring throughput at volume.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+from decimal import Decimal
+from typing import Optional
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+
+from home_budget_api import rollups  # noqa: E402
+from home_budget_api.routers.auth import create_access_token  # noqa: E402
+
+from .common import BENCH_DATABASE_URL, get_engine, reset_schema, write_results  # noqa: E402
+from .load import start_server, wait_until_ready  # noqa: E402
+
+STARTING_BALANCE = Decimal("1000.00")
+
+
+def setup_account(engine, categories: int) -> tuple[int, list]:
+    reset_schema(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO categories (name) VALUES ('food'), ('car'), ('recreation')"))
+        user_id = conn.execute(text(
+            "INSERT INTO users (username, password_hash, initial_balance) "
+            "VALUES ('stress', 'x', :balance) RETURNING id"
+        ), {"balance": STARTING_BALANCE}).scalar_one()
+        category_ids = conn.execute(text(
+            "INSERT INTO categories (name, user_id) "
+            "SELECT 'category_' || k, :user_id FROM generate_series(1, :count) k RETURNING id"
+        ), {"user_id": user_id, "count": categories}).scalars().all()
+    return user_id, category_ids
+
+
+async def hammer(base_url: str, token: str, category_ids: list, requests: int, concurrency: int) -> dict:
+    headers = {"Authorization": f"Bearer {token}"}
+    statuses: Counter = Counter()
+    accepted_changes = Decimal("0")
+    live_categories = list(category_ids)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(name: str, method: str, path: str, **kwargs) -> httpx.Response:
+        async with semaphore:
+            response = await client.request(method, path, headers=headers, **kwargs)
+        statuses[(name, response.status_code)] += 1
+        return response
+
+    async def create() -> Optional[int]:
+        response = await call("create", "POST", "/expenses/", json={
+            "description": "stress",
+            "amount": random.choice([1, 2.5, 7, 13.25]),
+            "category_id": random.choice(live_categories or category_ids)
+        })
+        return response.json()["id"] if response.status_code == 200 else None
+
+    async def create_and_delete_twice():
+        expense_id = await create()
+        if expense_id is not None:
+            await asyncio.gather(*(call("delete", "DELETE", f"/expenses/{expense_id}") for _ in range(2)))
+
+    async def change_balance():
+        nonlocal accepted_changes
+        amount = random.choice([-20, -5, 5, 20])
+        response = await call("balance", "PATCH", "/auth/me/balance", json={"amount": amount})
+        if response.status_code == 200:
+            accepted_changes += Decimal(amount)
+
+    async def delete_category():
+        if len(live_categories) <= 1:
+            return
+        category_id = live_categories.pop(random.randrange(len(live_categories)))
+        await asyncio.gather(*(call("delete_category", "DELETE", f"/categories/{category_id}") for _ in range(2)))
+
+    async def bulk_import():
+        category_id = random.choice(live_categories or category_ids)
+        rows = "".join(f'{{"description": "bulk", "amount": 1.5, "category_id": {category_id}}}\n' for _ in range(20))
+        await call("bulk", "POST", "/expenses/bulk?format=ndjson", files={"file": ("rows.ndjson", rows)})
+
+    actions = [create] * 50 + [create_and_delete_twice] * 20 + [change_balance] * 25 + [bulk_import] * 4 + [delete_category]
+    # Retire idle connections before uvicorn's 5s keep-alive timeout does: a
+    # write sent on a connection the server is closing cannot be safely retried.
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency, keepalive_expiry=2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(random.choice(actions)() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "accepted_changes": accepted_changes,
+        "statuses": {f"{name} {status}": count for (name, status), count in sorted(statuses.items())}
+    }
+
+
+def check(engine, user_id: int, accepted_changes: Decimal) -> dict:
+    with engine.connect() as conn:
+        balance = conn.execute(
+            text("SELECT initial_balance FROM users WHERE id = :id"), {"id": user_id}
+        ).scalar_one()
+        spent = conn.execute(
+            text("SELECT coalesce(sum(amount), 0) FROM expenses WHERE user_id = :id"), {"id": user_id}
+        ).scalar_one()
+    with Session(engine) as db:
+        drift = rollups.verify(db, user_id)
+
+    expected = STARTING_BALANCE + accepted_changes - spent
+    return {
+        "balance": balance,
+        "expected_balance": expected,
+        "remaining_expenses_total": spent,
+        "rollup_drift_rows": len(drift),
+        "ok": balance == expected and balance >= 0 and not drift
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    for mode in args.modes:
+        engine = get_engine()
+        user_id, category_ids = setup_account(engine, args.categories)
+        token = create_access_token({"sub": str(user_id), "username": "stress"})
+
+        env = {**os.environ, "DATABASE_URL": BENCH_DATABASE_URL, "DB_ASYNC": "1" if mode == "async" else "0"}
+        server = start_server(args.port, args.workers, env)
+        try:
+            wait_until_ready(base_url)
+            print(f"[{mode}] {args.requests} writes, {args.concurrency} in flight...")
+            run = asyncio.run(hammer(base_url, token, category_ids, args.requests, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+
+        results[mode] = {**run, **check(engine, user_id, run["accepted_changes"])}
+        engine.dispose()
+        result = results[mode]
+        print(
+            f"[{mode}] {'OK' if result['ok'] else 'FAILED'}: balance {result['balance']}, "
+            f"expected {result['expected_balance']}, rollup drift rows {result['rollup_drift_rows']}, "
+            f"{result['elapsed_seconds']}s"
+        )
+        print(f"[{mode}] {result['statuses']}")
+
+    path = write_results("concurrency", {"config": vars(args), "results": results})
+    print(f"Results written to {path}")
+    if not all(result["ok"] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Currency conversion, which happens once per expense when it is written:
+an expense in another currency than the user's stores the amount its balance
+was debited (`converted_amount`), and the rollup adds those up in its
+`converted` column. GET /expenses/summary and /expenses/timeseries read that
+column and never touch fx_rates, so what a share of foreign expenses costs
+them is the extra rollup rows (one per currency, category and day). They are
+timed for one user at several history sizes with every expense in the
+user's currency, and again after a share of them is moved to another
+currency with the converted amounts a write would have stored. POST
+/expenses/ is timed in the user's currency, in another one with its rates in
+the worker's cache, and in another one with that cache emptied before each
+call (one fx_rates query).
+
+    python -m benchmarks.fx --sizes 10000 100000 1000000 --foreign 0.2
+
+Rates are seeded for every day of the history. The summary cache is cleared
+before each call, so every call runs the query.
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.responses import Response
+
+from home_budget_api import budgets, cache, fx, models, rollups, schemas
+from home_budget_api.routers import expenses
+from home_budget_api.routers.auth import TokenUser
+
+from .common import get_async_engine, get_engine, measure_async, reset_schema, seed_realistic, write_results
+
+FOREIGN = "USD"
+
+
+def seed_rates(engine) -> None:
+    """A FOREIGN rate for every day of the history and the month after it."""
+    with engine.begin() as conn:
+        conn.execute(text("SELECT setseed(0.5)"))
+        conn.execute(text(
+            "INSERT INTO fx_rates (currency, day, rate) "
+            "SELECT c.currency, d::date, CASE c.currency WHEN 'EUR' THEN 1 ELSE round((1 + random() * 0.2)::numeric, 6) END "
+            "FROM generate_series((SELECT min(date) FROM expenses), current_date + 30, interval '1 day') d "
+            "CROSS JOIN (VALUES ('EUR'), (:foreign)) c(currency)"
+        ), {"foreign": FOREIGN})
+
+
+def move_expenses(engine, foreign: float) -> None:
+    """Move a `foreign` share of the expenses to FOREIGN with the converted
+    amounts the write path would have stored, and rebuild the rollup and the
+    budget counters from them."""
+    with engine.begin() as conn:
+        conn.execute(text("SELECT setseed(0.5)"))
+        conn.execute(text(
+            "UPDATE expenses e SET currency = :foreign, converted_amount = round(e.amount * target.rate / source.rate, 2) "
+            "FROM fx_rates source, fx_rates target "
+            "WHERE random() < :share AND source.currency = :foreign AND source.day = e.date "
+            "AND target.currency = e.currency AND target.day = e.date"
+        ), {"foreign": FOREIGN, "share": foreign})
+    with Session(engine) as db:
+        rollups.rebuild(db)
+        budgets.rebuild(db)
+        db.commit()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE"))
+
+
+async def measure_user(repeat: int) -> dict:
+    async_engine = get_async_engine()
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            user = await db.scalar(select(models.User))
+            principal = TokenUser(id=user.id, username=user.username, currency=user.currency)  # type: ignore
+            category_id = await db.scalar(select(models.Category.id).where(models.Category.user_id == user.id))  # type: ignore
+
+            async def summary():
+                await cache.invalidate(cache.summary_key(principal.id))
+                await expenses.get_budget_summary(db=db, current_user=principal)
+
+            async def timeseries():
+                await expenses.get_timeseries(
+                    bucket="day", start_date=None, end_date=None, category_id=None, by_category=True,
+                    db=db, current_user=principal
+                )
+
+            def add_expense(currency: str, cached_rates: bool = True):
+                async def create():
+                    if not cached_rates:
+                        fx._cache.clear()
+                    await expenses.create_expense(
+                        schemas.ExpenseCreate(description="bench", amount=12.5, currency=currency, category_id=category_id),  # type: ignore
+                        Response(), db=db, current_user=principal
+                    )
+
+                return create
+
+            rollup_rows = await db.scalar(
+                select(func.count()).select_from(models.ExpenseDailyTotal).where(models.ExpenseDailyTotal.user_id == user.id)
+            )
+            return {
+                "rollup_rows": rollup_rows,
+                "summary": await measure_async(summary, repeat=repeat),
+                "timeseries": await measure_async(timeseries, repeat=repeat),
+                "create_native": await measure_async(add_expense(principal.currency), repeat=repeat),
+                "create_foreign": await measure_async(add_expense(FOREIGN), repeat=repeat),
+                "create_foreign_uncached": await measure_async(add_expense(FOREIGN, cached_rates=False), repeat=repeat)
+            }
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--foreign", type=float, default=0.2, help="Share of the expenses in another currency")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    results = {}
+    for size in args.sizes:
+        reset_schema(engine)
+        print(f"Seeding one user with {size} expenses...")
+        seed_realistic(engine, users=1, expenses_per_user=size)
+        seed_rates(engine)
+        native = asyncio.run(measure_user(args.repeat))
+        move_expenses(engine, args.foreign)
+        converted = asyncio.run(measure_user(args.repeat))
+        results[size] = {"native": native, "converted": converted}
+        print(
+            f"{size:>10} expenses: summary p50 {native['summary']['p50_ms']} ms native, "
+            f"{converted['summary']['p50_ms']} ms with {args.foreign:.0%} foreign "
+            f"({native['rollup_rows']} -> {converted['rollup_rows']} rollup rows); timeseries p50 "
+            f"{native['timeseries']['p50_ms']} ms, {converted['timeseries']['p50_ms']} ms; POST /expenses p50 "
+            f"{converted['create_native']['p50_ms']} ms native, {converted['create_foreign']['p50_ms']} ms foreign, "
+            f"{converted['create_foreign_uncached']['p50_ms']} ms foreign without cached rates"
+        )
+
+    path = write_results("fx", {"config": vars(args), "results": results})
+    print(f"Results written to {path}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""EXPLAIN plans and latencies for the expense access paths, without and with
+the composite indexes from revision d19b05e118bd.
+
+    python -m benchmarks.indexes --users 1000 --expenses-per-user 2000
+"""
+import argparse
+
+from sqlalchemy import text
+
+from home_budget_api import models
+
+from .common import SEED_START_DATE, explain, get_engine, measure, reset_schema, seed, write_results
+
+ACCESS_PATH_INDEX_NAMES = {
+    "ix_expenses_user_id_date_id",
+    "ix_expenses_category_id_user_id_date",
+    "ix_categories_user_id",
+    "ix_categories_preset_name",
+}
+ACCESS_PATH_INDEXES = [
+    index
+    for table in (models.Expense.__table__, models.Category.__table__)
+    for index in table.indexes
+    if index.name in ACCESS_PATH_INDEX_NAMES
+]
+
+EXPENSE_COLUMNS = "id, description, amount, date, category_id"
+
+QUERIES = {
+    "list_page": (
+        f"SELECT {EXPENSE_COLUMNS} FROM expenses WHERE user_id = :user_id "
+        "ORDER BY date DESC, id DESC LIMIT 101"
+    ),
+    "list_by_category": (
+        f"SELECT {EXPENSE_COLUMNS} FROM expenses WHERE user_id = :user_id AND category_id = :category_id "
+        "ORDER BY date DESC, id DESC LIMIT 101"
+    ),
+    "list_date_range": (
+        f"SELECT {EXPENSE_COLUMNS} FROM expenses WHERE user_id = :user_id "
+        "AND date >= :since AND date <= :until ORDER BY date DESC, id DESC LIMIT 101"
+    ),
+    "summary_total": "SELECT coalesce(sum(amount), 0) FROM expenses WHERE user_id = :user_id",
+    "summary_since": (
+        "SELECT coalesce(sum(amount), 0) FROM expenses WHERE user_id = :user_id AND date >= :since"
+    ),
+    "summary_by_category": (
+        "SELECT c.name, sum(e.amount) FROM categories c JOIN expenses e ON c.id = e.category_id "
+        "WHERE e.user_id = :user_id GROUP BY c.name"
+    ),
+    "user_categories": "SELECT id, name FROM categories WHERE user_id = :user_id OR user_id IS NULL",
+    "preset_lookup": "SELECT id FROM categories WHERE name = 'food' AND user_id IS NULL",
+}
+
+
+def run_queries(engine, params: dict, repeat: int) -> dict:
+    results = {}
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            results[name] = {
+                "latency": measure(lambda: conn.execute(text(sql), params).fetchall(), repeat=repeat),
+                "plan": explain(conn, sql, params)
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--expenses-per-user", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    reset_schema(engine)
+    print(f"Seeding {args.users} users x {args.expenses_per_user} expenses...")
+    seed(engine, args.users, args.expenses_per_user)
+
+    with engine.connect() as conn:
+        user_id = conn.execute(text("SELECT id FROM users ORDER BY id OFFSET :n LIMIT 1"), {"n": args.users // 2}).scalar()
+        category_id = conn.execute(text("SELECT min(id) FROM categories WHERE user_id = :u"), {"u": user_id}).scalar()
+    params = {
+        "user_id": user_id,
+        "category_id": category_id,
+        "since": SEED_START_DATE.replace(year=SEED_START_DATE.year + 3),
+        "until": SEED_START_DATE.replace(year=SEED_START_DATE.year + 3, month=3),
+    }
+
+    with engine.begin() as conn:
+        for index in ACCESS_PATH_INDEXES:
+            index.drop(conn)
+        conn.execute(text("ANALYZE"))
+    before = run_queries(engine, params, args.repeat)
+
+    with engine.begin() as conn:
+        for index in ACCESS_PATH_INDEXES:
+            index.create(conn)
+        conn.execute(text("ANALYZE"))
+    after = run_queries(engine, params, args.repeat)
+
+    print(f"{'query':<22}{'before p50 ms':>16}{'after p50 ms':>16}")
+    for name in QUERIES:
+        print(f"{name:<22}{before[name]['latency']['p50_ms']:>16}{after[name]['latency']['p50_ms']:>16}")
+
+    path = write_results("indexes", {
+        "users": args.users,
+        "expenses_per_user": args.expenses_per_user,
+        "params": params,
+        "before": before,
+        "after": after
+    })
+    print(f"Results written to {path}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
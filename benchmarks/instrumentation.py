@@ -0,0 +1,92 @@
+"""Cost of the request instrumentation (PERF_METRICS, PERF_SERVER_TIMING)
+under the load.py scenario mix, and the SQL statements per request it reports.
+
+    python -m benchmarks.instrumentation --concurrency 50 --duration 20
+
+Runs the same load against a fresh uvicorn server three times: off (the
+default), metrics (PERF_METRICS=1) and server_timing (both). After the
+metrics run, the statements per request and database time per request of each
+route are read back from GET /metrics.
+"""
+import argparse
+import asyncio
+import os
+import re
+
+import httpx
+
+from .common import BENCH_DATABASE_URL, get_engine, reset_schema, seed_realistic, write_results
+from .load import load_users, run_load, start_server, summarize, wait_until_ready
+
+VARIANTS = {
+    "off": {"PERF_METRICS": "0", "PERF_SERVER_TIMING": "0"},
+    "metrics": {"PERF_METRICS": "1", "PERF_SERVER_TIMING": "0"},
+    "server_timing": {"PERF_METRICS": "1", "PERF_SERVER_TIMING": "1"}
+}
+SAMPLE = re.compile(r'^(\w+)\{method="(\w+)",route="([^"]*)"\} (\S+)$')
+
+
+def per_route(exposition: str) -> dict:
+    """Statements and database milliseconds per request, by route."""
+    values: dict = {}
+    for line in exposition.splitlines():
+        match = SAMPLE.match(line)
+        if match:
+            name, method, route, value = match.groups()
+            values.setdefault(f"{method} {route}", {})[name] = float(value)
+    return {
+        route: {
+            "requests": int(v["db_statements_per_request_count"]),
+            "statements_per_request": round(v["db_statements_per_request_sum"] / v["db_statements_per_request_count"], 2),
+            "db_ms_per_request": round(v["db_statement_duration_seconds_total"] * 1000 / v["db_statements_per_request_count"], 3)
+        }
+        for route, v in sorted(values.items()) if v.get("db_statements_per_request_count")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--expenses-per-user", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    reset_schema(engine)
+    print(f"Seeding {args.users} users x {args.expenses_per_user} expenses...")
+    seed_realistic(engine, args.users, args.expenses_per_user)
+    users = load_users(engine)
+    engine.dispose()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results, routes = {}, {}
+    for variant in args.variants:
+        env = {**os.environ, "DATABASE_URL": BENCH_DATABASE_URL, **VARIANTS[variant]}
+        server = start_server(args.port, 1, env)
+        try:
+            wait_until_ready(base_url)
+            run = asyncio.run(run_load(base_url, users, args.concurrency, args.duration))
+            if variant == "metrics":
+                routes = per_route(httpx.get(f"{base_url}/metrics").text)
+        finally:
+            server.terminate()
+            server.wait()
+
+        results[variant] = summarize(run["samples"], run["errors"], args.duration)
+        overall = results[variant]["overall"]
+        print(
+            f"[{variant}] {results[variant]['throughput_rps']} req/s, "
+            f"p50 {overall.get('p50_ms')} ms, p95 {overall.get('p95_ms')} ms"
+        )
+
+    for route, stats in routes.items():
+        print(f"{route:<28} {stats['statements_per_request']:>5} statements, {stats['db_ms_per_request']:>8} ms in the database")
+    path = write_results("instrumentation", {"config": vars(args), "results": results, "routes": routes})
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
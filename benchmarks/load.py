@@ -0,0 +1,312 @@
+"""Load test the HTTP API with concurrent httpx clients, once per database stack:
+sync (DB_ASYNC=0, psycopg2 on the threadpool) and async (DB_ASYNC=1, asyncpg).
+
+    python -m benchmarks.load --modes sync async --concurrency 100 --duration 20
+    python -m benchmarks.postgres -- python -m benchmarks.load --users 10000 --expenses-per-user 500
+
+Each mode runs a fresh uvicorn server against BENCH_DATABASE_URL, seeded once
+with seed_realistic() (skewed users, log-normal amounts, searchable
+descriptions). The clients drive a weighted mix of every endpoint except
+register and login, whose bcrypt cost login.py measures on its own; --scenarios
+picks a subset. Latency percentiles, throughput and errors are reported per
+endpoint and overall, after an unmeasured warmup. The data and the request mix
+follow --random-seed, so two runs differ only in what changed in between;
+benchmarks/compare.py diffs their results.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Optional
+
+import httpx
+from sqlalchemy import text
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+
+from home_budget_api.routers.auth import create_access_token  # noqa: E402
+
+from .common import (  # noqa: E402
+    BENCH_DATABASE_URL, KINDS, MERCHANTS, get_engine, latency_stats, reset_schema, seed_realistic, write_results
+)
+
+
+class LoadUser:
+    """A seeded user's token, plus the rows its own requests created, which
+    the delete scenarios use up."""
+
+    def __init__(self, user_id: int, category_id: int):
+        self.headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+        self.category_id = category_id
+        self.expense_ids: list = []
+        self.category_ids: list = []
+
+
+def load_users(engine) -> list:
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT u.id, min(c.id) FROM users u JOIN categories c ON c.user_id = u.id GROUP BY u.id ORDER BY u.id"
+        )).all()
+    return [LoadUser(user_id, category_id) for user_id, category_id in rows]
+
+
+def days_ago(days: int) -> str:
+    return (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+
+
+# Each scenario sends one request; None means the user had nothing to do it on.
+async def list_expenses(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    return await client.get("/expenses/", params={"limit": 50}, headers=user.headers)
+
+
+async def list_filtered(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    params = {"limit": 50, "start_date": days_ago(90), "min_amount": 20}
+    return await client.get("/expenses/", params=params, headers=user.headers)
+
+
+async def search(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    return await client.get("/expenses/", params={"q": random.choice(MERCHANTS), "limit": 50}, headers=user.headers)
+
+
+async def summary(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    return await client.get("/expenses/summary", headers=user.headers)
+
+
+async def budget_status(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    return await client.get("/budgets/status", headers=user.headers)
+
+
+async def timeseries(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    return await client.get("/expenses/timeseries", params={"bucket": "month"}, headers=user.headers)
+
+
+async def export(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    return await client.get("/expenses/export", params={"format": "ndjson", "start_date": days_ago(30)}, headers=user.headers)
+
+
+async def list_categories(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    return await client.get("/categories/", headers=user.headers)
+
+
+async def userinfo(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    return await client.get("/auth/userinfo", headers=user.headers)
+
+
+async def create_expense(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    body = {
+        "description": f"{random.choice(KINDS)} at {random.choice(MERCHANTS)} card",
+        "amount": round(random.uniform(1, 100), 2),
+        "category_id": user.category_id
+    }
+    response = await client.post("/expenses/", json=body, headers=user.headers)
+    if response.status_code == 200:
+        user.expense_ids.append(response.json()["id"])
+    return response
+
+
+async def delete_expense(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    if not user.expense_ids:
+        return None
+    return await client.delete(f"/expenses/{user.expense_ids.pop()}", headers=user.headers)
+
+
+async def bulk_import(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    rows = "".join(
+        f"{random.choice(KINDS)} at {random.choice(MERCHANTS)} cash,{round(random.uniform(1, 100), 2)},{user.category_id}\n"
+        for _ in range(20)
+    )
+    files = {"file": ("expenses.csv", "description,amount,category_id\n" + rows, "text/csv")}
+    return await client.post("/expenses/bulk", files=files, headers=user.headers)
+
+
+async def batch_sync(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    """An offline sync: five new expenses and up to five deletes in one batch."""
+    deletes = [{"op": "delete", "id": user.expense_ids.pop()} for _ in range(min(5, len(user.expense_ids)))]
+    creates = [{
+        "op": "create",
+        "description": f"{random.choice(KINDS)} at {random.choice(MERCHANTS)} card",
+        "amount": round(random.uniform(1, 100), 2),
+        "category_id": user.category_id
+    } for _ in range(5)]
+    headers = {**user.headers, "Idempotency-Key": uuid.uuid4().hex}
+    response = await client.post("/expenses/batch", json={"operations": creates + deletes}, headers=headers)
+    if response.status_code == 200:
+        user.expense_ids += [result["id"] for result in response.json()["results"] if result["op"] == "create"]
+    return response
+
+
+async def create_category(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    response = await client.post("/categories/", json={"name": f"load_{uuid.uuid4().hex[:8]}"}, headers=user.headers)
+    if response.status_code == 200:
+        user.category_ids.append(response.json()["id"])
+    return response
+
+
+async def delete_category(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    if not user.category_ids:
+        return None
+    return await client.delete(f"/categories/{user.category_ids.pop()}", headers=user.headers)
+
+
+async def update_balance(client: httpx.AsyncClient, user: LoadUser) -> Optional[httpx.Response]:
+    return await client.patch("/auth/me/balance", json={"amount": 10}, headers=user.headers)
+
+
+# (weight, name, scenario)
+SCENARIOS = [
+    (20, "list_expenses", list_expenses),
+    (5, "list_filtered", list_filtered),
+    (5, "search", search),
+    (15, "summary", summary),
+    (4, "timeseries", timeseries),
+    (4, "budget_status", budget_status),
+    (1, "export", export),
+    (10, "list_categories", list_categories),
+    (10, "userinfo", userinfo),
+    (15, "create_expense", create_expense),
+    (6, "delete_expense", delete_expense),
+    (2, "bulk_import", bulk_import),
+    (2, "batch_sync", batch_sync),
+    (2, "create_category", create_category),
+    (2, "delete_category", delete_category),
+    (3, "update_balance", update_balance),
+]
+
+
+def start_server(port: int, workers: int, env: dict) -> subprocess.Popen:
+    # Every client connects from 127.0.0.1, so rate limits are off unless the
+    # benchmark turns them on (ratelimit.py).
+    env = {"RATE_LIMIT_BACKEND": "none", **env}
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "home_budget_api.main:app",
+            "--port", str(port), "--workers", str(workers), "--log-level", "warning"
+        ],
+        env=env
+    )
+
+
+def wait_until_ready(base_url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/docs").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+async def run_load(base_url: str, users: list, concurrency: int, duration: float, scenarios: list = SCENARIOS) -> dict:
+    """Drive the weighted scenario mix until the deadline; returns samples per scenario."""
+    weights = [weight for weight, *_ in scenarios]
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    deadline = time.monotonic() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        while time.monotonic() < deadline:
+            user = random.choice(users)
+            _, name, scenario = random.choices(scenarios, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, user)
+                if response is None:
+                    continue
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                samples[name].append((time.perf_counter() - start) * 1000)
+            else:
+                errors[name] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+
+    return {"samples": samples, "errors": errors}
+
+
+def summarize(samples: dict, errors: dict, duration: float, scenarios: list = SCENARIOS) -> dict:
+    total = sum(len(values) for values in samples.values())
+    return {
+        "throughput_rps": round(total / duration, 1),
+        "errors": sum(errors.values()),
+        "overall": latency_stats([value for values in samples.values() for value in values]),
+        "endpoints": {
+            name: {
+                **latency_stats(samples.get(name, [])),
+                "throughput_rps": round(len(samples.get(name, [])) / duration, 1),
+                "errors": errors.get(name, 0)
+            }
+            for _, name, *_ in scenarios
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--expenses-per-user", type=int, default=1000, help="Mean; see --skew")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of expenses per user (0: all equal)")
+    parser.add_argument("--days", type=int, default=2 * 365, help="Days of expense history up to today")
+    parser.add_argument("--scenarios", nargs="+", choices=[name for _, name, _ in SCENARIOS])
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of load before measuring")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--random-seed", type=int, default=0)
+    args = parser.parse_args()
+    scenarios = [scenario for scenario in SCENARIOS if args.scenarios is None or scenario[1] in args.scenarios]
+
+    engine = get_engine()
+    reset_schema(engine)
+    print(f"Seeding {args.users} users x {args.expenses_per_user} expenses (skew {args.skew})...")
+    seed_realistic(engine, args.users, args.expenses_per_user, days=args.days, skew=args.skew, random_seed=args.random_seed)
+    users = load_users(engine)
+    engine.dispose()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    for mode in args.modes:
+        env = {**os.environ, "DATABASE_URL": BENCH_DATABASE_URL, "DB_ASYNC": "1" if mode == "async" else "0"}
+        server = start_server(args.port, args.workers, env)
+        try:
+            wait_until_ready(base_url)
+            random.seed(args.random_seed)
+            if args.warmup > 0:
+                asyncio.run(run_load(base_url, users, args.concurrency, args.warmup, scenarios))
+            print(f"[{mode}] {args.concurrency} clients for {args.duration}s...")
+            run = asyncio.run(run_load(base_url, users, args.concurrency, args.duration, scenarios))
+        finally:
+            server.terminate()
+            server.wait()
+
+        results[mode] = summarize(run["samples"], run["errors"], args.duration, scenarios)
+        overall = results[mode]["overall"]
+        print(
+            f"[{mode}] {results[mode]['throughput_rps']} req/s, {results[mode]['errors']} errors, "
+            f"p50 {overall.get('p50_ms')} ms, p95 {overall.get('p95_ms')} ms, p99 {overall.get('p99_ms')} ms"
+        )
+        for name, endpoint in results[mode]["endpoints"].items():
+            print(
+                f"  {name:<16} {endpoint['throughput_rps']:>7} req/s  p50 {endpoint.get('p50_ms')} ms  "
+                f"p95 {endpoint.get('p95_ms')} ms  p99 {endpoint.get('p99_ms')} ms  {endpoint['errors']} errors"
+            )
+
+    path = write_results("load", {"config": vars(args), "results": results})
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
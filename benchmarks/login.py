@@ -0,0 +1,113 @@
+"""POST /auth/login throughput with bcrypt on the API threadpool
+(PASSWORD_HASH_WORKERS=0) versus the dedicated process pool, plus the latency
+of a cheap authenticated endpoint probed while the logins run.
+
+    python -m benchmarks.login --concurrency 32 --duration 20 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+
+import httpx
+
+from .common import BENCH_DATABASE_URL, get_engine, latency_stats, reset_schema, write_results
+from .load import start_server, wait_until_ready
+
+PASSWORD = "benchmark-password"
+
+
+async def register_users(base_url: str, count: int) -> list:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        names = [f"login_bench_{i}" for i in range(count)]
+        for name in names:
+            response = await client.post("/auth/register", json={"username": name, "password": PASSWORD})
+            response.raise_for_status()
+        return names
+
+
+async def run_logins(base_url: str, names: list, concurrency: int, duration: float) -> dict:
+    login_samples, probe_samples = [], []
+    statuses = Counter()
+    deadline = time.monotonic() + duration
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        response = await client.post("/auth/login", data={"username": names[0], "password": PASSWORD})
+        token = response.json()["access_token"]
+
+        async def login_worker(index: int):
+            name = names[index % len(names)]
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                response = await client.post("/auth/login", data={"username": name, "password": PASSWORD})
+                statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    login_samples.append((time.perf_counter() - start) * 1000)
+
+        async def probe():
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                await client.get("/categories/", headers={"Authorization": f"Bearer {token}"})
+                probe_samples.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(probe(), *(login_worker(i) for i in range(concurrency)))
+
+    return {
+        "logins_per_second": round(len(login_samples) / duration, 1),
+        "login": latency_stats(login_samples),
+        "probe": latency_stats(probe_samples),
+        "statuses": dict(statuses)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--hash-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    reset_schema(engine)
+    engine.dispose()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    modes = {"threadpool": 0, "process_pool": args.hash_workers}
+    names = None
+    results = {}
+    for mode, workers in modes.items():
+        env = {
+            **os.environ,
+            "DATABASE_URL": BENCH_DATABASE_URL,
+            "BCRYPT_ROUNDS": str(args.rounds),
+            "PASSWORD_HASH_WORKERS": str(workers)
+        }
+        server = start_server(args.port, 1, env)
+        try:
+            wait_until_ready(base_url)
+            if names is None:
+                names = asyncio.run(register_users(base_url, args.users))
+            print(f"[{mode}] {args.concurrency} concurrent logins for {args.duration}s...")
+            results[mode] = asyncio.run(run_logins(base_url, names, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+
+        result = results[mode]
+        print(
+            f"[{mode}] {result['logins_per_second']} logins/s, login p50 {result['login'].get('p50_ms')} ms, "
+            f"probe p50 {result['probe'].get('p50_ms')} ms / p99 {result['probe'].get('p99_ms')} ms, "
+            f"statuses {result['statuses']}"
+        )
+
+    path = write_results("login", {"config": vars(args), "results": results})
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
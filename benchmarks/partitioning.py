@@ -0,0 +1,241 @@
+"""The monthly partitioned `expenses` table against the same rows in one plain
+table (expenses_plain: primary key on id alone, the same secondary indexes).
+
+    python -m benchmarks.partitioning --rows 300000000 --users 100000 --months 60
+
+At the default 300M rows the two tables need about 100 GB of disk together and
+loading them takes hours; --rows 10000000 --users 10000 is a quick run. The
+newest month of data is the current one. Timed on both tables:
+
+    user_month    one user's expenses between from/to one month apart (list_expenses)
+    user_page     a keyset page of one user's expenses in the middle of the range
+    month_total   every user's spending in one month (a scan, pruned to one partition)
+    vacuum_month  VACUUM after rewriting 1% of the newest month's rows: the whole
+                  plain table against that month's partition
+    drop_month    removing the oldest month: DELETE against dropping its partition
+                  (and moving expenses_archive's bound up over it)
+
+The EXPLAIN ANALYZE plans on the partitioned table (with the number of
+partitions each query read) are written to the results as well.
+"""
+import argparse
+import datetime
+import random
+import time
+from typing import Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import text
+
+from home_budget_api import models, partitions
+
+from .common import explain, get_engine, measure, reset_schema, write_results
+
+PAGE_SIZE = 50
+
+QUERIES = {
+    "user_month": (
+        "SELECT id, description, amount, date, category_id FROM {table} "
+        "WHERE user_id = :user_id AND date >= :start AND date <= :end "
+        "ORDER BY date DESC, id DESC LIMIT {limit}"
+    ),
+    "user_page": (
+        "SELECT id, description, amount, date, category_id FROM {table} "
+        "WHERE user_id = :user_id AND (date, id) < (:cursor_date, :cursor_id) AND date <= :cursor_date "
+        "ORDER BY date DESC, id DESC LIMIT {limit}"
+    ),
+    "month_total": "SELECT sum(amount), count(*) FROM {table} WHERE date >= :start AND date < :next"
+}
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"expenses_y{month:%Y}m{month:%m}"
+
+
+def load(engine, rows: int, users: int, months: list, categories_per_user: int = 5) -> None:
+    """Fill `expenses` month by month, then copy it into expenses_plain.
+
+    The secondary indexes are built after the load on both tables, which is
+    much faster than maintaining them row by row.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS expenses_plain"))
+    reset_schema(engine)
+    indexes = list(models.Expense.__table__.indexes)
+    per_category = max(rows // (len(months) * users * categories_per_user), 1)
+
+    with engine.begin() as conn:
+        for index in indexes:
+            index.drop(conn)
+        conn.execute(text("INSERT INTO categories (name) VALUES ('food'), ('car'), ('recreation')"))
+        conn.execute(text(
+            "INSERT INTO users (username, password_hash, initial_balance) "
+            "SELECT 'bench_' || u, 'x', 1000000000 FROM generate_series(1, :users) u"
+        ), {"users": users})
+        conn.execute(text(
+            "INSERT INTO categories (name, user_id) "
+            "SELECT 'category_' || k, u.id FROM users u CROSS JOIN generate_series(1, :per_user) k"
+        ), {"per_user": categories_per_user})
+        partitions.extend(conn, months[0], months[-1])
+        conn.execute(text(
+            "CREATE TABLE expenses_plain (LIKE expenses, PRIMARY KEY (id))"
+        ))
+
+    for month in months:
+        days = ((month + relativedelta(months=1)) - month).days
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO expenses (description, amount, date, category_id, user_id) "
+                "SELECT 'expense ' || g, round((random() * 200 + 1)::numeric, 2), "
+                "       :month + (g * :days / (:per_category + 1))::int, c.id, c.user_id "
+                "FROM generate_series(1, :per_category) g "
+                "CROSS JOIN categories c WHERE c.user_id IS NOT NULL ORDER BY g"
+            ), {"month": month, "days": days, "per_category": per_category})
+            conn.execute(text(
+                "INSERT INTO expenses_plain SELECT * FROM expenses WHERE date >= :month AND date < :next"
+            ), {"month": month, "next": month + relativedelta(months=1)})
+        print(f"  loaded {month:%Y-%m}")
+
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL maintenance_work_mem = '1GB'"))
+        for index in indexes:
+            index.create(conn)
+            definition = conn.execute(text("SELECT pg_get_indexdef(CAST(:name AS regclass))"), {"name": index.name}).scalar_one()
+            conn.execute(text(
+                definition.replace(index.name, f"{index.name}_plain", 1).replace(" ON ONLY public.expenses ", " ON expenses_plain ")
+            ))
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE expenses"))
+        conn.execute(text("VACUUM ANALYZE expenses_plain"))
+
+
+def sizes(conn) -> dict:
+    return {
+        "expenses_rows": conn.execute(text("SELECT count(*) FROM expenses")).scalar_one(),
+        "partitioned_bytes": conn.execute(text(
+            "SELECT sum(pg_total_relation_size(inhrelid)) FROM pg_inherits WHERE inhparent = 'expenses'::regclass"
+        )).scalar_one(),
+        "plain_bytes": conn.execute(text("SELECT pg_total_relation_size('expenses_plain')")).scalar_one()
+    }
+
+
+def query_params(name: str, rng: random.Random, users: int, months: list) -> dict:
+    month = rng.choice(months)
+    params = {"user_id": rng.randint(1, users)}
+    if name == "user_month":
+        params.update(start=month, end=month + relativedelta(months=1))
+    elif name == "user_page":
+        params.update(cursor_date=months[len(months) // 2], cursor_id=2 ** 31 - 1)
+    else:
+        params = {"start": month, "next": month + relativedelta(months=1)}
+    return params
+
+
+def time_queries(conn, users: int, months: list, repeat: int, scan_repeat: int) -> tuple[dict, dict]:
+    results, plans = {}, {}
+    for name, template in QUERIES.items():
+        results[name] = {}
+        runs = scan_repeat if name == "month_total" else repeat
+        for table in ("expenses_plain", "expenses"):
+            sql = text(template.format(table=table, limit=PAGE_SIZE))
+            # The same sequence of users and months for both tables.
+            rng = random.Random(name)
+            results[name][table] = measure(
+                lambda: conn.execute(sql, query_params(name, rng, users, months)).all(),
+                repeat=runs, warmup=1
+            )
+
+        params = query_params(name, random.Random(name), users, months)
+        plan = explain(conn, template.format(table="expenses", limit=PAGE_SIZE), params)
+        # An ordered Append lists every partition it may need; the ones its
+        # LIMIT never reached are "never executed".
+        results[name]["partitions_read"] = sum(
+            " on expenses_" in line and "never executed" not in line for line in plan.splitlines()
+        )
+        plans[name] = plan
+        print(
+            f"{name:<12} plain p50 {results[name]['expenses_plain']['p50_ms']} ms, "
+            f"partitioned p50 {results[name]['expenses']['p50_ms']} ms "
+            f"({results[name]['partitions_read']} of {len(months)} months read)"
+        )
+    return results, plans
+
+
+def timed(conn, sql: str, params: Optional[dict] = None) -> float:
+    start = time.perf_counter()
+    conn.execute(text(sql), params or {})
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+def time_maintenance(engine, months: list) -> dict:
+    newest, oldest = months[-1], months[0]
+    results = {}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in ("expenses_plain", "expenses"):
+            conn.execute(text(
+                f"UPDATE {table} SET amount = amount WHERE date >= :month AND id % 100 = 0"
+            ), {"month": newest})
+        results["vacuum_month"] = {
+            "expenses_plain": timed(conn, "VACUUM expenses_plain"),
+            "expenses": timed(conn, f"VACUUM {partition_name(newest)}")
+        }
+        results["drop_month"] = {
+            "expenses_plain": timed(
+                conn, "DELETE FROM expenses_plain WHERE date >= :month AND date < :next",
+                {"month": oldest, "next": oldest + relativedelta(months=1)}
+            ),
+            "expenses": timed(
+                conn,
+                "BEGIN; "
+                "ALTER TABLE expenses DETACH PARTITION expenses_archive; "
+                f"ALTER TABLE expenses DETACH PARTITION {partition_name(oldest)}; "
+                f"DROP TABLE {partition_name(oldest)}; "
+                "ALTER TABLE expenses ATTACH PARTITION expenses_archive FOR VALUES FROM (MINVALUE) TO (:next); "
+                "COMMIT",
+                {"next": oldest + relativedelta(months=1)}
+            )
+        }
+    for name, result in results.items():
+        print(f"{name:<12} plain {result['expenses_plain']} ms, partitioned {result['expenses']} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=300_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--months", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--scan-repeat", type=int, default=3, help="Runs of month_total, which scans a month")
+    args = parser.parse_args()
+
+    this_month = datetime.date.today().replace(day=1)
+    months = [this_month - relativedelta(months=k) for k in reversed(range(args.months))]
+
+    engine = get_engine()
+    try:
+        print(f"Loading {args.rows} rows over {args.months} months...")
+        load(engine, args.rows, args.users, months)
+        with engine.connect() as conn:
+            table_sizes = sizes(conn)
+            print(
+                f"{table_sizes['expenses_rows']} rows: partitioned {table_sizes['partitioned_bytes'] // 2 ** 20} MiB, "
+                f"plain {table_sizes['plain_bytes'] // 2 ** 20} MiB"
+            )
+            queries, plans = time_queries(conn, args.users, months, args.repeat, args.scan_repeat)
+        maintenance = time_maintenance(engine, months)
+    finally:
+        engine.dispose()
+
+    path = write_results("partitioning", {
+        "config": vars(args),
+        "sizes": table_sizes,
+        "queries": queries,
+        "maintenance": maintenance,
+        "plans": plans
+    })
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Run a benchmark against a throwaway local Postgres instead of an existing server.
+
+    python -m benchmarks.postgres -- python -m benchmarks.load --concurrency 100
+    python -m benchmarks.postgres --setting shared_buffers=1GB -- python -m benchmarks.search
+
+initdb creates a cluster in a temporary directory and Postgres is started on
+a free local port. The command then runs with BENCH_DATABASE_URL pointing at
+it. Afterwards the cluster is stopped and deleted (--keep leaves the
+directory and its postgres.log). Every run starts from the same empty cluster
+and the same settings. The Postgres binaries come from PG_BIN or PATH (e.g.
+PG_BIN=/usr/lib/postgresql/16/bin). Postgres refuses to run as root.
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+
+def find_binary(name: str) -> str:
+    directory = os.getenv("PG_BIN")
+    path = os.path.join(directory, name) if directory else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise RuntimeError(f"{name} not found: put the Postgres binaries on PATH or set PG_BIN")
+    return path
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_postgres(settings: list = (), keep: bool = False) -> Iterator[str]:
+    """Start a fresh cluster; yields the URL of its (not yet created) benchmark database."""
+    initdb, pg_ctl = find_binary("initdb"), find_binary("pg_ctl")
+    directory = tempfile.mkdtemp(prefix="home_budget_bench_pg_")
+    data = os.path.join(directory, "data")
+    port = free_port()
+    options = " ".join([f"-p {port}", f"-k {directory}", "-c listen_addresses=127.0.0.1", *(f"-c {s}" for s in settings)])
+    try:
+        subprocess.run(
+            [initdb, "-D", data, "-U", "postgres", "-A", "trust", "-E", "UTF8", "--no-sync"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        subprocess.run(
+            [pg_ctl, "-D", data, "-l", os.path.join(directory, "postgres.log"), "-o", options, "-w", "start"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        try:
+            yield f"postgresql://postgres@127.0.0.1:{port}/home_budget_bench"
+        finally:
+            subprocess.run([pg_ctl, "-D", data, "-m", "fast", "-w", "stop"], stdout=subprocess.DEVNULL)
+    finally:
+        if keep:
+            print(f"Cluster kept in {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--setting", action="append", default=[], help="name=value passed to postgres as -c, repeatable")
+    parser.add_argument("--keep", action="store_true", help="Keep the cluster directory afterwards")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="-- followed by the benchmark command")
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("no command given")
+
+    with local_postgres(args.setting, args.keep) as url:
+        print(f"Postgres running at {url}")
+        returncode = subprocess.run(command, env={**os.environ, "BENCH_DATABASE_URL": url}).returncode
+    sys.exit(returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Rate limiting: latency of well-behaved users while one client abuses the API.
+
+    python -m benchmarks.ratelimit --concurrency 20 --abusers 50 --duration 20
+
+Three runs against a fresh uvicorn server each: `baseline` (limits on, no
+abuse), `unlimited` (RATE_LIMIT_BACKEND=none, with abuse) and `limited`
+(the memory backend with the default limits, with abuse). The other users drive
+the load.py scenario mix; the abusing client runs --abusers loops of failed
+logins (a bcrypt verification each), GET /expenses/summary polling and
+uncached daily time series, all as one user and one address, from a process
+of its own so its loops do not delay the other clients'. Reported are the
+other users' latency and errors, and the abuser's responses by status.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+
+import httpx
+
+from .common import BENCH_DATABASE_URL, get_engine, reset_schema, seed_realistic, write_results
+from .load import load_users, run_load, start_server, summarize, wait_until_ready
+
+VARIANTS = {
+    "baseline": {"RATE_LIMIT_BACKEND": "memory"},
+    "unlimited": {"RATE_LIMIT_BACKEND": "none"},
+    "limited": {"RATE_LIMIT_BACKEND": "memory"}
+}
+ABUSER = "ratelimit_abuser"
+
+
+async def abuse(base_url: str, headers: dict, concurrency: int, duration: float) -> Counter:
+    """Hammer the API as one client until the deadline; returns statuses by request."""
+    statuses: Counter = Counter()
+    deadline = time.monotonic() + duration
+    requests = [
+        ("login", lambda client: client.post("/auth/login", data={"username": ABUSER, "password": "wrong password"})),
+        ("summary", lambda client: client.get("/expenses/summary", headers=headers)),
+        ("timeseries", lambda client: client.get(
+            "/expenses/timeseries", params={"bucket": "day", "by_category": "true"}, headers=headers
+        ))
+    ]
+
+    async def loop(client: httpx.AsyncClient):
+        while time.monotonic() < deadline:
+            name, request = random.choice(requests)
+            try:
+                statuses[f"{name} {(await request(client)).status_code}"] += 1
+            except httpx.HTTPError:
+                statuses[f"{name} failed"] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await client.post("/auth/register", json={"username": ABUSER, "password": "abuser password"})
+        await asyncio.gather(*(loop(client) for _ in range(concurrency)))
+    return statuses
+
+
+def run_abuser(base_url: str, headers: dict, concurrency: int, duration: float, results) -> None:
+    results.put(asyncio.run(abuse(base_url, headers, concurrency, duration)))
+
+
+def run_variant(base_url: str, users: list, args, with_abuse: bool) -> tuple:
+    abuser, statuses = None, multiprocessing.Queue()
+    if with_abuse:
+        abuser = multiprocessing.Process(
+            target=run_abuser, args=(base_url, users[0].headers, args.abusers, args.duration, statuses)
+        )
+        abuser.start()
+    run = asyncio.run(run_load(base_url, users[1:], args.concurrency, args.duration))
+    if abuser is None:
+        return run, Counter()
+    result = statuses.get()
+    abuser.join()
+    return run, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--expenses-per-user", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20, help="Clients of the well-behaved users")
+    parser.add_argument("--abusers", type=int, default=50, help="Concurrent requests of the abusing client")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--random-seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    reset_schema(engine)
+    print(f"Seeding {args.users} users x {args.expenses_per_user} expenses...")
+    seed_realistic(engine, args.users, args.expenses_per_user, random_seed=args.random_seed)
+    users = load_users(engine)
+    engine.dispose()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    for variant in args.variants:
+        env = {**os.environ, "DATABASE_URL": BENCH_DATABASE_URL, **VARIANTS[variant]}
+        server = start_server(args.port, 1, env)
+        try:
+            wait_until_ready(base_url)
+            random.seed(args.random_seed)
+            run, abuser = run_variant(base_url, users, args, with_abuse=variant != "baseline")
+        finally:
+            server.terminate()
+            server.wait()
+
+        results[variant] = {**summarize(run["samples"], run["errors"], args.duration), "abuser": dict(sorted(abuser.items()))}
+        overall = results[variant]["overall"]
+        print(
+            f"[{variant}] other users {results[variant]['throughput_rps']} req/s, {results[variant]['errors']} errors, "
+            f"p50 {overall.get('p50_ms')} ms, p95 {overall.get('p95_ms')} ms, p99 {overall.get('p99_ms')} ms"
+        )
+        if abuser:
+            print(f"  abuser: {', '.join(f'{status} x{count}' for status, count in sorted(abuser.items()))}")
+
+    path = write_results("ratelimit", {"config": vars(args), "results": results})
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
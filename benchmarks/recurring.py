@@ -0,0 +1,119 @@
+"""Posting a backlog of recurring expenses: recurring.materialize() against
+posting the same expenses one POST /expenses/ at a time.
+
+    python -m benchmarks.recurring --users 10000 --days 85
+
+Every user gets three recurrences that started --days ago: a daily, a weekly
+and a monthly one, about 1.2 x days due dates per user (a million for the
+defaults). The scheduler posts all of them; the one-by-one baseline posts
+--sample expenses through the route and is extrapolated to the backlog.
+A second run (nothing due) and a replay from start_date (every date already
+posted) show the idempotent paths.
+"""
+import argparse
+import asyncio
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.responses import Response
+
+from home_budget_api import models, recurring, schemas
+from home_budget_api.routers import expenses
+from home_budget_api.routers.auth import TokenUser
+
+from .common import get_async_engine, get_engine, measure_async, reset_schema, seed_realistic, write_results
+
+RULES = ["FREQ=DAILY", "FREQ=WEEKLY", "FREQ=MONTHLY;BYMONTHDAY=1"]
+
+
+def add_recurrences(engine, days: int) -> int:
+    """Three recurrences per user starting `days` ago; returns the number of due dates."""
+    start = date.today() - timedelta(days=days - 1)
+    with Session(engine) as db:
+        db.execute(text(
+            "INSERT INTO recurring_expenses (user_id, category_id, description, amount, rule, start_date, next_date) "
+            "SELECT c.user_id, min(c.id), 'recurring ' || r.rule, 9.99, r.rule, :start, :start "
+            "FROM categories c CROSS JOIN unnest(CAST(:rules AS varchar[])) AS r(rule) "
+            "WHERE c.user_id IS NOT NULL GROUP BY c.user_id, r.rule"
+        ), {"start": start, "rules": RULES})
+        due = 0
+        for rule in RULES:
+            dates, _ = recurring.occurrences(rule, start, start, date.today(), 10 ** 9)
+            due += len(dates)
+        # next_date is the first date of each rule, not start_date.
+        db.execute(text(
+            "UPDATE recurring_expenses SET next_date = :next_date WHERE rule = :rule"
+        ), [{"rule": rule, "next_date": recurring.first_date(rule, start)} for rule in RULES])
+        users = db.scalar(text("SELECT count(*) FROM users"))
+        db.commit()
+    return due * users
+
+
+def run_scheduler(engine, batch_size: int) -> tuple:
+    with Session(engine) as db:
+        start = time.perf_counter()
+        result = recurring.materialize(db, batch_size=batch_size)
+        return time.perf_counter() - start, result
+
+
+async def one_by_one(sample: int) -> dict:
+    async_engine = get_async_engine()
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            user = await db.scalar(select(models.User))
+            principal = TokenUser(id=user.id, username=user.username, currency=user.currency)  # type: ignore
+            category_id = await db.scalar(select(models.Category.id).where(models.Category.user_id == user.id))  # type: ignore
+            return await measure_async(lambda: expenses.create_expense(
+                schemas.ExpenseCreate(description="recurring", amount=9.99, category_id=category_id),  # type: ignore
+                Response(), db=db, current_user=principal
+            ), repeat=sample)
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=85)
+    parser.add_argument("--batch-size", type=int, default=recurring.RECURRING_BATCH_SIZE)
+    parser.add_argument("--sample", type=int, default=2000, help="Expenses posted one by one for the baseline")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    reset_schema(engine)
+    print(f"Seeding {args.users} users...")
+    seed_realistic(engine, args.users, expenses_per_user=10, days=args.days)
+    due = add_recurrences(engine, args.days)
+    print(f"{due} due dates")
+
+    seconds, result = run_scheduler(engine, args.batch_size)
+    assert result.posted == due, (result.posted, due)
+    batched = {"seconds_s": round(seconds, 2), "posted": result.posted, "rows_per_s": round(result.posted / seconds)}
+    print(f"materialize: {result.posted} expenses in {seconds:.2f} s, {batched['rows_per_s']} rows/s")
+
+    seconds, result = run_scheduler(engine, args.batch_size)
+    nothing_due = {"seconds_s": round(seconds, 3), "posted": result.posted}
+    print(f"second run: {result.posted} posted in {seconds:.3f} s")
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE recurring_expenses SET next_date = start_date"))
+    seconds, result = run_scheduler(engine, args.batch_size)
+    replay = {"seconds_s": round(seconds, 2), "posted": result.posted}
+    print(f"replay from start_date: {result.posted} posted in {seconds:.2f} s")
+
+    single = asyncio.run(one_by_one(args.sample))
+    estimate = single["mean_ms"] * due / 1000
+    print(f"one by one: p50 {single['p50_ms']} ms per expense, about {estimate:.0f} s for the backlog")
+
+    path = write_results("recurring", {"config": vars(args), "results": {
+        "due": due, "materialize": batched, "second_run": nothing_due, "replay": replay,
+        "one_by_one": single, "one_by_one_estimate_s": round(estimate)
+    }})
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
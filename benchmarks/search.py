@@ -0,0 +1,144 @@
+"""GET /expenses/?q= latency for one tenant with millions of expenses, and for
+one of many small tenants next to it, with and without the search index.
+
+    python -m benchmarks.search --rows 2000000 --other-users 100 --other-rows 2000000
+
+Descriptions are built from a small vocabulary ("coffee at starbucks card
+ref 123"), so the searches below range from no matches to a third of the
+tenant's rows. Each search runs the list_expenses route (first page of 50) on
+an AsyncSession; the number of matching rows is reported with it. The plans of
+the two queries a search may run (the walk over the newest expenses and the
+search index) are written to the results for a common and a rare word.
+"""
+import argparse
+import asyncio
+import datetime
+
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from home_budget_api import models, partitions
+from home_budget_api.routers import expenses
+
+from .common import (
+    KINDS, MERCHANTS, PAYMENTS, explain, get_async_engine, get_engine, measure_async, reset_schema, write_results
+)
+
+SEARCHES = {
+    "reference": "ref 1234567",
+    "merchant": "starbucks",
+    "prefix": "starb",
+    "two_words": "coffee starb",
+    "broad": "card"
+}
+DAYS = 5 * 365
+
+
+def seed(engine, rows: int, other_users: int, other_rows: int) -> None:
+    reset_schema(engine)
+    start = datetime.date.today() - datetime.timedelta(days=DAYS)
+    with engine.begin() as conn:
+        partitions.extend(conn, start, datetime.date.today())
+        conn.execute(text(
+            "INSERT INTO users (username, password_hash, initial_balance) "
+            "SELECT 'bench_' || u, 'x', 1000000000 FROM generate_series(0, :others) u"
+        ), {"others": other_users})
+        conn.execute(text(
+            "INSERT INTO categories (name, user_id) SELECT 'category_' || k, u.id "
+            "FROM users u CROSS JOIN generate_series(1, 5) k"
+        ))
+        # The tenant under test is the first user; the others share other_rows.
+        for user_filter, count, per_user in (("u.id = 1", rows, rows), ("u.id > 1", other_rows, other_rows // max(other_users, 1))):
+            conn.execute(text(
+                "INSERT INTO expenses (description, amount, date, category_id, user_id) "
+                "SELECT (:kinds)[1 + g % cardinality(:kinds)] || ' at ' "
+                "       || (:merchants)[1 + (g * 7 + g / 13) % cardinality(:merchants)] || ' ' "
+                "       || (:payments)[1 + g / 3 % cardinality(:payments)] || ' ref ' || g, "
+                "       round((random() * 200 + 1)::numeric, 2), :start + g % :days, "
+                "       (SELECT min(c.id) FROM categories c WHERE c.user_id = u.id) + g % 5, u.id "
+                f"FROM users u CROSS JOIN generate_series(1, :per_user) g WHERE {user_filter} ORDER BY g"
+            ), {
+                "kinds": KINDS, "merchants": MERCHANTS, "payments": PAYMENTS,
+                "start": start, "days": DAYS, "per_user": per_user
+            })
+            print(f"  loaded {count} rows ({user_filter})")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE expenses"))
+
+
+async def run_searches(async_engine, user_id: int, repeat: int) -> dict:
+    results = {}
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        user = await db.get(models.User, user_id)
+        for name, q in SEARCHES.items():
+            async def search():
+                return await expenses.list_expenses(
+                    db=db, current_user=user,  # type: ignore
+                    category_id=None, min_amount=None, max_amount=None, start_date=None, end_date=None,
+                    q=q, limit=50, cursor=None, stream=False
+                )
+
+            matches = await db.scalar(
+                select(func.count()).select_from(models.Expense).where(
+                    models.Expense.user_id == user_id, or_(*expenses.search_ranks(q))
+                )
+            )
+            results[name] = {"q": q, "matches": matches, **(await measure_async(search, repeat=repeat))}
+    return results
+
+
+def search_plans(conn) -> dict:
+    plans = {}
+    for name in ("merchant", "reference"):
+        for path, recent in (("recent", True), ("index", False)):
+            query = expenses._search_query(1, SEARCHES[name], 0, 51, recent=recent)
+            sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+            plans[f"{name}_{path}"] = explain(conn, sql, {})
+    return plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Expenses of the searched tenant")
+    parser.add_argument("--other-users", type=int, default=100)
+    parser.add_argument("--other-rows", type=int, default=2_000_000, help="Expenses of all other tenants together")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    print(f"Loading {args.rows} + {args.other_rows} rows...")
+    seed(engine, args.rows, args.other_users, args.other_rows)
+
+    async_engine = get_async_engine()
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for variant in ("indexed", "no_index"):
+            if variant == "no_index":
+                with engine.begin() as conn:
+                    conn.execute(text("DROP INDEX ix_expenses_description_search"))
+            results[variant] = {
+                tenant: loop.run_until_complete(run_searches(async_engine, user_id, args.repeat))
+                for tenant, user_id in (("large", 1), ("small", 2))
+            }
+            with engine.connect() as conn:
+                results[variant]["plans"] = search_plans(conn)
+            for tenant in ("large", "small"):
+                for name in SEARCHES:
+                    result = results[variant][tenant][name]
+                    print(
+                        f"[{variant}] {tenant:<5} {name:<10} {result['matches']:>8} matches, "
+                        f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms"
+                    )
+    finally:
+        loop.run_until_complete(async_engine.dispose())
+        loop.close()
+        engine.dispose()
+
+    path = write_results("search", {"config": vars(args), "results": results})
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Rows per second of a GET /expenses/ response body built the way it was
+before (ORM objects with their category, validated into ExpenseResponse
+models through response_model and encoded by FastAPI) and the way
+list_expenses builds it now (plain column rows written out with orjson).
+
+    python -m benchmarks.serialization --rows 10000 --repeat 20
+
+Both read the same page of one user's expenses on an AsyncSession. Each path
+is timed as a whole (query and body) and for the body alone, from rows that
+were fetched beforehand.
+"""
+import argparse
+import asyncio
+import json
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from home_budget_api import models, schemas
+from home_budget_api.routers import expenses
+
+from .common import get_async_engine, get_engine, measure_async, reset_schema, seed, write_results
+
+expense_list = TypeAdapter(List[schemas.ExpenseResponse])
+
+
+def validated_body(orm_expenses) -> bytes:
+    # What FastAPI does for response_model: validate from attributes, dump
+    # to JSON-compatible values, then JSONResponse.render.
+    content = expense_list.dump_python(expense_list.validate_python(orm_expenses, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def orjson_body(rows) -> bytes:
+    return orjson.dumps(expenses._expense_dicts(rows))
+
+
+async def run(async_engine, rows: int, repeat: int) -> dict:
+    orm_query = expenses.filter_expenses(
+        select(models.Expense).options(joinedload(models.Expense.category)), 1
+    ).limit(rows)
+    rows_query = expenses._expense_rows_query(1).limit(rows)
+
+    async with AsyncSession(async_engine) as db:
+        async def before():
+            return validated_body((await db.scalars(orm_query)).all())
+
+        async def after():
+            return orjson_body((await db.execute(rows_query)).all())
+
+        assert await before() == await after(), "the two paths must produce the same body"
+        results = {
+            "orm_validated": await measure_async(before, repeat=repeat),
+            "rows_orjson": await measure_async(after, repeat=repeat)
+        }
+
+        orm_expenses = (await db.scalars(orm_query)).all()
+        plain_rows = (await db.execute(rows_query)).all()
+
+        async def before_body():
+            return validated_body(orm_expenses)
+
+        async def after_body():
+            return orjson_body(plain_rows)
+
+        results["orm_validated_body"] = await measure_async(before_body, repeat=repeat)
+        results["rows_orjson_body"] = await measure_async(after_body, repeat=repeat)
+
+    for result in results.values():
+        result["rows_per_s"] = round(rows / (result["p50_ms"] / 1000))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000, help="Expenses in the response")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    try:
+        reset_schema(engine)
+        seed(engine, users=1, expenses_per_user=args.rows)
+    finally:
+        engine.dispose()
+
+    async_engine = get_async_engine()
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(run(async_engine, args.rows, args.repeat))
+    finally:
+        loop.run_until_complete(async_engine.dispose())
+        loop.close()
+
+    for name, result in results.items():
+        print(f"{name:<20} p50 {result['p50_ms']:>9} ms  {result['rows_per_s']:>9} rows/s")
+    path = write_results("serialization", {"config": vars(args), "results": results})
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Time from launching `uvicorn --workers N` until every worker has started,
+with the schema and preset setup each worker used to run on import against
+the app as it starts now (no database work until the first request).
+
+    python -m benchmarks.startup --workers 1 4 8 16 --repeat 5
+
+import_time runs the old module-level create_all() and per-name preset
+lookups in every worker (through --factory import_time_app below); lazy is
+home_budget_api.main:app. The schema is set up and seeded once beforehand, as
+setup_db.py does, so both start against the same database. Reported per
+variant and worker count: when the first and the last worker logged
+"Application startup complete", when /docs first answered, and how many
+database connections the workers held once they were all up.
+"""
+import argparse
+import os
+import queue
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+from sqlalchemy import text
+
+from .common import BENCH_DATABASE_URL, get_engine, reset_schema, write_results
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+
+VARIANTS = {
+    "import_time": ["benchmarks.startup:import_time_app", "--factory"],
+    "lazy": ["home_budget_api.main:app"]
+}
+STARTED = "Application startup complete"
+
+
+def import_time_app():
+    """What importing home_budget_api.main did in every worker before."""
+    from home_budget_api import database, models
+    from home_budget_api.setup_db import PRESET_CATEGORIES
+
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    try:
+        for name in PRESET_CATEGORIES:
+            exists = db.query(models.Category).filter(models.Category.name == name, models.Category.user_id == None).first()
+            if not exists:
+                db.add(models.Category(name=name))
+        db.commit()
+    finally:
+        db.close()
+
+    from home_budget_api.main import app
+    return app
+
+
+def prepare(engine) -> None:
+    from home_budget_api.setup_db import seed_preset_categories
+
+    reset_schema(engine)
+    with engine.begin() as conn:
+        seed_preset_categories(conn)
+
+
+def server_connections(conn) -> int:
+    return conn.execute(text(
+        "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+    )).scalar_one()
+
+
+def start_once(app: list, workers: int, port: int, conn, timeout: float = 120) -> dict:
+    env = {**os.environ, "DATABASE_URL": BENCH_DATABASE_URL}
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", *app, "--port", str(port), "--workers", str(workers), "--log-level", "info"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    lines: queue.Queue = queue.Queue()
+    threading.Thread(target=lambda: [lines.put(line) for line in server.stderr], daemon=True).start()
+
+    started, first_response = [], None
+    deadline = time.monotonic() + timeout
+    try:
+        while len(started) < workers or first_response is None:
+            if time.monotonic() > deadline or server.poll() is not None:
+                raise RuntimeError(f"{app[0]} with {workers} workers did not start")
+            try:
+                while True:
+                    if STARTED in lines.get_nowait():
+                        started.append(time.perf_counter() - start)
+            except queue.Empty:
+                pass
+            if first_response is None and started:
+                try:
+                    if httpx.get(f"http://127.0.0.1:{port}/docs").status_code == 200:
+                        first_response = time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+            time.sleep(0.01)
+        connections = server_connections(conn)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    return {
+        "first_worker_s": round(started[0], 3),
+        "all_workers_s": round(started[-1], 3),
+        "first_response_s": round(first_response, 3),
+        "connections": connections
+    }
+
+
+def summarize(runs: list) -> dict:
+    return {
+        key: round(statistics.median(run[key] for run in runs), 3)
+        for key in ("first_worker_s", "all_workers_s", "first_response_s", "connections")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    results = {}
+    try:
+        prepare(engine)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for workers in args.workers:
+                for variant in args.variants:
+                    runs = [start_once(VARIANTS[variant], workers, args.port, conn) for _ in range(args.repeat)]
+                    results.setdefault(str(workers), {})[variant] = {**summarize(runs), "runs": runs}
+                    result = results[str(workers)][variant]
+                    print(
+                        f"{workers:>3} workers {variant:<12} all started {result['all_workers_s']:>7} s, "
+                        f"first response {result['first_response_s']:>7} s, {result['connections']:>3} connections"
+                    )
+    finally:
+        engine.dispose()
+
+    path = write_results("startup", {"config": vars(args), "results": results})
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
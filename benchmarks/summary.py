@@ -0,0 +1,86 @@
+"""GET /expenses/summary latency: the original five-query implementation
+against the current one, for one user at several history sizes.
+
+    python -m benchmarks.summary --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from home_budget_api import models
+from home_budget_api.routers import expenses
+
+from .common import get_async_engine, get_engine, measure, measure_async, reset_schema, seed, write_results
+
+
+def legacy_summary(db: Session, user_id: int) -> dict:
+    """The summary as it was before the single-pass rewrite, for comparison."""
+    today = date.today()
+
+    def spending_since(start_date: date) -> float:
+        return float(
+            db.query(func.coalesce(func.sum(models.Expense.amount), 0))
+            .filter(models.Expense.user_id == user_id, models.Expense.date >= start_date)
+            .scalar()
+        )
+
+    total = db.query(func.coalesce(func.sum(models.Expense.amount), 0)) \
+        .filter(models.Expense.user_id == user_id).scalar()
+    by_category = (
+        db.query(models.Category.name, func.coalesce(func.sum(models.Expense.amount), 0))
+        .join(models.Expense, models.Category.id == models.Expense.category_id)
+        .filter(models.Expense.user_id == user_id)
+        .group_by(models.Category.name)
+        .all()
+    )
+    return {
+        "total_spent": float(total),
+        "by_category": by_category,
+        "spent_last_month": spending_since(today - relativedelta(months=1)),
+        "spent_last_quarter": spending_since(today - relativedelta(months=3)),
+        "spent_last_year": spending_since(today - relativedelta(years=1)),
+    }
+
+
+async def measure_current(repeat: int) -> dict:
+    async_engine = get_async_engine()
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            user = await db.scalar(select(models.User))
+            return await measure_async(lambda: expenses.get_budget_summary(db=db, current_user=user), repeat=repeat)  # type: ignore
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    results = {}
+    for size in args.sizes:
+        reset_schema(engine)
+        print(f"Seeding one user with {size} expenses...")
+        seed(engine, users=1, expenses_per_user=size)
+
+        with Session(engine) as db:
+            user = db.query(models.User).first()
+            legacy = measure(lambda: legacy_summary(db, user.id), repeat=args.repeat)  # type: ignore
+        current = asyncio.run(measure_current(args.repeat))
+        results[size] = {"legacy": legacy, "current": current}
+        print(f"{size:>10} expenses: legacy p50 {legacy['p50_ms']} ms, current p50 {current['p50_ms']} ms")
+
+    path = write_results("summary", results)
+    print(f"Results written to {path}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Atomic balance changes.
+
+A balance is never read into Python, changed and written back: concurrent
+requests for the same account would overwrite each other's change. Instead the
+arithmetic and the overdraft check run in one conditional UPDATE, which only
+holds the user's row lock until the surrounding transaction ends.
+
+Change the balance after the transaction's other row locks are taken
+(inserting an expense locks its category and user rows for key share,
+deleting a category locks the category), so every write path locks rows in
+the same order and concurrent writes cannot deadlock each other.
+"""
+from decimal import Decimal
+from typing import Mapping, Optional
+
+from sqlalchemy import Integer, Numeric, column, update
+
+from . import database, models
+
+
+def change_statement(user_id: int, amount: Decimal):
+    """UPDATE adding amount (negative to withdraw) unless that would overdraw."""
+    stmt = (
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(initial_balance=models.User.initial_balance + amount)
+        .returning(models.User.initial_balance)
+        .execution_options(synchronize_session=False)
+    )
+    if amount < 0:
+        stmt = stmt.where(models.User.initial_balance >= -amount)
+    return stmt
+
+
+def debit_statement(totals: Mapping[int, Decimal]):
+    """One UPDATE taking each user's total (user_id -> amount) off their
+    balance, skipping the users it would overdraw; returns the ids debited."""
+    debit = database.unnest(
+        "debit", [column("user_id", Integer), column("total", Numeric(14, 2))], sorted(totals.items())
+    )
+    return (
+        update(models.User)
+        .where(models.User.id == debit.c.user_id, models.User.initial_balance >= debit.c.total)
+        .values(initial_balance=models.User.initial_balance - debit.c.total)
+        .returning(models.User.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def change(db: database.AnySession, user_id: int, amount: Decimal) -> Optional[Decimal]:
+    """Apply the change in the session's transaction and return the new balance,
+    or None (nothing changed) when the balance is too low."""
+    return (await db.execute(change_statement(user_id, amount))).scalar_one_or_none()
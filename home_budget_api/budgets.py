@@ -0,0 +1,206 @@
+"""Running spend counters of the monthly category budgets (budget_spend).
+
+The expense write paths add every change to the counters of the budgets it
+touches, inside their own transaction and right after the rollup, so the
+status of a month (GET /budgets/status) is a keyed lookup instead of an
+aggregation over `expenses`. A new budget starts from the user's rollup.
+Counters are in the user's currency; expenses paid in another count with
+the converted amount the balance was debited (see fx.py).
+Run as a module to check the counters against `expenses` or to rebuild them
+in bulk:
+
+    python -m home_budget_api.budgets verify [--user-id ID]
+    python -m home_budget_api.budgets rebuild [--user-id ID]
+"""
+import argparse
+import sys
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Mapping, Optional
+
+from sqlalchemy import Date, Integer, Numeric, column, delete, func, literal, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+# (category_id, day) -> (amount in the user's currency, number of expenses)
+Deltas = Mapping[tuple[int, date], tuple[Decimal, int]]
+
+budgets = models.Budget.__table__
+spend = models.BudgetSpend.__table__
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _upsert(deltas_by_user: Mapping[int, Deltas]):
+    """INSERT ... ON CONFLICT adding the deltas to the counters of the budgets
+    they touch, or None when the deltas add up to nothing."""
+    months: dict = defaultdict(Decimal)
+    for user_id, deltas in deltas_by_user.items():
+        for (category_id, day), (amount, _) in deltas.items():
+            months[(user_id, category_id, month_start(day))] += amount
+    changes = [key + (amount,) for key, amount in sorted(months.items()) if amount]
+    if not changes:
+        return None
+
+    changed = database.unnest("changed", [
+        column("user_id", Integer), column("category_id", Integer), column("month", Date), column("amount", Numeric(14, 2))
+    ], changes)
+    stmt = insert(spend).from_select(
+        ["budget_id", "month", "spent"],
+        select(budgets.c.id, changed.c.month, changed.c.amount)
+        .join_from(
+            budgets, changed,
+            (budgets.c.user_id == changed.c.user_id) & (budgets.c.category_id == changed.c.category_id)
+        )
+        # The same row lock order for concurrent writers
+        .order_by(budgets.c.id, changed.c.month)
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[spend.c.budget_id, spend.c.month],
+        set_={"spent": spend.c.spent + stmt.excluded.spent}
+    )
+
+
+async def apply_deltas(db: database.AnySession, user_id: int, deltas: Deltas) -> list:
+    """Add the rollup deltas of an expense write to the user's budgets.
+
+    Returns (budget_id, month, spent, amount) of the budgets the write left
+    over their limit. A user without budgets costs one statement that finds
+    nothing to update.
+    """
+    stmt = _upsert({user_id: deltas})
+    if stmt is None:
+        return []
+
+    upserted = stmt.returning(spend.c.budget_id, spend.c.month, spend.c.spent).cte("upserted")
+    return (await db.execute(
+        select(upserted.c.budget_id, upserted.c.month, upserted.c.spent, budgets.c.amount)
+        .join_from(upserted, budgets, budgets.c.id == upserted.c.budget_id)
+        .where(upserted.c.spent > budgets.c.amount)
+    )).all()
+
+
+def apply_many(db: Session, deltas_by_user: Mapping[int, Deltas]) -> None:
+    """apply_deltas for several users in one statement, without the overspend check (recurring.py)."""
+    stmt = _upsert(deltas_by_user)
+    if stmt is not None:
+        db.execute(stmt)
+
+
+async def start_counters(db: database.AnySession, budget_id: int, user_id: int, category_id: int) -> None:
+    """Fill a new budget's counters from the rollup.
+
+    Expense writes change the balance before they reach the rollup and the
+    counters, and hold the user's row from then until they commit. Locking
+    that row FOR NO KEY UPDATE here waits for every write that already
+    changed the balance, so the rollup read below includes it; a write that
+    gets the row after this budget commits updates the counters itself.
+    """
+    # key_share without read is FOR NO KEY UPDATE, the lock the balance UPDATE takes.
+    await db.execute(select(models.User.id).where(models.User.id == user_id).with_for_update(key_share=True))
+    rollup = models.ExpenseDailyTotal
+    month = func.date_trunc("month", rollup.day).cast(Date)
+    await db.execute(insert(spend).from_select(
+        ["budget_id", "month", "spent"],
+        select(literal(budget_id, Integer), month, func.sum(rollup.converted))
+        .where(rollup.user_id == user_id, rollup.category_id == category_id)
+        .group_by(month)
+    ))
+
+
+def _expense_spend(user_id: Optional[int] = None):
+    expense = models.Expense
+    month = func.date_trunc("month", expense.date).cast(Date)
+    amount = func.coalesce(expense.converted_amount, expense.amount)
+    query = (
+        select(budgets.c.id.label("budget_id"), month.label("month"), func.sum(amount).label("spent"))
+        .join_from(
+            budgets, expense,
+            (expense.user_id == budgets.c.user_id) & (expense.category_id == budgets.c.category_id)
+        )
+        .group_by(budgets.c.id, month)
+    )
+    if user_id is not None:
+        query = query.where(budgets.c.user_id == user_id)
+    return query
+
+
+def _user_budget_ids(user_id: int):
+    return select(budgets.c.id).where(budgets.c.user_id == user_id)
+
+
+def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+    """Recompute the counters from `expenses`; returns the number of rows written.
+
+    The table lock holds back the expense writes' counter updates until the
+    rebuild commits, so they land on top of the rebuilt counters instead of
+    being lost or counted twice.
+    """
+    db.execute(text("LOCK TABLE budget_spend IN SHARE ROW EXCLUSIVE MODE"))
+    stmt = delete(spend)
+    if user_id is not None:
+        stmt = stmt.where(spend.c.budget_id.in_(_user_budget_ids(user_id)))
+    db.execute(stmt)
+
+    result = db.execute(insert(spend).from_select(["budget_id", "month", "spent"], _expense_spend(user_id)))
+    return result.rowcount  # type: ignore
+
+
+def verify(db: Session, user_id: Optional[int] = None) -> list:
+    """Return the (budget_id, month) counters that have drifted from `expenses`."""
+    expected = _expense_spend(user_id).subquery("expected")
+    actual = select(spend)
+    if user_id is not None:
+        actual = actual.where(spend.c.budget_id.in_(_user_budget_ids(user_id)))
+    actual = actual.subquery("actual")
+
+    return db.execute(
+        select(
+            func.coalesce(expected.c.budget_id, actual.c.budget_id).label("budget_id"),
+            func.coalesce(expected.c.month, actual.c.month).label("month"),
+            expected.c.spent.label("expected_spent"),
+            actual.c.spent.label("actual_spent")
+        )
+        .select_from(expected.join(
+            actual,
+            (expected.c.budget_id == actual.c.budget_id) & (expected.c.month == actual.c.month),
+            full=True
+        ))
+        # Counters of months whose expenses were all deleted stay at zero.
+        .where(func.coalesce(expected.c.spent, 0) != func.coalesce(actual.c.spent, 0))
+        .order_by("budget_id", "month")
+    ).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify or rebuild the budget_spend counters.")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--user-id", type=int, default=None, help="Limit to one user")
+    args = parser.parse_args()
+
+    db = database.SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rows = rebuild(db, args.user_id)
+            db.commit()
+            print(f"Budget counters rebuilt: {rows} rows")
+            return
+
+        drift = verify(db, args.user_id)
+        for row in drift:
+            print(f"budget {row.budget_id} month {row.month}: expected {row.expected_spent}, found {row.actual_spent}")
+        if drift:
+            print(f"Budget counter drift in {len(drift)} rows")
+            sys.exit(1)
+        print("Budget counters are consistent")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Per-user response cache for read-heavy endpoints (summary, category list).
+
+Values are the serialized JSON bodies, so a hit is returned without touching
+the database or re-validating the response model. The write paths invalidate
+the affected user's keys after they commit. A read that overlaps a write can
+still put back a body computed just before that write; CACHE_TTL bounds how
+long it is served.
+
+Backends:
+    none    caching disabled (the default unless CACHE_URL is set).
+    redis   any Redis-compatible server at CACHE_URL (needs the `redis`
+            package; the default when CACHE_URL is set). RedisCache takes the
+            client as an argument, so an in-process fake can stand in for it.
+    memory  in-process LRU with TTL. Each worker process has its own copy and
+            only sees its own invalidations, so another worker would serve a
+            stale body until CACHE_TTL runs out. For a single worker only;
+            refused when WEB_CONCURRENCY asks uvicorn for more.
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "redis" if "CACHE_URL" in os.environ else "none")
+# uvicorn's default for --workers
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+
+class CacheStats:
+    """Counters reported by GET /metrics/cache."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "errors": self.errors
+        }
+
+
+class MemoryCache:
+    """LRU with a per-entry TTL. Only used from the event loop, so unlocked."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        # key -> (expires at, value)
+        self._entries: "OrderedDict[str, tuple[float, bytes]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry[1]
+
+    async def set(self, key: str, value: bytes) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self.stats.invalidations += 1
+
+    def status(self) -> dict:
+        return {**self.stats.snapshot(), "size": len(self._entries), "max_entries": self.max_entries}
+
+
+class RedisCache:
+    """Keys with a TTL on a Redis-compatible server.
+
+    `client` needs the async get/set(ex=)/delete of redis.asyncio.Redis.
+    Eviction happens on the server and is not counted here. A failing server
+    degrades to cache misses rather than failing requests.
+    """
+
+    name = "redis"
+
+    def __init__(self, client: Any, ttl: float = CACHE_TTL, prefix: str = "home_budget:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        try:
+            value = await self.client.get(self.prefix + key)
+        except Exception:
+            logger.warning("Cache read failed", exc_info=True)
+            self.stats.errors += 1
+            value = None
+        if value is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        try:
+            await self.client.set(self.prefix + key, value, ex=max(int(self.ttl), 1))
+        except Exception:
+            logger.warning("Cache write failed", exc_info=True)
+            self.stats.errors += 1
+
+    async def delete(self, *keys: str) -> None:
+        try:
+            self.stats.invalidations += await self.client.delete(*(self.prefix + key for key in keys))
+        except Exception:
+            logger.warning("Cache invalidation failed", exc_info=True)
+            self.stats.errors += 1
+
+    def status(self) -> dict:
+        return self.stats.snapshot()
+
+
+class NullCache:
+    name = "none"
+    ttl = 0.0
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    async def set(self, key: str, value: bytes) -> None:
+        pass
+
+    async def delete(self, *keys: str) -> None:
+        pass
+
+    def status(self) -> dict:
+        return self.stats.snapshot()
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    if name == "memory":
+        if WEB_CONCURRENCY > 1:
+            raise RuntimeError("CACHE_BACKEND=memory is per worker; use redis with WEB_CONCURRENCY > 1")
+        return MemoryCache()
+    if name == "redis":
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis needs the redis package installed")
+        return RedisCache(redis.asyncio.from_url(CACHE_URL))
+    if name == "none":
+        return NullCache()
+    raise ValueError(f"Unknown CACHE_BACKEND {name!r}, expected memory, redis or none")
+
+
+backend = create_backend()
+
+
+def set_backend(new_backend) -> None:
+    """Swap the backend, e.g. for a RedisCache around a fake client."""
+    global backend
+    backend = new_backend
+
+
+def summary_key(user_id: int) -> str:
+    # The summary's month/quarter/year windows move with the date.
+    return f"summary:{user_id}:{date.today().isoformat()}"
+
+
+def categories_key(user_id: int) -> str:
+    return f"categories:{user_id}"
+
+
+async def get(key: str) -> Optional[bytes]:
+    return await backend.get(key)
+
+
+async def put(key: str, value: bytes) -> None:
+    await backend.set(key, value)
+
+
+async def invalidate(*keys: str) -> None:
+    await backend.delete(*keys)
+
+
+def status() -> dict:
+    return {"backend": backend.name, "ttl_seconds": backend.ttl, **backend.status()}
@@ -0,0 +1,188 @@
+"""Exchange rates (fx_rates) and currency conversion.
+
+An expense keeps the amount and currency it was paid in; a user's balance
+and budgets are in the user's own currency. `fx_rates` holds, per currency
+and day, how many units of the currency one unit of a common base buys (the
+ECB reference rates are per euro). It is loaded in bulk from a local CSV file
+with a `date,currency,rate` header:
+
+    python -m home_budget_api.fx load rates.csv [--base EUR]
+
+A day without a quote (weekends, holidays, days after the last file) gets
+the rate of the previous quoted day the first time an expense needs it,
+stored as derived. Loading a file adds the missing days and currencies and
+replaces derived rates with the file's quotes; a quoted rate never changes.
+
+Only the write paths convert, in Python, through an in-process cache of the
+rates they need (`rates_for`); only quoted rates are cached, so a cached rate
+is never stale. An expense in another currency than the user's stores the
+converted amount, rounded to cents, that the balance was debited; the rollup
+adds those up per day. Refunds, budget counters, the summary and the time
+series all use these stored amounts, so they add up the same rounded cents
+and stay as they were when a derived rate is replaced.
+"""
+import argparse
+import csv
+import io
+import os
+from collections import OrderedDict
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Date, String, column, func, literal, select, text, true, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+# (currency, day) rates kept per worker
+FX_CACHE_SIZE = int(os.getenv("FX_CACHE_SIZE", "100000"))
+
+CENT = Decimal("0.01")
+
+rates = models.FxRate.__table__
+
+_cache: "OrderedDict[tuple[str, date], Decimal]" = OrderedDict()
+
+
+def convert(amount: Decimal, currency: str, day: date, to_currency: str, found: dict) -> Optional[Decimal]:
+    """amount in to_currency, rounded to cents, with the rates of `rates_for`;
+    None when a rate is missing."""
+    if currency == to_currency:
+        return amount
+    source, target = found.get((currency, day)), found.get((to_currency, day))
+    if source is None or target is None:
+        return None
+    return (amount * target / source).quantize(CENT, ROUND_HALF_UP)
+
+
+def _cached(key: tuple) -> Optional[Decimal]:
+    rate = _cache.get(key)
+    if rate is not None:
+        _cache.move_to_end(key)
+    return rate
+
+
+def _remember(quoted: dict) -> None:
+    _cache.update(quoted)
+    while len(_cache) > FX_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _keys(pairs: Iterable[tuple[str, date]], to_currency: str) -> set:
+    keys = set()
+    for currency, day in pairs:
+        if currency != to_currency:
+            keys.update(((currency, day), (to_currency, day)))
+    return keys
+
+
+async def rates_for(db: database.AnySession, pairs: Iterable[tuple[str, date]], to_currency: str) -> dict:
+    """The rates converting each (currency, day) of pairs into to_currency, for
+    `convert`. Read from the cache, then with one query, then filled in from
+    the previous quoted day; rates that cannot be found are left out."""
+    keys = _keys(pairs, to_currency)
+    found = {key: rate for key in keys if (rate := _cached(key)) is not None}
+    missing = keys - found.keys()
+    quoted: dict = {}
+    if missing:
+        stored = (await db.execute(_stored(missing))).all()
+        found.update({(currency, day): rate for currency, day, rate, _ in stored})
+        quoted.update({(currency, day): rate for currency, day, rate, derived in stored if not derived})
+        missing -= found.keys()
+    if missing:
+        # Committed on its own connection before any expense is written at
+        # these rates, so the rows are there for the next request too.
+        found.update(await run_in_threadpool(_fill, missing))
+    _remember(quoted)
+    return found
+
+
+def _stored(keys: Iterable[tuple[str, date]]):
+    return (
+        select(rates.c.currency, rates.c.day, rates.c.rate, rates.c.derived)
+        .where(tuple_(rates.c.currency, rates.c.day).in_(sorted(keys)))
+    )
+
+
+def fill(db: Session, keys: Iterable[tuple[str, date]]) -> dict:
+    """Store the rate of the previous quoted day, as derived, for each
+    (currency, day) without a rate; returns the rates of keys that have one now."""
+    wanted = database.unnest("wanted", [column("currency", String(3)), column("day", Date)], sorted(keys))
+    previous = (
+        select(rates.c.rate)
+        .where(rates.c.currency == wanted.c.currency, rates.c.day < wanted.c.day, rates.c.derived.is_(False))
+        .order_by(rates.c.day.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    filled = select(wanted.c.currency, wanted.c.day, previous.label("rate"), true()).subquery("filled")
+    db.execute(
+        insert(rates)
+        .from_select(["currency", "day", "rate", "derived"], select(filled).where(filled.c.rate.isnot(None)))
+        .on_conflict_do_nothing()
+    )
+    return {(currency, day): rate for currency, day, rate, _ in db.execute(_stored(keys))}
+
+
+def _fill(keys: set) -> dict:
+    db = database.SessionLocal()
+    try:
+        found = fill(db, keys)
+        db.commit()
+        return found
+    finally:
+        db.close()
+
+
+def load(db: Session, file: io.TextIOBase, base: str) -> int:
+    """COPY a `date,currency,rate` CSV into fx_rates, adding rate 1 for the
+    base currency on every day of the file; returns the number of rates added
+    or replacing derived ones."""
+    header = next(csv.reader([file.readline()]), [])
+    if [name.strip().lower() for name in header] != ["date", "currency", "rate"]:
+        raise ValueError("Expected a date,currency,rate header")
+
+    db.execute(text(
+        "CREATE TEMPORARY TABLE fx_load (day date, currency varchar(3), rate numeric) ON COMMIT DROP"
+    ))
+    cursor = db.connection().connection.cursor()
+    cursor.copy_expert("COPY fx_load FROM STDIN WITH (FORMAT csv)", file)
+
+    loaded = (
+        select(func.upper(column("currency")), column("day"), column("rate"))
+        .select_from(text("fx_load"))
+        .where(column("rate") > 0)
+        .union_all(select(literal(base.upper(), String(3)), column("day"), literal(1)).select_from(text("fx_load")).distinct())
+        .subquery("loaded")
+    )
+    stmt = insert(rates).from_select(["currency", "day", "rate"], select(loaded))
+    result = db.execute(stmt.on_conflict_do_update(
+        index_elements=[rates.c.currency, rates.c.day],
+        set_={"rate": stmt.excluded.rate, "derived": False},
+        where=rates.c.derived
+    ))
+    return result.rowcount  # type: ignore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load exchange rates from a date,currency,rate CSV file.")
+    parser.add_argument("command", choices=["load"])
+    parser.add_argument("path", help="CSV file, rates as units of the currency per unit of the base")
+    parser.add_argument("--base", default="EUR", help="The currency the rates are quoted against")
+    args = parser.parse_args()
+
+    db = database.SessionLocal()
+    try:
+        with open(args.path, newline="") as file:
+            added = load(db, file, args.base)
+        db.commit()
+        print(f"Loaded {added} exchange rates")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
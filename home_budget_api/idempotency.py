@@ -0,0 +1,87 @@
+"""Idempotency keys of the write endpoints that take one (POST /expenses/batch).
+
+A client retrying a request sends the same Idempotency-Key header. The first
+request with a key claims it by inserting its row in its own transaction and
+stores its response there before committing, so a retry gets the stored
+response back instead of running again. A retry that arrives while the first
+request is still running waits on the row's primary key and then finds the
+response. A request that fails rolls back and takes its claim with it, so it
+can be retried as is. Keys expire after IDEMPOTENCY_KEY_TTL seconds and are
+then free to be claimed again; purge them from cron:
+
+    python -m home_budget_api.idempotency purge
+"""
+import argparse
+import hashlib
+import os
+from datetime import timedelta
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+
+keys = models.IdempotencyKey.__table__
+
+
+def request_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def _expired():
+    return keys.c.created_at < func.now() - timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+
+
+async def claim(db: database.AnySession, user_id: int, key: str, fingerprint: str):
+    """Claim the key for this request and return None, or return the row
+    (request_hash, status_code, response) of the request that has it."""
+    stmt = insert(keys).values(user_id=user_id, key=key, request_hash=fingerprint)
+    claimed = await db.scalar(
+        stmt.on_conflict_do_update(
+            index_elements=[keys.c.user_id, keys.c.key],
+            set_={"request_hash": stmt.excluded.request_hash, "status_code": None, "response": None, "created_at": func.now()},
+            where=_expired()
+        )
+        .returning(keys.c.key)
+    )
+    if claimed is not None:
+        return None
+    return (await db.execute(
+        select(keys.c.request_hash, keys.c.status_code, keys.c.response)
+        .where(keys.c.user_id == user_id, keys.c.key == key)
+    )).one()
+
+
+async def store(db: database.AnySession, user_id: int, key: str, status_code: int, response: dict) -> None:
+    """Keep the response of the claiming request; commits with its transaction."""
+    await db.execute(
+        update(keys)
+        .where(keys.c.user_id == user_id, keys.c.key == key)
+        .values(status_code=status_code, response=response)
+    )
+
+
+def purge(db: Session) -> int:
+    """Delete the expired keys; returns how many."""
+    return db.execute(delete(keys).where(_expired())).rowcount  # type: ignore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge expired idempotency keys.")
+    parser.add_argument("command", choices=["purge"])
+    parser.parse_args()
+
+    db = database.SessionLocal()
+    try:
+        purged = purge(db)
+        db.commit()
+        print(f"Purged {purged} idempotency keys")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Per-request performance metrics: latency, SQL statement count and time.
+
+With PERF_METRICS=1 a middleware times every request, and cursor hooks on
+both engines count the statements the request runs and the time they take.
+The hooks find the request through a context variable, which both the
+threadpool (DB_ASYNC=0) and the asyncpg greenlets inherit. Per route
+(method and path template) the totals are served in the Prometheus text format
+at GET /metrics; statements slower than PERF_SLOW_QUERY_MS are also kept as
+samples (SQL without parameters) for GET /metrics/slow-queries. With
+PERF_SERVER_TIMING=1 every response carries a Server-Timing header with the
+request's database time and statement count, for the browser dev tools.
+
+With PERF_METRICS=0 (the default) neither the middleware nor the hooks are
+installed, so requests pay nothing for it. Like the pool and cache counters
+the metrics are per worker process; each worker has to be scraped on its own
+(or run one worker per container) to see all requests.
+"""
+import os
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from . import database
+
+PERF_METRICS = os.getenv("PERF_METRICS", "0") == "1"
+PERF_SERVER_TIMING = os.getenv("PERF_SERVER_TIMING", "0") == "1"
+PERF_SLOW_QUERY_MS = float(os.getenv("PERF_SLOW_QUERY_MS", "100"))
+PERF_SLOW_QUERY_SAMPLES = int(os.getenv("PERF_SLOW_QUERY_SAMPLES", "50"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+# Requests that matched no API route (docs, 404s) share one label, so
+# scanners cannot grow the metrics without bound.
+OTHER_ROUTE = "other"
+
+
+class RequestStats:
+    """Statements of the current request, filled in by the cursor hooks."""
+
+    __slots__ = ("statements", "db_seconds", "slow")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.slow: list = []
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("perf_request_stats", default=None)
+
+
+class Histogram:
+    """Cumulative buckets on output, as Prometheus expects them."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> list:
+        lines, cumulative = [], 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {round(self.sum, 6)}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RouteStats:
+    def __init__(self):
+        self.responses: dict = {}
+        self.duration = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+        self.slow_statements = 0
+
+
+class Registry:
+    """Totals per route. Requests are recorded on the event loop, so unlocked."""
+
+    def __init__(self, slow_samples: int = PERF_SLOW_QUERY_SAMPLES):
+        self.routes: dict = {}
+        self.slow_samples: deque = deque(maxlen=slow_samples)
+
+    def record(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        route_stats = self.routes.get((method, route))
+        if route_stats is None:
+            route_stats = self.routes[(method, route)] = RouteStats()
+        route_stats.responses[status] = route_stats.responses.get(status, 0) + 1
+        route_stats.duration.observe(seconds)
+        route_stats.statements.observe(stats.statements)
+        route_stats.db_seconds += stats.db_seconds
+        if stats.slow:
+            route_stats.slow_statements += len(stats.slow)
+            for statement, duration in stats.slow:
+                self.slow_samples.append({
+                    "method": method,
+                    "route": route,
+                    "duration_ms": round(duration * 1000, 3),
+                    "statement": statement,
+                    "at": datetime.now(timezone.utc).isoformat()
+                })
+
+    def render(self) -> str:
+        metrics = {
+            "http_requests_total": ("counter", "Responses by route and status code.", []),
+            "http_request_duration_seconds": ("histogram", "Time from request to the end of the response body.", []),
+            "db_statements_per_request": ("histogram", "SQL statements run by one request.", []),
+            "db_statement_duration_seconds_total": ("counter", "Time spent executing SQL statements.", []),
+            "db_slow_statements_total": ("counter", f"SQL statements slower than {PERF_SLOW_QUERY_MS} ms.", [])
+        }
+        for (method, route), stats in sorted(self.routes.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            for status, count in sorted(stats.responses.items()):
+                metrics["http_requests_total"][2].append(f'http_requests_total{{{labels},status="{status}"}} {count}')
+            metrics["http_request_duration_seconds"][2].extend(stats.duration.lines("http_request_duration_seconds", labels))
+            metrics["db_statements_per_request"][2].extend(stats.statements.lines("db_statements_per_request", labels))
+            metrics["db_statement_duration_seconds_total"][2].append(
+                f"db_statement_duration_seconds_total{{{labels}}} {round(stats.db_seconds, 6)}"
+            )
+            metrics["db_slow_statements_total"][2].append(f"db_slow_statements_total{{{labels}}} {stats.slow_statements}")
+
+        lines = []
+        for name, (kind, help_text, samples) in metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._perf_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, "_perf_started", None)
+    if stats is None or started is None:
+        return
+    seconds = time.perf_counter() - started
+    stats.statements += 1
+    stats.db_seconds += seconds
+    if seconds * 1000 >= PERF_SLOW_QUERY_MS:
+        stats.slow.append((statement[:2000], seconds))
+
+
+def server_timing(stats: RequestStats, seconds: float) -> str:
+    return (
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.statements} statements", '
+        f"app;dur={seconds * 1000:.1f}"
+    )
+
+
+class PerfMiddleware:
+    """Times the request and records it with its statements under the route
+    it matched. A plain ASGI middleware, so streaming responses pass through
+    unbuffered; their Server-Timing covers what ran before the first byte."""
+
+    def __init__(self, app, server_timing_header: bool = PERF_SERVER_TIMING):
+        self.app = app
+        self.server_timing_header = server_timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing_header:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", server_timing(stats, time.perf_counter() - started)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            registry.record(
+                scope["method"], route.path if route is not None else OTHER_ROUTE,
+                status, time.perf_counter() - started, stats
+            )
+
+
+def install(app) -> None:
+    """Add the middleware and the cursor hooks on both engines."""
+    for engine in (database.engine, database.async_engine.sync_engine):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    app.add_middleware(PerfMiddleware)
@@ -1,33 +1,41 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .database import engine, Base
-from .routers import categories, expenses, auth
-from sqlalchemy.orm import Session
-from . import models, database
+from .routers import categories, expenses, auth, budgets, recurring, metrics
+from . import instrumentation, partitions, passwords, ratelimit, recurring as recurring_expenses
 
 
+# Nothing here touches the database: the schema and the preset categories are
+# set up once by setup_db.py, not by every worker as it starts, and the pools
+# connect on the first request.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    if partitions.PARTITION_MAINTENANCE_INTERVAL > 0:
+        tasks.append(asyncio.create_task(partitions.maintain()))
+    if recurring_expenses.RECURRING_INTERVAL > 0:
+        tasks.append(asyncio.create_task(recurring_expenses.schedule()))
+    yield
+    for task in tasks:
+        task.cancel()
+    passwords.shutdown()
 
-Base.metadata.create_all(bind=engine)
 
-
-PRESET_CATEGORIES = ["food", "car", "recreation"]
-
-def create_preset_categories():
-    db: Session = database.SessionLocal()
-    try:
-        for name in PRESET_CATEGORIES:
-            exists = db.query(models.Category).filter(models.Category.name == name, models.Category.user_id == None).first()
-            if not exists:
-                db.add(models.Category(name=name))
-        db.commit()
-    finally:
-        db.close()
-
-create_preset_categories()
-
-
-app = FastAPI(title="Home Budget API", version="1.0.0")
+app = FastAPI(title="Home Budget API", version="1.0.0", lifespan=lifespan)
 
 app.include_router(auth.router)
 app.include_router(categories.router)
 app.include_router(expenses.router)
+app.include_router(budgets.router)
+app.include_router(recurring.router)
+# Unauthenticated and about the whole process (SQL text, pool and cache use),
+# so only served when asked for.
+if instrumentation.PERF_METRICS:
+    app.include_router(metrics.router)
+
+if ratelimit.RATE_LIMIT_BACKEND != "none":
+    ratelimit.install(app)
+# Added last, so it is the outermost middleware and times rate limited requests too.
+if instrumentation.PERF_METRICS:
+    instrumentation.install(app)
 
@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, Numeric, Date, ForeignKey, TIMESTAMP, func
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, Computed, Integer, String, Numeric, Date, ForeignKey, TIMESTAMP, Index, UniqueConstraint, event, func, text
+from sqlalchemy.dialects.postgresql import JSON, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
+from . import partitions
 from .database import Base
 
 class User(Base):
@@ -8,6 +10,8 @@ class User(Base):
     username = Column(String(50), unique=True, nullable=False)
     password_hash = Column(String, nullable=False)
     initial_balance = Column(Numeric(12, 2), default=1000)
+    # ISO 4217 code of the balance and the budgets; set at registration
+    currency = Column(String(3), nullable=False, server_default="EUR")
     created_at = Column(TIMESTAMP, server_default=func.now())
 
     categories = relationship("Category", back_populates="user")
@@ -20,22 +24,153 @@ class Category(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_categories_user_id", "user_id"),
+        # Preset lookups (user_id IS NULL) only touch the handful of global rows;
+        # unique so setup_db can seed them with INSERT ... ON CONFLICT.
+        Index("ix_categories_preset_name", "name", unique=True, postgresql_where=text("user_id IS NULL")),
+    )
+
     user = relationship("User", back_populates="categories")
+    # Deleting a category is left to ON DELETE CASCADE in the database; the
+    # ORM never loads the expenses to delete or orphan them.
     expenses = relationship(
         "Expense",
         back_populates="category",
-        cascade="all, delete-orphan",
-        passive_deletes=True
+        passive_deletes="all"
     )
 
 class Expense(Base):
+    """Partitioned by month on `date` (see partitions.py). The primary key has
+    to include the partition key; ids still come from one sequence."""
     __tablename__ = "expenses"
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     description = Column(String, nullable=False)
+    # In `currency`, which need not be the user's (see fx.py)
     amount = Column(Numeric(12, 2), nullable=False)
-    date = Column(Date, server_default=func.current_date())
+    currency = Column(String(3), nullable=False, server_default="EUR")
+    # The amount in the user's currency, rounded to cents as the balance was
+    # debited; NULL when `currency` is the user's (see fx.py)
+    converted_amount = Column(Numeric(12, 2), nullable=True)
+    date = Column(Date, primary_key=True, server_default=func.current_date())
     category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"))
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    # The recurring expense this one was posted for, if any (see recurring.py)
+    recurrence_id = Column(Integer, ForeignKey("recurring_expenses.id", ondelete="SET NULL"), nullable=True)
+    # The words of the description for search (list_expenses q=), kept up to
+    # date by Postgres. Parsing them per row instead costs more than reading
+    # the row; the ORM only loads them when asked to.
+    description_search = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', description)", persisted=True)))
+
+    __table_args__ = (
+        # Listing, keyset pagination and date windows: WHERE user_id = ? [AND date ...] ORDER BY date, id
+        Index("ix_expenses_user_id_date_id", "user_id", "date", "id"),
+        # Category filters and the ON DELETE CASCADE from categories
+        Index("ix_expenses_category_id_user_id_date", "category_id", "user_id", "date"),
+        # Searches for words too rare to find among a user's newest expenses
+        Index("ix_expenses_description_search", "description_search", postgresql_using="gin"),
+        # One expense per occurrence of a recurring expense, so posting them
+        # again is a no-op; also serves the ON DELETE SET NULL.
+        Index("uq_expenses_recurrence_id_date", "recurrence_id", "date", unique=True),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
 
     user = relationship("User", back_populates="expenses")
     category = relationship("Category", back_populates="expenses")
+
+event.listen(Expense.__table__, "after_create", partitions.install)
+
+class ExpenseDailyTotal(Base):
+    """Spending per user, category, day and currency, maintained by the expense write paths."""
+    __tablename__ = "expense_daily_totals"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    currency = Column(String(3), primary_key=True)
+    total = Column(Numeric(14, 2), nullable=False, default=0)
+    # The expenses' converted amounts added up, in the user's currency
+    converted = Column(Numeric(14, 2), nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # ON DELETE CASCADE from categories
+        Index("ix_expense_daily_totals_category_id", "category_id"),
+    )
+
+
+class Budget(Base):
+    """A monthly spending limit on one category (the user's own or a preset)."""
+    __tablename__ = "budgets"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=False)
+    amount = Column(Numeric(12, 2), nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+    __table_args__ = (
+        # One budget per category; the expense write paths look them up by both.
+        UniqueConstraint("user_id", "category_id", name="uq_budgets_user_id_category_id"),
+        # ON DELETE CASCADE from categories
+        Index("ix_budgets_category_id", "category_id"),
+    )
+
+    category = relationship("Category")
+
+
+class BudgetSpend(Base):
+    """Spending per budget and month, maintained by the expense write paths (see budgets.py)."""
+    __tablename__ = "budget_spend"
+    budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="CASCADE"), primary_key=True)
+    month = Column(Date, primary_key=True)
+    spent = Column(Numeric(14, 2), nullable=False, default=0)
+
+
+class RecurringExpense(Base):
+    """An expense posted on every date of an RFC 5545 recurrence rule (see recurring.py)."""
+    __tablename__ = "recurring_expenses"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=False)
+    description = Column(String, nullable=False)
+    amount = Column(Numeric(12, 2), nullable=False)
+    rule = Column(String(500), nullable=False)
+    start_date = Column(Date, nullable=False)
+    # The first date not posted yet; NULL once the rule has no more.
+    next_date = Column(Date, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_recurring_expenses_user_id", "user_id"),
+        # ON DELETE CASCADE from categories
+        Index("ix_recurring_expenses_category_id", "category_id"),
+        # The scheduler's scan for due recurrences
+        Index("ix_recurring_expenses_next_date", "next_date", postgresql_where=text("next_date IS NOT NULL")),
+    )
+
+    category = relationship("Category")
+
+
+class IdempotencyKey(Base):
+    """The response of a request sent with an Idempotency-Key (see idempotency.py)."""
+    __tablename__ = "idempotency_keys"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    response = Column(JSON, nullable=True)
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        # Purging expired keys
+        Index("ix_idempotency_keys_created_at", "created_at"),
+    )
+
+
+class FxRate(Base):
+    """Units of `currency` per unit of the base currency on `day` (see fx.py)."""
+    __tablename__ = "fx_rates"
+    currency = Column(String(3), primary_key=True)
+    day = Column(Date, primary_key=True)
+    rate = Column(Numeric(18, 8), nullable=False)
+    # Carried over from the previous quoted day, until a quote is loaded
+    derived = Column(Boolean, nullable=False, server_default=text("false"))
@@ -0,0 +1,224 @@
+"""Monthly range partitions of `expenses` on `date`.
+
+Every calendar month has a partition of its own (expenses_y2026m10). The
+months are contiguous, expenses_archive holds everything dated before the
+first one and expenses_future everything after the last one. Date filters let
+the planner skip whole months, vacuum and index maintenance work one month at
+a time, and an old month can be detached or dropped instead of deleted row by
+row. There is deliberately no DEFAULT partition: it could hold any date, which
+stops the planner from reading the months in order and stopping early for
+`ORDER BY date DESC LIMIT n`, so every keyset page would open every month.
+
+New months are carved out of expenses_future ahead of time by the
+ensure_expense_partitions() database function, which covers the current month
+through PARTITION_MONTHS_AHEAD months ahead. setup_db.py runs it on deploy,
+the app within a minute of starting and then every
+PARTITION_MAINTENANCE_INTERVAL seconds; it can also be run from cron.
+Backdated rows stay in expenses_archive until `extend` splits their months out:
+
+    python -m home_budget_api.partitions ensure [--months-ahead N]
+    python -m home_budget_api.partitions extend --from 2015-01-01 [--to 2030-12-01]
+    python -m home_budget_api.partitions list
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+from datetime import date
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from . import database
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "86400"))
+
+# The catch-alls meet at month_start until months are added between them.
+CREATE_CATCH_ALL_PARTITIONS = [
+    "CREATE TABLE expenses_archive PARTITION OF expenses FOR VALUES FROM (MINVALUE) TO ('{month_start}')",
+    "CREATE TABLE expenses_future PARTITION OF expenses FOR VALUES FROM ('{month_start}') TO (MAXVALUE)"
+]
+
+# Moves the month's rows out of a detached catch-all into a new partition.
+# Generated columns are computed again on insert, so they are left out.
+CREATE_MONTH_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_expense_month(source text, month_start date) RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    next_month date := (month_start + interval '1 month')::date;
+    partition_name text := 'expenses_' || to_char(month_start, '"y"YYYY"m"MM');
+    columns text;
+BEGIN
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO columns
+    FROM pg_attribute
+    WHERE attrelid = 'expenses'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE expenses INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)', partition_name
+    );
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE date >= $1 AND date < $2 RETURNING %s) '
+        'INSERT INTO %I (%s) SELECT * FROM moved', source, columns, partition_name, columns
+    ) USING month_start, next_month;
+    EXECUTE format(
+        'ALTER TABLE expenses ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, next_month
+    );
+END
+$$
+"""
+
+# Detaching a catch-all locks `expenses` exclusively until the transaction
+# ends, so this only happens when a month is actually missing. Returns the
+# number of months created.
+EXTEND_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION extend_expense_partitions(first_month date, last_month date) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    covered_from date;
+    covered_to date;
+    month_start date;
+    created integer := 0;
+BEGIN
+    -- App workers and cron may run this at the same time.
+    PERFORM pg_advisory_xact_lock(hashtext('extend_expense_partitions'));
+    first_month := date_trunc('month', first_month)::date;
+    last_month := date_trunc('month', last_month)::date;
+    SELECT substring(pg_get_expr(relpartbound, oid) FROM 'TO \(''(.*)''\)')::date INTO covered_from
+    FROM pg_class WHERE oid = 'expenses_archive'::regclass;
+    SELECT substring(pg_get_expr(relpartbound, oid) FROM 'FROM \(''(.*)''\)')::date INTO covered_to
+    FROM pg_class WHERE oid = 'expenses_future'::regclass;
+
+    IF last_month >= covered_to THEN
+        ALTER TABLE expenses DETACH PARTITION expenses_future;
+        FOR month_start IN SELECT generate_series(covered_to, last_month, interval '1 month')::date LOOP
+            PERFORM create_expense_month('expenses_future', month_start);
+            created := created + 1;
+        END LOOP;
+        EXECUTE format(
+            'ALTER TABLE expenses ATTACH PARTITION expenses_future FOR VALUES FROM (%L) TO (MAXVALUE)',
+            (last_month + interval '1 month')::date
+        );
+    END IF;
+
+    IF first_month < covered_from THEN
+        ALTER TABLE expenses DETACH PARTITION expenses_archive;
+        FOR month_start IN SELECT generate_series(first_month, covered_from - 1, interval '1 month')::date LOOP
+            PERFORM create_expense_month('expenses_archive', month_start);
+            created := created + 1;
+        END LOOP;
+        EXECUTE format(
+            'ALTER TABLE expenses ATTACH PARTITION expenses_archive FOR VALUES FROM (MINVALUE) TO (%L)',
+            first_month
+        );
+    END IF;
+    RETURN created;
+END
+$$
+"""
+
+ENSURE_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_expense_partitions(months_ahead integer) RETURNS integer
+LANGUAGE sql AS $$
+    SELECT extend_expense_partitions(current_date, (current_date + make_interval(months => months_ahead))::date)
+$$
+"""
+
+FUNCTIONS = [CREATE_MONTH_FUNCTION, EXTEND_FUNCTION, ENSURE_FUNCTION]
+
+LIST_PARTITIONS = """
+SELECT c.relname AS name,
+       pg_get_expr(c.relpartbound, c.oid) AS bounds,
+       greatest(c.reltuples, 0)::bigint AS estimated_rows,
+       pg_total_relation_size(c.oid) AS total_bytes
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'expenses'::regclass
+ORDER BY c.relname
+"""
+
+
+def create_partitions(connection: Connection, month_start: date) -> None:
+    """The catch-all partitions around `month_start` and the maintenance functions."""
+    for ddl in CREATE_CATCH_ALL_PARTITIONS:
+        connection.execute(text(ddl.format(month_start=month_start.replace(day=1).isoformat())))
+    for ddl in FUNCTIONS:
+        connection.execute(text(ddl))
+
+
+def install(target, connection: Connection, **kw) -> None:
+    """after_create hook of the expenses table, so create_all() yields a table
+    ready for rows: the catch-alls, the functions and the coming months."""
+    create_partitions(connection, date.today())
+    ensure(connection)
+
+
+def ensure(connection: Connection, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """Create the months up to months_ahead that are missing; returns how many were created."""
+    return connection.execute(
+        text("SELECT ensure_expense_partitions(:months_ahead)"), {"months_ahead": months_ahead}
+    ).scalar_one()
+
+
+def extend(connection: Connection, first_month: date, last_month: date) -> int:
+    """Give every month from first_month to last_month its own partition."""
+    return connection.execute(
+        text("SELECT extend_expense_partitions(:first_month, :last_month)"),
+        {"first_month": first_month, "last_month": last_month}
+    ).scalar_one()
+
+
+def list_partitions(connection: Connection) -> list:
+    return connection.execute(text(LIST_PARTITIONS)).all()
+
+
+def _run(engine: Engine, fn, *args) -> int:
+    with engine.begin() as connection:
+        return fn(connection, *args)
+
+
+async def maintain(interval: float = PARTITION_MAINTENANCE_INTERVAL) -> None:
+    """Background task of the app: ensure the partitions soon and then every interval.
+
+    The first check waits a random part of a minute, so workers starting
+    together neither delay their startup nor run it all at once.
+    """
+    await asyncio.sleep(random.uniform(0, min(interval, 60)))
+    while True:
+        try:
+            created = await run_in_threadpool(_run, database.engine, ensure)
+            if created:
+                logger.info("Created %d expense partitions", created)
+        except Exception:
+            logger.warning("Expense partition maintenance failed", exc_info=True)
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the monthly partitions of the expenses table.")
+    parser.add_argument("command", choices=["ensure", "extend", "list"])
+    parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    parser.add_argument("--from", dest="first_month", type=date.fromisoformat, help="extend: first month")
+    parser.add_argument("--to", dest="last_month", type=date.fromisoformat, default=date.today(), help="extend: last month")
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        print(f"Created {_run(database.engine, ensure, args.months_ahead)} partitions")
+        return
+    if args.command == "extend":
+        if args.first_month is None:
+            parser.error("extend needs --from")
+        print(f"Created {_run(database.engine, extend, args.first_month, args.last_month)} partitions")
+        return
+
+    with database.engine.connect() as connection:
+        for row in list_partitions(connection):
+            print(f"{row.name:<20} {row.bounds:<55} ~{row.estimated_rows} rows, {row.total_bytes // 1024} KiB")
+
+
+if __name__ == "__main__":
+    main()
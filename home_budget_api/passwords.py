@@ -0,0 +1,83 @@
+"""Password hashing on a dedicated process pool.
+
+bcrypt is deliberately CPU-expensive. Running it in worker processes keeps the
+event loop responsive and spreads logins over several cores. At most
+PASSWORD_HASH_MAX_PENDING hashes are queued per API worker; beyond that callers
+get PasswordHasherBusy instead of an ever-growing queue.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# 0 hashes on the threadpool of the API process instead of a process pool.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 8)))
+
+# Hashes made with other rounds still verify; needs_update() flags them so
+# they are replaced on the next successful login.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashes are already queued."""
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, password_hash)
+
+
+_executor: Optional[Executor] = None
+_pending = 0
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        # spawn rather than fork: the API process holds threads, an event loop
+        # and database connections that must not be duplicated.
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        raise PasswordHasherBusy()
+
+    _pending += 1
+    try:
+        if PASSWORD_HASH_WORKERS == 0:
+            return await run_in_threadpool(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+    """Check a password. The second item is a replacement hash when the stored
+    one was made with outdated settings (e.g. a different BCRYPT_ROUNDS)."""
+    return await _run(_verify_and_update, password, password_hash)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
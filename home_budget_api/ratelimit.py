@@ -0,0 +1,347 @@
+"""Token bucket rate limits per user, checked before a request reaches a route.
+
+Every request takes a token from the bucket of its client under the default
+limit (RATE_LIMIT_DEFAULT) and, for the routes listed in RATE_LIMIT_ROUTES,
+from that route's bucket too. A limit "N/S" holds up to N tokens and refills
+N every S seconds, so a client can burst N requests and then sustain N/S a
+second. A request takes its tokens only when every one of its buckets has
+one, so a refused request costs the client nothing. A signed-in user also
+gets at most RATE_LIMIT_CONCURRENCY requests in progress at once on a
+worker, so a few slow requests cannot hold all of its database connections.
+A request over a limit is answered 429 with Retry-After by a plain ASGI
+middleware in front of the routers: it never reaches a dependency, so it
+opens no database session and verifies no password.
+
+The client is the user id of a valid bearer token (decoded through the
+token cache of routers.auth), otherwise the client address, as for login and
+register. Everyone behind one NAT or proxy address shares that address's
+buckets until they sign in, so the concurrency cap is not applied to
+addresses at all, and their limits should allow for a whole office signing
+in at once. Behind a reverse proxy, run uvicorn with --proxy-headers (and
+--forwarded-allow-ips) so the address is the real client's rather than the
+proxy's.
+
+Backends:
+    none    no limits; the middleware is not installed (the default, so a
+            deployment opts in with limits that fit its clients).
+    memory  buckets in an in-process LRU. Each worker process has its own
+            buckets, so with N workers a client gets up to N times the limit.
+    redis   buckets shared by all workers on a Redis-compatible server at
+            RATE_LIMIT_URL (needs the `redis` package), updated by a Lua
+            script. A failing server lets requests through rather than
+            failing them.
+"""
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "none")
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", cache.CACHE_URL)
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "100/10")
+# Login and register verify or hash a password; the others are the reports a
+# client is most likely to poll.
+RATE_LIMIT_ROUTES = os.getenv(
+    "RATE_LIMIT_ROUTES",
+    "POST /auth/login=10/60,POST /auth/register=5/60,GET /expenses/summary=20/10,"
+    "GET /expenses/timeseries=10/10,GET /expenses/export=5/60"
+)
+RATE_LIMIT_CONCURRENCY = int(os.getenv("RATE_LIMIT_CONCURRENCY", "4"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+DEFAULT_LIMIT = "all"
+CONCURRENCY_LIMIT = "concurrency"
+
+
+class Limit:
+    """Up to `capacity` requests at once, refilled at `rate` a second."""
+
+    __slots__ = ("capacity", "rate")
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        try:
+            count, seconds = (float(part) for part in value.split("/"))
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {value!r}, expected requests/seconds such as 10/60") from None
+        if count < 1 or seconds <= 0:
+            raise ValueError(f"Invalid rate limit {value!r}, expected at least 1 request in a positive period")
+        return cls(count, count / seconds)
+
+
+def parse_routes(value: str) -> dict:
+    """"METHOD /path=N/S,..." as {(method, path): Limit}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, _, limit = item.rpartition("=")
+        method, _, path = route.strip().partition(" ")
+        if not method or not path:
+            raise ValueError(f"Invalid route rate limit {item!r}, expected METHOD /path=N/S")
+        limits[(method.upper(), path.strip())] = Limit.parse(limit)
+    return limits
+
+
+class LimiterStats:
+    """Counters reported by GET /metrics/ratelimit, per limit."""
+
+    def __init__(self):
+        self.allowed: dict = {}
+        self.limited: dict = {}
+        self.evictions = 0
+        self.errors = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "limits": {
+                name: {"allowed": self.allowed.get(name, 0), "limited": self.limited.get(name, 0)}
+                for name in sorted(self.allowed.keys() | self.limited.keys())
+            },
+            "evictions": self.evictions,
+            "errors": self.errors
+        }
+
+
+class MemoryLimiter:
+    """Buckets in an LRU; an evicted bucket starts full again. Only used from
+    the event loop, so unlocked."""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> (tokens, monotonic time they were counted)
+        self.buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self.stats = LimiterStats()
+
+    async def acquire(self, buckets: list) -> list:
+        """Take a token from each (key, limit) bucket if all of them have one.
+
+        Returns the seconds until each bucket has a token, all 0 when they
+        were taken.
+        """
+        now = time.monotonic()
+        counted = []
+        for key, limit in buckets:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                counted.append(limit.capacity)
+            else:
+                counted.append(min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate))
+        waits = [max(0.0, (1 - tokens) / limit.rate) for tokens, (_, limit) in zip(counted, buckets)]
+        taken = 0 if any(waits) else 1
+        for tokens, (key, _) in zip(counted, buckets):
+            self.buckets[key] = (tokens - taken, now)
+            self.buckets.move_to_end(key)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+            self.stats.evictions += 1
+        return waits
+
+    def status(self) -> dict:
+        return {"buckets": len(self.buckets), **self.stats.snapshot()}
+
+
+# KEYS the buckets, ARGV the capacity and rate of each in turn. The server's
+# clock is shared by all workers. Returns the seconds to wait per bucket as
+# strings, Lua numbers being truncated to integers on the way out.
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local counted, waits = {}, {}
+local taken = 1
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local at = tonumber(bucket[2]) or now
+    counted[i] = math.min(capacity, tokens + math.max(0, now - at) * rate)
+    waits[i] = 0
+    if counted[i] < 1 then
+        waits[i] = (1 - counted[i]) / rate
+        taken = 0
+    end
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', counted[i] - taken, 'at', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+    waits[i] = tostring(waits[i])
+end
+return waits
+"""
+
+
+class RedisLimiter:
+    """Buckets as hashes on a Redis-compatible server, expiring once full.
+
+    `client` needs the register_script of redis.asyncio.Redis.
+    """
+
+    name = "redis"
+
+    def __init__(self, client: Any, prefix: str = "home_budget:ratelimit:"):
+        self.script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.prefix = prefix
+        self.stats = LimiterStats()
+
+    async def acquire(self, buckets: list) -> list:
+        args = [value for _, limit in buckets for value in (limit.capacity, limit.rate)]
+        try:
+            waits = await self.script(keys=[self.prefix + key for key, _ in buckets], args=args)
+            return [float(wait) for wait in waits]
+        except Exception:
+            logger.warning("Rate limit check failed", exc_info=True)
+            self.stats.errors += 1
+            return [0.0] * len(buckets)
+
+    def status(self) -> dict:
+        return self.stats.snapshot()
+
+
+class NullLimiter:
+    name = "none"
+
+    def __init__(self):
+        self.stats = LimiterStats()
+
+    async def acquire(self, buckets: list) -> list:
+        return [0.0] * len(buckets)
+
+    def status(self) -> dict:
+        return self.stats.snapshot()
+
+
+def create_backend(name: str = RATE_LIMIT_BACKEND):
+    if name == "memory":
+        return MemoryLimiter()
+    if name == "redis":
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the redis package installed")
+        return RedisLimiter(redis.asyncio.from_url(RATE_LIMIT_URL))
+    if name == "none":
+        return NullLimiter()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND {name!r}, expected memory, redis or none")
+
+
+backend = create_backend()
+
+
+def set_backend(new_backend) -> None:
+    """Swap the backend, e.g. for a RedisLimiter around a fake client."""
+    global backend
+    backend = new_backend
+
+
+def client_key(scope) -> str:
+    """The user id of a valid bearer token, else the client address."""
+    from .routers.auth import decode_access_token
+
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                try:
+                    return f"user:{decode_access_token(token)['sub']}"
+                except HTTPException:
+                    pass
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def too_many_requests(wait: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Too many requests"}, status_code=429, headers={"Retry-After": str(max(math.ceil(wait), 1))}
+    )
+
+
+class RateLimitMiddleware:
+    """Answers 429 when a signed-in client has `concurrency` requests in
+    progress or the client's bucket of the route or of the default limit is
+    empty; otherwise passes the request on untouched."""
+
+    def __init__(self, app, default: Optional[Limit], route_limits: list, concurrency: int = RATE_LIMIT_CONCURRENCY):
+        self.app = app
+        self.default = default
+        # (route, name, limit) of the routes with a limit of their own
+        self.route_limits = route_limits
+        self.concurrency = concurrency
+        # client -> requests in progress on this worker
+        self.in_progress: dict = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limits = [
+            (name, limit) for route, name, limit in self.route_limits
+            if route.matches(scope)[0] == Match.FULL
+        ]
+        if self.default is not None:
+            limits.append((DEFAULT_LIMIT, self.default))
+        client = client_key(scope)
+        stats = backend.stats
+        capped = self.concurrency > 0 and client.startswith("user:")
+        if capped:
+            if self.in_progress.get(client, 0) >= self.concurrency:
+                stats.limited[CONCURRENCY_LIMIT] = stats.limited.get(CONCURRENCY_LIMIT, 0) + 1
+                await too_many_requests(1)(scope, receive, send)
+                return
+            stats.allowed[CONCURRENCY_LIMIT] = stats.allowed.get(CONCURRENCY_LIMIT, 0) + 1
+        if limits:
+            waits = await backend.acquire([(f"{name}:{client}", limit) for name, limit in limits])
+            for (name, _), wait in zip(limits, waits):
+                counts = stats.limited if wait > 0 else stats.allowed
+                counts[name] = counts.get(name, 0) + 1
+            if any(waits):
+                await too_many_requests(max(waits))(scope, receive, send)
+                return
+
+        if not capped:
+            await self.app(scope, receive, send)
+            return
+        self.in_progress[client] = self.in_progress.get(client, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            running = self.in_progress[client] - 1
+            if running:
+                self.in_progress[client] = running
+            else:
+                del self.in_progress[client]
+
+
+def install(app) -> None:
+    """Add the middleware for the routes of `app`; ValueError for a limit on
+    a route it does not have."""
+    route_limits = []
+    for (method, path), limit in parse_routes(RATE_LIMIT_ROUTES).items():
+        routes = [route for route in app.routes if getattr(route, "path", None) == path and method in getattr(route, "methods", ())]
+        if not routes:
+            raise ValueError(f"RATE_LIMIT_ROUTES names {method} {path}, which is not a route")
+        route_limits.extend((route, f"{method} {path}", limit) for route in routes)
+    default = Limit.parse(RATE_LIMIT_DEFAULT) if RATE_LIMIT_DEFAULT.strip() else None
+    app.add_middleware(RateLimitMiddleware, default=default, route_limits=route_limits)
+
+
+def status() -> dict:
+    return {"backend": backend.name, **backend.status()}
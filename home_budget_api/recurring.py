@@ -0,0 +1,269 @@
+"""Recurring expenses: rules that post an expense on each of their dates.
+
+A recurrence is an RFC 5545 RRULE (FREQ=MONTHLY;BYMONTHDAY=1,
+FREQ=WEEKLY;INTERVAL=2;BYDAY=FR, ...) from start_date on, expanded with
+dateutil; next_date is its first date not posted yet. Its amount is in the
+user's currency. materialize() posts the due dates of every user's
+recurrences in batches of up to RECURRING_BATCH_SIZE expenses. A batch is one
+transaction of a few set-based statements whatever its size: one INSERT of
+the expenses, one balance UPDATE covering all of its users, one upsert each
+for the rollup and the budget counters, one UPDATE of the next dates. The
+unique (recurrence_id, date) key of `expenses` makes a retried or overlapping
+run post each date at most once.
+
+Dates are posted in order while the balance covers them, as POST /expenses/
+would; the first one it does not cover stays due, holding back the later
+ones, and is tried again on the next run.
+
+The app runs it every RECURRING_INTERVAL seconds; it can also be run from cron:
+
+    python -m home_budget_api.recurring run [--today 2026-10-01]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Optional
+
+from dateutil.rrule import rrule, rrulestr
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Date, Integer, column, select, text, update
+from sqlalchemy.orm import Session
+
+from . import balances, budgets, cache, database, models, rollups
+
+logger = logging.getLogger(__name__)
+
+RECURRING_INTERVAL = float(os.getenv("RECURRING_INTERVAL", "3600"))
+RECURRING_BATCH_SIZE = int(os.getenv("RECURRING_BATCH_SIZE", "10000"))
+
+SUB_DAILY = re.compile(r"FREQ=(HOURLY|MINUTELY|SECONDLY)", re.IGNORECASE)
+COUNTED = re.compile(r"COUNT=", re.IGNORECASE)
+
+recurring = models.RecurringExpense.__table__
+
+# Inserts the batch in date order, so consecutive rows go to the same
+# partition, and returns what was inserted as rollup deltas. Dates already
+# posted for their recurrence are left out.
+INSERT_OCCURRENCES = text(
+    "WITH inserted AS ("
+    "    INSERT INTO expenses (description, amount, currency, date, category_id, user_id, recurrence_id) "
+    "    SELECT * FROM unnest("
+    "        CAST(:descriptions AS varchar[]), CAST(:amounts AS numeric[]), CAST(:currencies AS varchar[]), "
+    "        CAST(:dates AS date[]), CAST(:category_ids AS integer[]), CAST(:user_ids AS integer[]), "
+    "        CAST(:recurrence_ids AS integer[])"
+    "    ) ORDER BY 4 "
+    "    ON CONFLICT (recurrence_id, date) DO NOTHING "
+    "    RETURNING user_id, category_id, date, currency, amount"
+    ") "
+    "SELECT user_id, category_id, date, currency, sum(amount), count(*) FROM inserted "
+    "GROUP BY user_id, category_id, date, currency"
+)
+
+
+def parse_rule(rule: str, start: date) -> rrule:
+    """The rule starting at `start`. ValueError unless it is a single RRULE
+    (the "RRULE:" prefix is optional) repeating at most daily."""
+    if "DTSTART" in rule.upper() or "\n" in rule.strip():
+        raise ValueError("Give a single RRULE; start_date sets its start")
+    if SUB_DAILY.search(rule):
+        raise ValueError("The rule may repeat at most daily")
+    try:
+        parsed = rrulestr(rule.strip(), dtstart=datetime.combine(start, time()))
+    except (ValueError, TypeError, IndexError) as e:
+        raise ValueError(f"Invalid RRULE: {e}") from None
+    if not isinstance(parsed, rrule):
+        raise ValueError("Give a single RRULE")
+    return parsed
+
+
+def first_date(rule: str, start: date) -> Optional[date]:
+    moment = next(iter(parse_rule(rule, start)), None)
+    return moment.date() if moment else None
+
+
+def occurrences(rule: str, start_date: date, next_date: date, until: date, limit: int) -> tuple[list, Optional[date]]:
+    """Up to `limit` dates of the rule from next_date through until, and the
+    date after them (None when the rule has ended)."""
+    # Without COUNT a rule repeats the same way from any of its dates, so it
+    # is expanded from next_date instead of walking the history again.
+    anchor = start_date if COUNTED.search(rule) else next_date
+    dates: list = []
+    for moment in parse_rule(rule, anchor):
+        day = moment.date()
+        if day < next_date or (dates and day == dates[-1]):
+            continue
+        if day > until or len(dates) == limit:
+            return dates, day
+        dates.append(day)
+    return dates, None
+
+
+@dataclass
+class RunResult:
+    posted: int = 0
+    # Recurrences left waiting for a balance that covers their next date
+    insufficient: int = 0
+    users: set = field(default_factory=set)
+
+
+def materialize(db: Session, today: Optional[date] = None, batch_size: int = RECURRING_BATCH_SIZE) -> RunResult:
+    """Post every date due by `today`, committing each batch."""
+    today = today or date.today()
+    result = RunResult()
+    after = 0
+    while True:
+        # Overlapping runs (every app worker has one) split the recurrences
+        # between them instead of queueing on each other.
+        due = db.execute(
+            select(recurring)
+            .where(recurring.c.next_date <= today, recurring.c.id > after)
+            .order_by(recurring.c.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not due:
+            return result
+
+        # The dates each recurrence can add, until the batch is full.
+        planned = []
+        room = batch_size
+        for recurrence in due:
+            if room == 0:
+                break
+            dates, following = occurrences(recurrence.rule, recurrence.start_date, recurrence.next_date, today, room)
+            planned.append((recurrence, dates, following))
+            room -= len(dates)
+
+        # Inserting the expenses would lock their categories for key share
+        # anyway. Taking those locks now, and skipping categories a delete has
+        # locked, keeps the delete's cascade to the recurrences (locked here)
+        # from deadlocking with this batch.
+        category_ids = set(db.scalars(
+            select(models.Category.id)
+            .where(models.Category.id.in_({recurrence.category_id for recurrence, _, _ in planned}))
+            .with_for_update(read=True, key_share=True, skip_locked=True)
+        ).all())
+        balance = {}
+        currencies = {}
+        for user_id, initial_balance, currency in db.execute(
+            select(models.User.id, models.User.initial_balance, models.User.currency)
+            .where(models.User.id.in_({recurrence.user_id for recurrence, _, _ in planned}))
+        ):
+            balance[user_id] = initial_balance
+            currencies[user_id] = currency
+
+        columns: dict = {
+            name: [] for name in ("descriptions", "amounts", "currencies", "dates", "category_ids", "user_ids", "recurrence_ids")
+        }
+        next_dates: list = []
+        done = after
+        insufficient = 0
+        for recurrence, dates, following in planned:
+            if recurrence.category_id not in category_ids:
+                done = recurrence.id
+                continue
+            covered = min(len(dates), max(0, int(balance[recurrence.user_id] // recurrence.amount)))
+            balance[recurrence.user_id] -= covered * recurrence.amount
+            columns["dates"] += dates[:covered]
+            for name, value in (
+                ("descriptions", recurrence.description), ("amounts", recurrence.amount),
+                ("currencies", currencies[recurrence.user_id]), ("category_ids", recurrence.category_id), ("user_ids", recurrence.user_id),
+                ("recurrence_ids", recurrence.id)
+            ):
+                columns[name] += [value] * covered
+
+            if covered < len(dates):
+                following = dates[covered]
+                insufficient += 1
+            next_dates.append((recurrence.id, following))
+            if covered == len(dates) and following is not None and following <= today:
+                # Out of room: the rest of this recurrence goes in the next batch.
+                break
+            done = recurrence.id
+
+        posted = 0
+        totals: dict = defaultdict(Decimal)
+        deltas: dict = defaultdict(dict)
+        budget_deltas: dict = defaultdict(dict)
+        if columns["dates"]:
+            for user_id, category_id, day, currency, total, count in db.execute(INSERT_OCCURRENCES, columns):
+                totals[user_id] += total
+                # Posted in the user's currency, so converted as they are
+                deltas[user_id][(category_id, day, currency)] = (total, total, count)
+                budget_deltas[user_id][(category_id, day)] = (total, count)
+                posted += count
+
+        if totals:
+            # Debiting after the inserts and in user id order, like every write path.
+            db.execute(
+                select(models.User.id).where(models.User.id.in_(totals)).order_by(models.User.id)
+                .with_for_update(key_share=True)
+            )
+            debited = set(db.scalars(balances.debit_statement(totals)).all())
+            if debited != totals.keys():
+                # A concurrent write left too little since the balances were
+                # read: redo the batch against the new balances.
+                db.rollback()
+                continue
+            rollups.apply_many(db, deltas)
+            budgets.apply_many(db, budget_deltas)
+
+        if next_dates:
+            moved = database.unnest("moved", [column("id", Integer), column("next_date", Date)], next_dates)
+            db.execute(
+                update(recurring)
+                .where(recurring.c.id == moved.c.id)
+                .values(next_date=moved.c.next_date)
+            )
+        db.commit()
+
+        after = done
+        result.posted += posted
+        result.insufficient += insufficient
+        result.users.update(totals)
+
+
+def _run(today: Optional[date] = None) -> RunResult:
+    db = database.SessionLocal()
+    try:
+        return materialize(db, today)
+    finally:
+        db.close()
+
+
+async def schedule(interval: float = RECURRING_INTERVAL) -> None:
+    """Background task of the app: post the due dates soon and then every interval."""
+    await asyncio.sleep(random.uniform(0, min(interval, 60)))
+    while True:
+        try:
+            result = await run_in_threadpool(_run)
+            if result.posted:
+                logger.info("Posted %d recurring expenses for %d users", result.posted, len(result.users))
+                await cache.invalidate(*(cache.summary_key(user_id) for user_id in result.users))
+        except Exception:
+            logger.warning("Posting recurring expenses failed", exc_info=True)
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post the due dates of the recurring expenses.")
+    parser.add_argument("command", choices=["run"])
+    parser.add_argument("--today", type=date.fromisoformat, default=None, help="Post the dates due by this day")
+    args = parser.parse_args()
+
+    result = _run(args.today)
+    print(
+        f"Posted {result.posted} expenses for {len(result.users)} users; "
+        f"{result.insufficient} recurrences wait for a higher balance"
+    )
+
+
+if __name__ == "__main__":
+    main()
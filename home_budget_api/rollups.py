@@ -0,0 +1,191 @@
+"""Per-user, per-category, per-day spending rollup (expense_daily_totals).
+
+The expense write paths keep the rollup in step with `expenses` inside their
+own transaction, and reporting reads it instead of re-aggregating raw rows.
+Amounts are summed per currency as paid (`total`) and in the user's currency
+(`converted`, the expenses' own converted amounts; see fx.py), which reports add up.
+Run as a module to check the rollup against `expenses` or to rebuild it:
+
+    python -m home_budget_api.rollups verify [--user-id ID]
+    python -m home_budget_api.rollups rebuild [--user-id ID]
+"""
+import argparse
+import sys
+from datetime import date
+from decimal import Decimal
+from typing import Mapping, Optional
+
+from sqlalchemy import column, delete, func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+# (category_id, day, currency) -> (amount in that currency, amount in the
+# user's currency, number of expenses)
+Deltas = Mapping[tuple[int, date, str], tuple[Decimal, Decimal, int]]
+
+rollup = models.ExpenseDailyTotal.__table__
+
+
+def apply_deltas(db: Session, user_id: int, deltas: Deltas) -> None:
+    """Add amount/converted/count deltas to the user's daily totals (negative to remove)."""
+    apply_many(db, {user_id: deltas})
+
+
+def apply_many(db: Session, deltas_by_user: Mapping[int, Deltas]) -> None:
+    """apply_deltas for several users in one statement (recurring.py)."""
+    # Sorted keys give concurrent writers the same row lock order.
+    items = sorted(
+        (user_id, category_id, day, currency, amount, converted, count)
+        for user_id, deltas in deltas_by_user.items()
+        for (category_id, day, currency), (amount, converted, count) in deltas.items()
+    )
+    if not items:
+        return
+
+    columns = ["user_id", "category_id", "day", "currency", "total", "converted", "count"]
+    changed = database.unnest("changed", [column(name, rollup.c[name].type) for name in columns], items)
+    stmt = insert(rollup).from_select(columns, select(changed))
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[rollup.c.user_id, rollup.c.category_id, rollup.c.day, rollup.c.currency],
+        set_={
+            "total": rollup.c.total + stmt.excluded.total,
+            "converted": rollup.c.converted + stmt.excluded.converted,
+            "count": rollup.c.count + stmt.excluded.count
+        }
+    ))
+
+    emptied = [(user_id, category_id, day, currency) for user_id, category_id, day, currency, _, _, count in items if count < 0]
+    if emptied:
+        db.execute(delete(rollup).where(
+            tuple_(rollup.c.user_id, rollup.c.category_id, rollup.c.day, rollup.c.currency).in_(emptied),
+            rollup.c.count <= 0
+        ))
+
+
+def _amounts(expense: models.Expense) -> tuple[Decimal, Decimal]:
+    amount = Decimal(str(expense.amount))
+    converted = amount if expense.converted_amount is None else Decimal(str(expense.converted_amount))
+    return amount, converted
+
+
+def add_expense(db: Session, expense: models.Expense) -> None:
+    amount, converted = _amounts(expense)
+    key = (expense.category_id, expense.date, expense.currency)
+    apply_deltas(db, expense.user_id, {key: (amount, converted, 1)})  # type: ignore
+
+
+def remove_expense(db: Session, expense: models.Expense) -> None:
+    amount, converted = _amounts(expense)
+    key = (expense.category_id, expense.date, expense.currency)
+    apply_deltas(db, expense.user_id, {key: (-amount, -converted, -1)})  # type: ignore
+
+
+def _expense_totals(user_id: Optional[int] = None):
+    query = (
+        select(
+            models.Expense.user_id,
+            models.Expense.category_id,
+            models.Expense.date.label("day"),
+            models.Expense.currency,
+            func.sum(models.Expense.amount).label("total"),
+            func.sum(func.coalesce(models.Expense.converted_amount, models.Expense.amount)).label("converted"),
+            func.count().label("count")
+        )
+        .where(models.Expense.category_id.isnot(None), models.Expense.date.isnot(None))
+        .group_by(models.Expense.user_id, models.Expense.category_id, models.Expense.date, models.Expense.currency)
+    )
+    if user_id is not None:
+        query = query.where(models.Expense.user_id == user_id)
+    return query
+
+
+def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+    """Recompute the rollup from `expenses`; returns the number of rows written.
+
+    The table lock holds back the expense writes' rollup updates until the
+    rebuild commits, so they land on top of the rebuilt totals instead of
+    being lost or counted twice.
+    """
+    db.execute(text("LOCK TABLE expense_daily_totals IN SHARE ROW EXCLUSIVE MODE"))
+    stmt = delete(rollup)
+    if user_id is not None:
+        stmt = stmt.where(rollup.c.user_id == user_id)
+    db.execute(stmt)
+
+    result = db.execute(insert(rollup).from_select(
+        ["user_id", "category_id", "day", "currency", "total", "converted", "count"], _expense_totals(user_id)
+    ))
+    return result.rowcount  # type: ignore
+
+
+def verify(db: Session, user_id: Optional[int] = None) -> list:
+    """Return the (user_id, category_id, day, currency) rows where the rollup has drifted."""
+    expected = _expense_totals(user_id).subquery("expected")
+    actual = select(rollup)
+    if user_id is not None:
+        actual = actual.where(rollup.c.user_id == user_id)
+    actual = actual.subquery("actual")
+
+    return db.execute(
+        select(
+            func.coalesce(expected.c.user_id, actual.c.user_id).label("user_id"),
+            func.coalesce(expected.c.category_id, actual.c.category_id).label("category_id"),
+            func.coalesce(expected.c.day, actual.c.day).label("day"),
+            func.coalesce(expected.c.currency, actual.c.currency).label("currency"),
+            expected.c.total.label("expected_total"),
+            actual.c.total.label("actual_total"),
+            expected.c.converted.label("expected_converted"),
+            actual.c.converted.label("actual_converted"),
+            expected.c.count.label("expected_count"),
+            actual.c.count.label("actual_count")
+        )
+        .select_from(expected.join(
+            actual,
+            (expected.c.user_id == actual.c.user_id)
+            & (expected.c.category_id == actual.c.category_id)
+            & (expected.c.day == actual.c.day)
+            & (expected.c.currency == actual.c.currency),
+            full=True
+        ))
+        .where(
+            expected.c.total.is_distinct_from(actual.c.total)
+            | expected.c.converted.is_distinct_from(actual.c.converted)
+            | expected.c.count.is_distinct_from(actual.c.count)
+        )
+        .order_by("user_id", "category_id", "day", "currency")
+    ).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify or rebuild the expense_daily_totals rollup.")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--user-id", type=int, default=None, help="Limit to one user")
+    args = parser.parse_args()
+
+    db = database.SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rows = rebuild(db, args.user_id)
+            db.commit()
+            print(f"Rollup rebuilt: {rows} rows")
+            return
+
+        drift = verify(db, args.user_id)
+        for row in drift:
+            print(
+                f"user {row.user_id} category {row.category_id} day {row.day} {row.currency}: "
+                f"expected {row.expected_total}/{row.expected_converted}/{row.expected_count}, "
+                f"found {row.actual_total}/{row.actual_converted}/{row.actual_count}"
+            )
+        if drift:
+            print(f"Rollup drift in {len(drift)} rows")
+            sys.exit(1)
+        print("Rollup is consistent")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
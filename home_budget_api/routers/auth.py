@@ -1,15 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from typing import Optional
-from fastapi import Body
+from typing import Union
 from fastapi.security import OAuth2PasswordRequestForm
-from .. import models, schemas, database
+from .. import models, schemas, database, passwords, balances, cache
 from decimal import Decimal
-from typing import Any, cast
 import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
 
@@ -19,14 +21,6 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -36,34 +30,66 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+hasher_busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many login attempts in progress, try again shortly",
+    headers={"Retry-After": "1"},
+)
+
 
 @router.post("/register", response_model=schemas.UserResponse)
-def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
 
-    if db.query(models.User).filter(models.User.username == user.username).first():
+    if await db.scalar(select(models.User).where(models.User.username == user.username)):
         raise HTTPException(status_code=400, detail="Username already registered")
-    
+    # Give the pooled connection back while bcrypt runs.
+    await db.commit()
+
+    try:
+        password_hash = await passwords.hash_password(user.password)
+    except passwords.PasswordHasherBusy:
+        raise hasher_busy_exception
+
     db_user = models.User(
         username=user.username,
-        password_hash=hash_password(user.password),
-        initial_balance=1000.0
+        password_hash=password_hash,
+        initial_balance=1000.0,
+        currency=user.currency
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Taken by a registration that committed while this one hashed.
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Username already registered")
+    await db.refresh(db_user)
     return db_user
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    user = await db.scalar(select(models.User).where(models.User.username == form_data.username))
+    valid, new_hash = False, None
+    if user:
+        # Give the pooled connection back while bcrypt runs.
+        await db.commit()
+        try:
+            valid, new_hash = await passwords.verify_password(form_data.password, user.password_hash)  # type: ignore
+        except passwords.PasswordHasherBusy:
+            raise hasher_busy_exception
+    if not user or not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": str(user.id)})
+    if new_hash:
+        # Stored hash was made with other bcrypt settings: upgrade it now that
+        # the plain password is at hand.
+        user.password_hash = new_hash  # type: ignore
+        await db.commit()
+    access_token = create_access_token(data={"sub": str(user.id), "username": user.username, "currency": user.currency})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -71,54 +97,101 @@ from fastapi.security import OAuth2PasswordBearer
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)) -> models.User:
-    credentials_exception = HTTPException(
+# AUTH_STATELESS=1 trusts the identity claims of a valid token, so routes that
+# only scope queries by user id skip the users lookup. Routes that read the
+# balance still load the row through get_current_user.
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "0") == "1"
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+
+
+@dataclass(frozen=True)
+class TokenUser:
+    id: int
+    username: str
+    # Fixed at registration, so the token's claim cannot go stale
+    currency: str
+
+
+Principal = Union[TokenUser, models.User]
+
+# token -> (cached until, claims); the signature of a cached token is not re-verified
+_token_cache: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+
+
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def decode_access_token(token: str) -> dict:
+    now = time.time()
+    cached = _token_cache.get(token)
+    if cached and cached[0] > now:
+        _token_cache.move_to_end(token)
+        return cached[1]
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]) # type: ignore
-        user_id: Optional[str] = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    user = db.query(models.User).filter(models.User.id == int(user_id)).first()
+        _token_cache.pop(token, None)
+        raise credentials_exception()
+    if payload.get("sub") is None:
+        raise credentials_exception()
+
+    # Never cache past the token's own expiry.
+    _token_cache[token] = (min(now + TOKEN_CACHE_TTL, payload.get("exp", now + TOKEN_CACHE_TTL)), payload)
+    _token_cache.move_to_end(token)
+    if len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return payload
+
+
+async def _load_user(db: AsyncSession, user_id: int) -> models.User:
+    user = await db.get(models.User, user_id)
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     return user
 
 
-@router.patch("/me/balance", response_model=schemas.UserResponse)
-def update_balance(
-    balance_update: schemas.BalanceUpdate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
-):
-    db.refresh(current_user)
+async def get_current_principal(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)) -> Principal:
+    """The authenticated user's identity, from the token alone in stateless mode."""
+    payload = decode_access_token(token)
+    if AUTH_STATELESS and "username" in payload and "currency" in payload:
+        return TokenUser(id=int(payload["sub"]), username=payload["username"], currency=payload["currency"])
+    return await _load_user(db, int(payload["sub"]))
 
-    current_balance: Decimal = cast(Decimal, current_user.initial_balance)
-    amount_to_add = Decimal(str(balance_update.amount))
 
-    if current_balance + amount_to_add < Decimal("0"):
-        raise HTTPException(status_code=400, detail="Insufficient balance")
+async def get_current_user(principal: Principal = Depends(get_current_principal), db: AsyncSession = Depends(database.get_async_db)) -> models.User:
+    """The authenticated user's row, for routes that need more than the id."""
+    if isinstance(principal, models.User):
+        return principal
+    return await _load_user(db, principal.id)
 
-    new_balance = current_balance + amount_to_add
 
-    user_any = cast(Any, current_user)
-    user_any.initial_balance = new_balance
+@router.patch("/me/balance", response_model=schemas.UserResponse)
+async def update_balance(
+    balance_update: schemas.BalanceUpdate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    new_balance = await balances.change(db, current_user.id, Decimal(str(balance_update.amount)))
+    if new_balance is None:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
 
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    await db.commit()
+    await cache.invalidate(cache.summary_key(current_user.id))
+    return {
+        "id": current_user.id, "username": current_user.username,
+        "initial_balance": new_balance, "currency": current_user.currency
+    }
 
 
 @router.get("/userinfo", response_model=schemas.UserResponse)
-def get_me(
-    db: Session = Depends(database.get_db),
+async def get_me(
     current_user: models.User = Depends(get_current_user)
 ):
-    db.refresh(current_user)
     return current_user
\ No newline at end of file
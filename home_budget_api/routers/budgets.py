@@ -0,0 +1,137 @@
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, schemas, database, budgets
+from .auth import Principal, get_current_principal
+
+router = APIRouter(prefix="/budgets", tags=["budgets"])
+
+
+def _budget_rows(user_id: int):
+    return (
+        select(
+            models.Budget.id, models.Budget.category_id,
+            models.Category.name.label("category"), models.Budget.amount
+        )
+        .join(models.Category, models.Category.id == models.Budget.category_id)
+        .where(models.Budget.user_id == user_id)
+    )
+
+
+def _budget_response(row) -> schemas.BudgetResponse:
+    return schemas.BudgetResponse(id=row.id, category_id=row.category_id, category=row.category, amount=float(row.amount))
+
+
+@router.get("/", response_model=list[schemas.BudgetResponse])
+async def list_budgets(
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    rows = (await db.execute(_budget_rows(current_user.id).order_by(models.Budget.id))).all()
+    return [_budget_response(row) for row in rows]
+
+
+@router.post("/", response_model=schemas.BudgetResponse)
+async def create_budget(
+    budget: schemas.BudgetCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    category = await db.scalar(select(models.Category.id).where(
+        (models.Category.id == budget.category_id) &
+        ((models.Category.user_id == current_user.id) | (models.Category.user_id == None))
+    ))
+    if category is None:
+        raise HTTPException(status_code=404, detail="Category not found or not accessible")
+
+    budget_id = await db.scalar(
+        insert(models.Budget)
+        .values(user_id=current_user.id, category_id=category, amount=Decimal(str(budget.amount)))
+        .on_conflict_do_nothing(constraint="uq_budgets_user_id_category_id")
+        .returning(models.Budget.id)
+    )
+    if budget_id is None:
+        raise HTTPException(status_code=409, detail="This category already has a budget")
+
+    await budgets.start_counters(db, budget_id, current_user.id, category)
+    await db.commit()
+    row = (await db.execute(_budget_rows(current_user.id).where(models.Budget.id == budget_id))).one()
+    return _budget_response(row)
+
+
+@router.get("/status", response_model=schemas.BudgetStatusResponse)
+async def get_budget_status(
+    month: Optional[date] = Query(None, description="Any day of the month, default this month"),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Spending against each budget in one month, read from the running counters."""
+    first_day = budgets.month_start(month or date.today())
+    rows = (await db.execute(
+        _budget_rows(current_user.id)
+        .add_columns(models.BudgetSpend.spent)
+        .outerjoin(
+            models.BudgetSpend,
+            (models.BudgetSpend.budget_id == models.Budget.id) & (models.BudgetSpend.month == first_day)
+        )
+        .order_by(models.Budget.id)
+    )).all()
+
+    statuses = []
+    for row in rows:
+        spent = row.spent or Decimal("0")
+        statuses.append(schemas.BudgetStatus(
+            budget_id=row.id,
+            category_id=row.category_id,
+            category=row.category,
+            amount=float(row.amount),
+            spent=float(spent),
+            remaining=float(row.amount - spent),
+            over_budget=spent > row.amount
+        ))
+    return schemas.BudgetStatusResponse(month=first_day, budgets=statuses)
+
+
+@router.patch("/{budget_id}", response_model=schemas.BudgetResponse)
+async def update_budget(
+    budget_id: int,
+    budget: schemas.BudgetUpdate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    updated = await db.scalar(
+        update(models.Budget)
+        .where(models.Budget.id == budget_id, models.Budget.user_id == current_user.id)
+        .values(amount=Decimal(str(budget.amount)))
+        .returning(models.Budget.id)
+        .execution_options(synchronize_session=False)
+    )
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Budget not found")
+    await db.commit()
+    row = (await db.execute(_budget_rows(current_user.id).where(models.Budget.id == budget_id))).one()
+    return _budget_response(row)
+
+
+@router.delete("/{budget_id}")
+async def delete_budget(
+    budget_id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    # ON DELETE CASCADE clears the budget's counters.
+    deleted = await db.scalar(
+        delete(models.Budget)
+        .where(models.Budget.id == budget_id, models.Budget.user_id == current_user.id)
+        .returning(models.Budget.id)
+        .execution_options(synchronize_session=False)
+    )
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Budget not found")
+    await db.commit()
+    return {"detail": "Budget deleted"}
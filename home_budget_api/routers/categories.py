@@ -1,66 +1,88 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from .. import models, schemas, database
-from .auth import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Response
+from pydantic import TypeAdapter
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, schemas, database, balances, cache
+from .auth import Principal, get_current_principal
 
 router = APIRouter(prefix="/categories", tags=["categories"])
 
 
+category_list = TypeAdapter(list[schemas.CategoryResponse])
+
+
 @router.get("/", response_model=list[schemas.CategoryResponse])
-def list_categories(
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+async def list_categories(
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    categories = db.query(models.Category).filter(
+    key = cache.categories_key(current_user.id)
+    cached = await cache.get(key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    categories = (await db.scalars(select(models.Category).where(
         (models.Category.user_id == current_user.id) | (models.Category.user_id == None)
-    ).all()
+    ))).all()
+    await cache.put(key, category_list.dump_json(category_list.validate_python(categories, from_attributes=True)))
     return categories
 
 
 @router.post("/", response_model=schemas.CategoryResponse)
-def create_category(
+async def create_category(
     category: schemas.CategoryCreate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     db_category = models.Category(name=category.name, user_id=current_user.id) # Could create multiple categories of same name, maybe should restrict to unique name for each category?
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    await db.commit()
+    await cache.invalidate(cache.categories_key(current_user.id))
+    await db.refresh(db_category)
     return db_category
 
 
 @router.delete("/{category_id}")
-def delete_category(
+async def delete_category(
     category_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    category = db.query(models.Category).filter(
-        models.Category.id == category_id,
-        models.Category.user_id == current_user.id
-    ).first()
-
-    if not category:
+    # The row lock makes a concurrent delete of the same category wait and
+    # then find nothing, and keeps new expenses out of it meanwhile.
+    owned = await db.scalar(
+        select(models.Category.id)
+        .where(
+            models.Category.id == category_id,
+            models.Category.user_id == current_user.id
+        )
+        .with_for_update()
+    )
+
+    if owned is None:
         raise HTTPException(status_code=404, detail="Category not found or cannot delete global category")
 
-
-    from decimal import Decimal
-    from typing import cast
-
-    current_balance: Decimal = cast(Decimal, current_user.initial_balance)
-
-    for expense in category.expenses:
-        if expense.user_id == current_user.id:
-            current_balance += Decimal(str(expense.amount))
-
- 
-    current_user.initial_balance = current_balance  # type: ignore
-    db.add(current_user)
-
-    db.delete(category)
-    db.commit()
+    # The refund is summed over the rows this DELETE removes, in the database:
+    # an expense deleted concurrently through DELETE /expenses/{id} is either
+    # gone already or waited for, never refunded twice.
+    # Amounts in other currencies are refunded as they were debited, by
+    # their converted amount (see fx.py).
+    removed = (
+        delete(models.Expense)
+        .where(models.Expense.category_id == category_id)
+        .returning(models.Expense.amount, models.Expense.converted_amount, models.Expense.user_id)
+        .cte("removed")
+    )
+    amount = func.coalesce(removed.c.converted_amount, removed.c.amount)
+    refund = await db.scalar(
+        select(func.coalesce(func.sum(amount).filter(removed.c.user_id == current_user.id), 0))
+        .select_from(removed)
+    )
+
+    # ON DELETE CASCADE clears the category's rollup rows.
+    await db.execute(delete(models.Category).where(models.Category.id == category_id))
+    await balances.change(db, current_user.id, refund)
+    await db.commit()
+    await cache.invalidate(cache.categories_key(current_user.id), cache.summary_key(current_user.id))
 
     return {"detail": "Category and its expenses deleted, amounts refunded"}
-
-
@@ -1,12 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from typing import List, Optional
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, undefer
+from sqlalchemy import Date, Float, Integer, TIMESTAMP, and_, case, cast, delete, insert, literal_column, not_, or_, select, text, true, tuple_
+from typing import AsyncIterator, Iterator, List, Optional
+from collections import defaultdict
+from itertools import islice
+import base64
+import csv
 import datetime
+import io
+import json
+import re
+
+import orjson
 from decimal import Decimal
-from typing import cast
-from .. import models, schemas, database
-from ..routers.auth import get_current_user
+from .. import models, schemas, database, rollups, budgets, balances, cache, fx, idempotency
+from ..routers.auth import Principal, get_current_principal
 from sqlalchemy import func
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
@@ -18,89 +30,750 @@ router = APIRouter(
 
 
 @router.post("/", response_model=schemas.ExpenseResponse)
-def create_expense(
+async def create_expense(
     expense: schemas.ExpenseCreate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    response: Response,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    
-    category = db.query(models.Category).filter(
+    """Record an expense and debit it from the balance.
+
+    An expense in another currency than the user's is debited at the rate
+    of its date (see fx.py). X-Budget-Overspent lists the budgets this
+    expense's month is now over.
+    """
+
+    # KEY SHARE keeps a concurrent category delete from removing the category
+    # before this insert commits; it does not block other writes to it.
+    category = await db.scalar(select(models.Category).where(
         (models.Category.id == expense.category_id) &
         ((models.Category.user_id == current_user.id) | (models.Category.user_id == None))
-    ).first()
+    ).with_for_update(read=True, key_share=True))
 
     if not category:
         raise HTTPException(status_code=404, detail="Category not found or not accessible")
 
-    current_balance: Decimal = cast(Decimal, current_user.initial_balance)
-    expense_amount = Decimal(str(expense.amount))
-
-    if current_balance - expense_amount < Decimal("0"):
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-
-    current_user.initial_balance = current_balance - expense_amount  # type: ignore
+    currency = expense.currency or current_user.currency
+    expense_date = expense.date or date.today()
+    amount = Decimal(str(expense.amount))
+    found = await fx.rates_for(db, [(currency, expense_date)], current_user.currency)
+    debit = fx.convert(amount, currency, expense_date, current_user.currency, found)
+    if debit is None:
+        raise HTTPException(status_code=400, detail=f"No exchange rate for {currency} on {expense_date}")
 
     db_expense = models.Expense(
         description=expense.description,
-        amount=expense.amount,
-        date=expense.date,
-        category_id=category.id,
+        amount=amount,
+        currency=currency,
+        converted_amount=None if currency == current_user.currency else debit,
+        date=expense_date,
+        category=category,
         user_id=current_user.id
     )
     db.add(db_expense)
-    db.add(current_user)
-    db.commit()
-    db.refresh(db_expense)
+    await db.flush()
+
+    if await balances.change(db, current_user.id, -debit) is None:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+
+    await db.run_sync(rollups.add_expense, db_expense)
+    overspent = await budgets.apply_deltas(db, current_user.id, {(category.id, expense_date): (debit, 1)})
+    await db.commit()
+    if overspent:
+        response.headers["X-Budget-Overspent"] = ",".join(str(row.budget_id) for row in overspent)
+    await cache.invalidate(cache.summary_key(current_user.id))
+    # Sessions do not expire on commit, so this needs no refresh, which would
+    # fail if a concurrent delete has removed the expense already.
     return db_expense
 
 
-@router.get("/", response_model=List[schemas.ExpenseResponse])
-def list_expenses(
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
-    category_id: Optional[int] = Query(None, description="Filter by category ID"),
-    min_amount: Optional[float] = Query(None, description="Minimum amount"),
-    max_amount: Optional[float] = Query(None, description="Maximum amount"),
-    start_date: Optional[datetime.date] = Query(None, description="Start date"),
-    end_date: Optional[datetime.date] = Query(None, description="End date")
+# ---------------- BULK IMPORT ----------------
+BULK_BATCH_SIZE = 1000
+
+
+def _bulk_format(file: UploadFile, requested: Optional[str]) -> str:
+    if requested:
+        return requested
+    name = (file.filename or "").lower()
+    content_type = (file.content_type or "").lower()
+    if name.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type:
+        return "ndjson"
+    raise HTTPException(status_code=400, detail="Cannot tell the file format, pass format=csv or format=ndjson")
+
+
+def _read_bulk_rows(file: UploadFile, file_format: str) -> Iterator[tuple[int, dict | str]]:
+    """Yield (row number, raw fields) or (row number, error) from the upload."""
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", errors="replace", newline="")
+    if file_format == "csv":
+        for number, fields in enumerate(csv.DictReader(text), start=1):
+            yield number, fields
+        return
+
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            fields = json.loads(line)
+        except json.JSONDecodeError:
+            yield number, "Invalid JSON"
+            continue
+        yield number, fields if isinstance(fields, dict) else "Expected a JSON object"
+
+
+def _validate_bulk_row(fields: dict | str, category_ids: set) -> schemas.ExpenseCreate | str:
+    if isinstance(fields, str):
+        return fields
+    try:
+        # Blank CSV cells fall back to the schema defaults (e.g. today's date).
+        expense = schemas.ExpenseCreate.model_validate({k: v for k, v in fields.items() if v != ""})
+    except ValidationError as e:
+        return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+    if expense.category_id not in category_ids:
+        return "Category not found or not accessible"
+    return expense
+
+
+@router.post("/bulk", response_model=schemas.BulkImportResponse)
+async def import_expenses(
+    file: UploadFile = File(..., description="CSV with a header row, or NDJSON, with the ExpenseCreate fields"),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="Defaults to the file extension"),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Import expenses in batches of BULK_BATCH_SIZE rows, one transaction per batch.
+
+    Rows are checked in file order with the same rules as POST /expenses/: an
+    accessible category, and a balance that never goes below zero. Rows that
+    fail are reported and skipped; the rest are inserted.
+    """
+    file_format = _bulk_format(file, format)
+    # Read once: a retried batch rolls back, which expires the loaded user.
+    user_id = current_user.id
+    currency = current_user.currency
+    category_ids = set((await db.scalars(select(models.Category.id).where(
+        (models.Category.user_id == user_id) | (models.Category.user_id == None)
+    ))).all())
+
+    rows = _read_bulk_rows(file, file_format)
+    imported = 0
+    errors: list[schemas.BulkImportError] = []
+
+    try:
+        while batch := await run_in_threadpool(lambda: list(islice(rows, BULK_BATCH_SIZE))):
+            validated = [(number, _validate_bulk_row(fields, category_ids)) for number, fields in batch]
+            found = await fx.rates_for(db, [
+                (expense.currency or currency, expense.date or date.today())
+                for _, expense in validated if not isinstance(expense, str)
+            ], currency)
+
+            # Each batch is checked against a snapshot of the balance and debited
+            # with one conditional UPDATE. If a concurrent write left too little
+            # for the batch, the check is redone against the new balance.
+            while True:
+                # The categories are locked again in each batch's transaction:
+                # one deleted since the import started fails its rows.
+                live = set((await db.scalars(select(models.Category.id).where(models.Category.id.in_({
+                    expense.category_id for _, expense in validated if not isinstance(expense, str)
+                })).with_for_update(read=True, key_share=True))).all())
+                balance = await db.scalar(select(models.User.initial_balance).where(models.User.id == user_id))
+                new_rows = []
+                batch_errors: list[schemas.BulkImportError] = []
+                deltas: dict = defaultdict(lambda: (Decimal("0"), Decimal("0"), 0))
+                budget_deltas: dict = defaultdict(lambda: (Decimal("0"), 0))
+
+                for number, expense in validated:
+                    if isinstance(expense, str):
+                        batch_errors.append(schemas.BulkImportError(row=number, error=expense))
+                        continue
+                    if expense.category_id not in live:
+                        batch_errors.append(schemas.BulkImportError(row=number, error="Category not found or not accessible"))
+                        continue
+
+                    amount = Decimal(str(expense.amount))
+                    expense_currency = expense.currency or currency
+                    expense_date = expense.date or date.today()
+                    debit = fx.convert(amount, expense_currency, expense_date, currency, found)
+                    if debit is None:
+                        error = f"No exchange rate for {expense_currency} on {expense_date}"
+                        batch_errors.append(schemas.BulkImportError(row=number, error=error))
+                        continue
+                    if balance - debit < Decimal("0"):
+                        batch_errors.append(schemas.BulkImportError(row=number, error="Insufficient balance"))
+                        continue
+                    balance -= debit
+
+                    new_rows.append({
+                        "description": expense.description,
+                        "amount": amount,
+                        "currency": expense_currency,
+                        "converted_amount": None if expense_currency == currency else debit,
+                        "date": expense_date,
+                        "category_id": expense.category_id,
+                        "user_id": user_id
+                    })
+                    key = (expense.category_id, expense_date, expense_currency)
+                    total, converted, count = deltas[key]
+                    deltas[key] = (total + amount, converted + debit, count + 1)
+                    total, count = budget_deltas[(expense.category_id, expense_date)]
+                    budget_deltas[(expense.category_id, expense_date)] = (total + debit, count + 1)
+
+                if not new_rows:
+                    break
+                await db.execute(insert(models.Expense), new_rows)
+                batch_total = sum((amount for amount, _ in budget_deltas.values()), Decimal("0"))
+                if await balances.change(db, user_id, -batch_total) is not None:
+                    await db.run_sync(rollups.apply_deltas, user_id, deltas)
+                    await budgets.apply_deltas(db, user_id, budget_deltas)
+                    break
+                await db.rollback()
+
+            await db.commit()
+            imported += len(new_rows)
+            errors.extend(batch_errors)
+    finally:
+        # Batches commit one by one, so invalidate even when a later one fails.
+        if imported:
+            await cache.invalidate(cache.summary_key(user_id))
+
+    return schemas.BulkImportResponse(imported=imported, failed=len(errors), errors=errors)
+
+
+# ---------------- BATCH ----------------
+@router.post("/batch", response_model=schemas.ExpenseBatchResponse)
+async def batch_expenses(
+    batch: schemas.ExpenseBatchRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    query = db.query(models.Expense).filter(models.Expense.user_id == current_user.id)
+    """Apply creates and deletes as one transaction: all of them or none.
+
+    The balance has to cover the batch as a whole, so a delete's refund can
+    pay for a create in the same batch. When an operation fails nothing is
+    applied and the response (status 400) has the error of each failed
+    operation.
+
+    A retry with the same Idempotency-Key header and body gets the first
+    response back (with Idempotent-Replayed: true) instead of applying the
+    batch again; the same key with another body is a 422. A batch that failed
+    does not keep its key. See idempotency.py.
+    """
+    user_id = current_user.id
+    currency = current_user.currency
+    if idempotency_key is not None:
+        # The body as sent: a default filled in (today's date) would make a
+        # retry on the next day look like a different request.
+        fingerprint = idempotency.request_hash(batch.model_dump_json(exclude_unset=True).encode())
+        claimed = await idempotency.claim(db, user_id, idempotency_key, fingerprint)
+        if claimed is not None:
+            if claimed.request_hash != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was used for a different request")
+            return JSONResponse(claimed.response, status_code=claimed.status_code, headers={"Idempotent-Replayed": "true"})
+
+    operations = batch.operations
+    results = [schemas.ExpenseBatchResult(index=index, op=operation.op) for index, operation in enumerate(operations)]
+    creates = [(index, operation) for index, operation in enumerate(operations) if isinstance(operation, schemas.BatchCreate)]
+    deletes = [(index, operation) for index, operation in enumerate(operations) if isinstance(operation, schemas.BatchDelete)]
+
+    category_ids = set((await db.scalars(select(models.Category.id).where(
+        models.Category.id.in_({operation.category_id for _, operation in creates}),
+        (models.Category.user_id == user_id) | (models.Category.user_id == None)
+    ).with_for_update(read=True, key_share=True))).all()) if creates else set()
+
+    found = await fx.rates_for(db, [
+        (operation.currency or currency, operation.date or date.today()) for _, operation in creates
+    ], currency)
+
+    failed = False
+    seen: set = set()
+    debits = {}
+    for index, operation in creates:
+        expense_currency = operation.currency or currency
+        expense_date = operation.date or date.today()
+        debits[index] = fx.convert(Decimal(str(operation.amount)), expense_currency, expense_date, currency, found)
+        if operation.category_id not in category_ids:
+            results[index].error = "Category not found or not accessible"
+            failed = True
+        elif debits[index] is None:
+            results[index].error = f"No exchange rate for {expense_currency} on {expense_date}"
+            failed = True
+    for index, operation in deletes:
+        if operation.id in seen:
+            results[index].error = "Expense deleted twice in the batch"
+            failed = True
+        seen.add(operation.id)
+
+    async def fail(error: Optional[str] = None) -> JSONResponse:
+        await db.rollback()
+        for result in results:
+            result.id = None
+        body = schemas.ExpenseBatchResponse(applied=False, error=error, results=results)
+        return JSONResponse(body.model_dump(mode="json"), status_code=400)
+
+    net = Decimal("0")
+    deltas: dict = defaultdict(lambda: (Decimal("0"), Decimal("0"), 0))
+    budget_deltas: dict = defaultdict(lambda: (Decimal("0"), 0))
+
+    def add(category_id: int, expense_date: date, expense_currency: str, amount: Decimal, debit: Decimal, count: int):
+        total, converted, number = deltas[(category_id, expense_date, expense_currency)]
+        deltas[(category_id, expense_date, expense_currency)] = (total + amount, converted + debit, number + count)
+        total, number = budget_deltas[(category_id, expense_date)]
+        budget_deltas[(category_id, expense_date)] = (total + debit, number + count)
+
+    # Inserting before deleting or debiting takes the category locks first,
+    # the lock order of every expense write (see balances.py). The deletes
+    # still run after a failed check, to report every missing expense.
+    if creates and not failed:
+        new_rows = []
+        for index, operation in creates:
+            amount = Decimal(str(operation.amount))
+            expense_currency = operation.currency or currency
+            expense_date = operation.date or date.today()
+            new_rows.append({
+                "description": operation.description,
+                "amount": amount,
+                "currency": expense_currency,
+                "converted_amount": None if expense_currency == currency else debits[index],
+                "date": expense_date,
+                "category_id": operation.category_id,
+                "user_id": user_id
+            })
+            net -= debits[index]
+            add(operation.category_id, expense_date, expense_currency, amount, debits[index], 1)
+        new_ids = (await db.scalars(
+            insert(models.Expense).returning(models.Expense.id, sort_by_parameter_order=True), new_rows
+        )).all()
+        for (index, _), new_id in zip(creates, new_ids):
+            results[index].id = new_id
+
+    if deletes:
+        deleted = {row.id: row for row in await db.execute(
+            delete(models.Expense)
+            .where(models.Expense.id.in_(seen), models.Expense.user_id == user_id)
+            .returning(
+                models.Expense.id, models.Expense.amount, models.Expense.currency,
+                models.Expense.converted_amount, models.Expense.category_id, models.Expense.date
+            )
+            .execution_options(synchronize_session=False)
+        )}
+        for index, operation in deletes:
+            row = deleted.get(operation.id)
+            if row is None:
+                results[index].error = "Expense not found"
+                failed = True
+                continue
+            # Refunded exactly as it was debited
+            refund = row.amount if row.converted_amount is None else row.converted_amount
+            results[index].id = row.id
+            net += refund
+            add(row.category_id, row.date, row.currency, -row.amount, -refund, -1)
+    if failed:
+        return await fail()
+
+    balance = await balances.change(db, user_id, net)
+    if balance is None:
+        return await fail("Insufficient balance")
+
+    await db.run_sync(rollups.apply_deltas, user_id, deltas)
+    overspent = await budgets.apply_deltas(db, user_id, budget_deltas)
+    response = schemas.ExpenseBatchResponse(
+        applied=True, balance=float(balance), results=results,
+        overspent_budgets=sorted({row.budget_id for row in overspent})
+    )
+    if idempotency_key is not None:
+        await idempotency.store(db, user_id, idempotency_key, 200, response.model_dump(mode="json"))
+    await db.commit()
+    await cache.invalidate(cache.summary_key(user_id))
+    return response
+
+
+# ---------------- LISTING / PAGINATION ----------------
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+# A search first looks for its page among this many of the newest expenses
+SEARCH_RECENT_ROWS = 2000
+
+
+def encode_cursor(expense_date: date, expense_id: int, rank: Optional[int] = None) -> str:
+    raw = f"{expense_date.isoformat()}:{expense_id}"
+    if rank is not None:
+        raw = f"{rank}:{raw}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, ranked: bool = False) -> tuple:
+    """(date, id), or (rank, date, id) for a page of search results."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded).decode().split(":")
+        if ranked:
+            raw_rank, raw_date, raw_id = parts
+            return int(raw_rank), date.fromisoformat(raw_date), int(raw_id)
+        raw_date, raw_id = parts
+        return date.fromisoformat(raw_date), int(raw_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def search_ranks(q: str, vector=models.Expense.description_search) -> list:
+    """The match conditions of a search, best rank first: every word of q as a
+    whole word, then as a word prefix ("groc lid" finds "Groceries at Lidl")."""
+    words = re.findall(r"\w+", q)
+    if not words:
+        raise HTTPException(status_code=400, detail="Search needs at least one letter or digit")
+    exact = vector.bool_op("@@")(tsquery(" & ".join(words)))
+    prefix = vector.bool_op("@@")(tsquery(" & ".join(f"{word}:*" for word in words)))
+    return [exact, and_(prefix, not_(exact))]
+
+
+def tsquery(query: str):
+    return func.to_tsquery(literal_column("'simple'"), query)
+
+
+def filter_expenses(
+    query,
+    user_id: int,
+    category_id: Optional[int] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    q: Optional[str] = None,
+    cursor: Optional[tuple] = None
+):
+    """Apply the list filters and the keyset position to an expenses query.
+
+    Rows are ordered newest first on (date, id), so the cursor points at the
+    last row of the previous page and the next page starts strictly after it.
+    A search orders by rank first and its cursor carries the rank as well.
+    """
+    query = query.where(models.Expense.user_id == user_id)
 
     if category_id:
-        query = query.filter(models.Expense.category_id == category_id)
+        query = query.where(models.Expense.category_id == category_id)
     if min_amount:
-        query = query.filter(models.Expense.amount >= min_amount)
+        query = query.where(models.Expense.amount >= min_amount)
     if max_amount:
-        query = query.filter(models.Expense.amount <= max_amount)
+        query = query.where(models.Expense.amount <= max_amount)
     if start_date:
-        query = query.filter(models.Expense.date >= start_date)
+        query = query.where(models.Expense.date >= start_date)
     if end_date:
-        query = query.filter(models.Expense.date <= end_date)
+        query = query.where(models.Expense.date <= end_date)
+
+    if q:
+        exact, prefix = search_ranks(q)
+        rank = case((exact, 0), else_=1)
+        query = query.where(or_(exact, prefix))
+        if cursor:
+            # Rank ascends while (date, id) descends, so one row comparison
+            # cannot express "after the cursor".
+            cursor_rank, *position = cursor
+            query = query.where(or_(
+                rank > cursor_rank,
+                and_(rank == cursor_rank, tuple_(models.Expense.date, models.Expense.id) < tuple(position))
+            ))
+        return query.order_by(rank, models.Expense.date.desc(), models.Expense.id.desc())
+
+    if cursor:
+        # The row comparison alone cannot prune partitions; the plain date
+        # bound lets later pages skip the months newer than the cursor.
+        query = query.where(
+            tuple_(models.Expense.date, models.Expense.id) < cursor,
+            models.Expense.date <= cursor[0]
+        )
+
+    return query.order_by(models.Expense.date.desc(), models.Expense.id.desc())
+
+
+def _expense_rows(expenses=models.Expense):
+    """Plain column rows (no ORM objects) of expenses, or of an alias of them,
+    with their category: everything an ExpenseResponse needs."""
+    return select(
+        expenses.id,
+        expenses.description,
+        expenses.amount,
+        expenses.currency,
+        expenses.date,
+        models.Category.id.label("category_id"),
+        models.Category.name.label("category_name")
+    ).join(models.Category, models.Category.id == expenses.category_id)
+
+
+def _expense_rows_query(user_id: int, **filters):
+    return filter_expenses(_expense_rows(), user_id, **filters)
+
+
+def _expense_dicts(rows) -> list[dict]:
+    """ExpenseResponse-shaped dicts straight from the rows, for orjson: no model
+    is built and validated per row."""
+    return [
+        {
+            "id": expense_id,
+            "description": description,
+            "amount": float(amount),
+            "currency": currency,
+            "date": expense_date,
+            "category": {"id": cat_id, "name": cat_name}
+        }
+        for expense_id, description, amount, currency, expense_date, cat_id, cat_name in rows
+    ]
+
+
+async def _stream_expenses(user_id: int, batch_size: int = STREAM_BATCH_SIZE, **filters) -> AsyncIterator[bytes]:
+    query = _expense_rows_query(user_id, **filters)
+
+    async for rows in database.stream_rows(query, batch_size):
+        yield b"".join(orjson.dumps(expense, option=orjson.OPT_APPEND_NEWLINE) for expense in _expense_dicts(rows))
 
-    return query.all()
+
+@router.get("/", response_model=List[schemas.ExpenseResponse])
+async def list_expenses(
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal),
+    category_id: Optional[int] = Query(None, description="Filter by category ID"),
+    min_amount: Optional[float] = Query(None, description="Minimum amount"),
+    max_amount: Optional[float] = Query(None, description="Maximum amount"),
+    start_date: Optional[datetime.date] = Query(None, description="Start date"),
+    end_date: Optional[datetime.date] = Query(None, description="End date"),
+    q: Optional[str] = Query(None, max_length=200, description="Search descriptions by words or word prefixes, best matches first"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    stream: bool = Query(False, description="Stream all matching expenses as NDJSON instead of one page")
+):
+    filters = dict(
+        category_id=category_id,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        start_date=start_date,
+        end_date=end_date,
+        q=q,
+        cursor=decode_cursor(cursor, ranked=bool(q)) if cursor else None
+    )
+
+    if stream:
+        return StreamingResponse(
+            _stream_expenses(current_user.id, **filters),  # type: ignore
+            media_type="application/x-ndjson"
+        )
+
+    # The rows are written out with orjson as they come; response_model only
+    # documents them, FastAPI does not validate a Response it is handed.
+    if q:
+        rows, next_cursor = await _search_page(db, current_user.id, limit, **filters)  # type: ignore
+    else:
+        rows = (await db.execute(_expense_rows_query(current_user.id, **filters).limit(limit + 1))).all()  # type: ignore
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(orjson.dumps(_expense_dicts(rows)), media_type="application/json", headers=headers)
+
+
+async def _search_page(db: AsyncSession, user_id: int, limit: int, q: str, cursor: Optional[tuple] = None, **filters):
+    """One page of search results and the cursor of the next one.
+
+    Each rank is read newest first. Words common enough to fill the page from
+    the newest SEARCH_RECENT_ROWS expenses are found by walking those rows,
+    which stops as soon as the page is full. Rarer ones are collected through
+    the search index (which covers every user) and sorted, unless the walk has
+    seen all of the user's expenses already. Leaving this choice to the
+    planner goes wrong for words that seldom occur together: it expects the
+    walk to stop early and ends up reading every expense of the user.
+    """
+    first_rank, position = (cursor[0], cursor[1:]) if cursor else (0, None)
+    ranked: list = []
+    for rank in range(len(search_ranks(q))):
+        if rank < first_rank:
+            continue
+        wanted = limit + 1 - len(ranked)
+        rank_filters = dict(filters, cursor=position if rank == first_rank else None)
+        found = (await db.execute(_search_query(user_id, q, rank, wanted, recent=True, **rank_filters))).all()
+        if len(found) < wanted and await _has_older_expenses(db, user_id, **rank_filters):
+            # Whether to read the user's rows off their index as well depends
+            # on how many they have and how rare the words are; a prepared
+            # statement's generic plan knows neither and reads them for every
+            # user. The setting lasts until the end of the request's transaction.
+            await db.execute(text("SET LOCAL plan_cache_mode = force_custom_plan"))
+            found = (await db.execute(_search_query(user_id, q, rank, wanted, recent=False, **rank_filters))).all()
+        ranked += [(rank, row) for row in found]
+        if len(ranked) > limit:
+            rank, last = ranked[limit - 1]
+            return [row for _, row in ranked[:limit]], encode_cursor(last.date, last.id, rank)
+    return [row for _, row in ranked], None
+
+
+async def _has_older_expenses(db: AsyncSession, user_id: int, **filters) -> bool:
+    """Whether the user has more expenses than the newest SEARCH_RECENT_ROWS."""
+    query = filter_expenses(select(models.Expense.id), user_id, **filters).offset(SEARCH_RECENT_ROWS).limit(1)
+    return await db.scalar(query) is not None
+
+
+def _search_query(user_id: int, q: str, rank: int, limit: int, recent: bool, **filters):
+    rows = filter_expenses(select(models.Expense), user_id, **filters)
+    if recent:
+        rows = rows.options(undefer(models.Expense.description_search)).limit(SEARCH_RECENT_ROWS)
+        candidates = aliased(models.Expense, rows.subquery())
+        condition = search_ranks(q, candidates.description_search)[rank]
+    else:
+        # Materialized, the matches are read through the search index as a
+        # whole instead of by walking the user's expenses in date order.
+        rows = rows.where(search_ranks(q)[rank]).order_by(None)
+        candidates = aliased(models.Expense, rows.cte().prefix_with("MATERIALIZED"))
+        condition = true()
+    # The page is cut before the category join, so the walk stops at it.
+    page = aliased(models.Expense, _newest_first(select(candidates).where(condition), candidates).limit(limit).subquery())
+    return _newest_first(_expense_rows(page), page)
+
+
+def _newest_first(query, expenses):
+    return query.order_by(expenses.date.desc(), expenses.id.desc())
+
+
+# ---------------- EXPORT ----------------
+EXPORT_BATCH_SIZE = 10000
+EXPORT_COLUMNS = ["id", "description", "amount", "currency", "date", "category_id", "category_name"]
+
+
+async def _export_csv(user_id: int, **filters) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    async for rows in database.stream_rows(_expense_rows_query(user_id, **filters), EXPORT_BATCH_SIZE):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what the Parquet writer has produced so far."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:  # type: ignore[override]
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _export_parquet(user_id: int, **filters) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int32()),
+        ("description", pa.string()),
+        ("amount", pa.decimal128(12, 2)),
+        ("currency", pa.string()),
+        ("date", pa.date32()),
+        ("category_id", pa.int32()),
+        ("category_name", pa.string())
+    ])
+    sink = _ChunkSink()
+    # One row group per fetched batch; each is sent as soon as it is written.
+    with pq.ParquetWriter(sink, schema) as writer:
+        async for rows in database.stream_rows(_expense_rows_query(user_id, **filters), EXPORT_BATCH_SIZE):
+            writer.write_batch(pa.record_batch(list(zip(*rows)), schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+@router.get("/export")
+async def export_expenses(
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$", description="csv, ndjson or parquet"),
+    current_user: Principal = Depends(get_current_principal),
+    category_id: Optional[int] = Query(None, description="Filter by category ID"),
+    min_amount: Optional[float] = Query(None, description="Minimum amount"),
+    max_amount: Optional[float] = Query(None, description="Maximum amount"),
+    start_date: Optional[datetime.date] = Query(None, description="Start date"),
+    end_date: Optional[datetime.date] = Query(None, description="End date"),
+    q: Optional[str] = Query(None, max_length=200, description="Search descriptions by words or word prefixes, best matches first")
+):
+    """Stream every matching expense, newest (or best matching) first, straight from a server-side cursor."""
+    filters = dict(
+        category_id=category_id,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        start_date=start_date,
+        end_date=end_date,
+        q=q
+    )
+
+    if format == "csv":
+        body, media_type = _export_csv(current_user.id, **filters), "text/csv"
+    elif format == "ndjson":
+        body, media_type = _stream_expenses(current_user.id, EXPORT_BATCH_SIZE, **filters), "application/x-ndjson"
+    else:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed on the server")
+        body, media_type = _export_parquet(current_user.id, **filters), "application/vnd.apache.parquet"
+
+    return StreamingResponse(
+        body,  # type: ignore
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="expenses.{format}"'}
+    )
 
 
 @router.delete("/{expense_id}")
-def delete_expense(
+async def delete_expense(
     expense_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    expense = db.query(models.Expense).filter(
-        models.Expense.id == expense_id,
-        models.Expense.user_id == current_user.id
-    ).first()
+    # DELETE ... RETURNING: of two concurrent deletes only one gets the row
+    # back, so the amount is refunded exactly once.
+    deleted = (await db.execute(
+        delete(models.Expense)
+        .where(models.Expense.id == expense_id, models.Expense.user_id == current_user.id)
+        .returning(
+            models.Expense.amount, models.Expense.currency, models.Expense.converted_amount,
+            models.Expense.category_id, models.Expense.date
+        )
+        .execution_options(synchronize_session=False)
+    )).one_or_none()
 
-    if not expense:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Expense not found")
 
-    current_balance: Decimal = cast(Decimal, current_user.initial_balance)
-    refund_amount = Decimal(str(expense.amount))
-    current_user.initial_balance = current_balance + refund_amount  # type: ignore
+    amount, currency, converted_amount, category_id, expense_date = deleted
+    # Refunded exactly as it was debited
+    refund = amount if converted_amount is None else converted_amount
 
-    db.delete(expense)
-    db.add(current_user)
-    db.commit()
+    await balances.change(db, current_user.id, refund)
+    await db.run_sync(
+        rollups.apply_deltas, current_user.id, {(category_id, expense_date, currency): (-amount, -refund, -1)}
+    )
+    await budgets.apply_deltas(db, current_user.id, {(category_id, expense_date): (-refund, -1)})
+    await db.commit()
+    await cache.invalidate(cache.summary_key(current_user.id))
     return {"detail": "Expense deleted and amount refunded"}
 
 
@@ -116,13 +789,14 @@ def delete_expense(
 
 # ---------------- EXPENSES OVERVIEW ----------------
 @router.get("/summary", response_model=schemas.SummaryResponse)
-def get_budget_summary(
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+async def get_budget_summary(
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    from decimal import Decimal
-    from typing import cast
-    from sqlalchemy import func
+    key = cache.summary_key(current_user.id)
+    cached = await cache.get(key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
 
     today = date.today()
 
@@ -130,48 +804,198 @@ def get_budget_summary(
     three_months_ago = today - relativedelta(months=3)
     one_year_ago = today - relativedelta(years=1)
 
-    total_spent = db.query(func.coalesce(func.sum(models.Expense.amount), 0)) \
-        .filter(models.Expense.user_id == current_user.id).scalar()
-    total_spent = float(total_spent)
-
-    current_balance: Decimal = cast(Decimal, current_user.initial_balance)
-    remaining_balance = float(current_balance)
+    daily = models.ExpenseDailyTotal
+    currency = current_user.currency
+    # In the user's currency: the rounded amounts the balance was debited
+    amount = daily.converted
+
+    def spent_since(start_date: date):
+        return func.sum(amount).filter(daily.day >= start_date)
+
+    # Read from the daily rollup, so the cost follows the number of distinct
+    # (category, day) pairs rather than the number of expenses. The per
+    # category rows are joined to category names and ROLLUP adds the grand
+    # total row (grouping() = 1) that carries the period windows.
+    per_category = (
+        select(
+            daily.category_id,
+            func.sum(amount).label("total"),
+            spent_since(one_month_ago).label("last_month"),
+            spent_since(three_months_ago).label("last_quarter"),
+            spent_since(one_year_ago).label("last_year")
+        )
+        .where(daily.user_id == current_user.id)
+        .group_by(daily.category_id)
+        .cte("per_category")
+    )
+    balance = select(models.User.initial_balance).where(models.User.id == current_user.id).scalar_subquery()
 
-    spending_by_category = (
-        db.query(
+    rows = (await db.execute(
+        select(
             models.Category.name,
-            func.coalesce(func.sum(models.Expense.amount), 0).label("total")
+            func.grouping(models.Category.name).label("is_total"),
+            func.coalesce(func.sum(per_category.c.total), 0).label("total"),
+            func.coalesce(func.sum(per_category.c.last_month), 0).label("last_month"),
+            func.coalesce(func.sum(per_category.c.last_quarter), 0).label("last_quarter"),
+            func.coalesce(func.sum(per_category.c.last_year), 0).label("last_year"),
+            balance.label("balance")
         )
-        .join(models.Expense, models.Category.id == models.Expense.category_id)
-        .filter(models.Expense.user_id == current_user.id)
-        .group_by(models.Category.name)
-        .all()
-    )
+        .select_from(per_category)
+        .outerjoin(models.Category, models.Category.id == per_category.c.category_id)
+        .group_by(func.rollup(models.Category.name))
+        .order_by(models.Category.name)
+    )).all()
 
+    totals = next(row for row in rows if row.is_total)
     category_summaries = [
-        schemas.CategorySummary(category=name, total=float(total))
-        for name, total in spending_by_category
+        schemas.CategorySummary(category=row.name, total=float(row.total))
+        for row in rows
+        if not row.is_total and row.name is not None
     ]
 
-    def spending_since(start_date: date) -> float:
-        return float(
-            db.query(func.coalesce(func.sum(models.Expense.amount), 0))
-            .filter(
-                models.Expense.user_id == current_user.id,
-                models.Expense.date >= start_date
-            )
-            .scalar()
-        )
+    summary = schemas.SummaryResponse(
+        currency=currency,
+        total_spent=float(totals.total),
+        remaining_balance=float(totals.balance),
+        by_category=category_summaries,
+        spent_last_month=float(totals.last_month),
+        spent_last_quarter=float(totals.last_quarter),
+        spent_last_year=float(totals.last_year)
+    )
+    await cache.put(key, summary.model_dump_json().encode())
+    return summary
 
-    spent_last_month = spending_since(one_month_ago)
-    spent_last_quarter = spending_since(three_months_ago)
-    spent_last_year = spending_since(one_year_ago)
 
-    return schemas.SummaryResponse(
-        total_spent=total_spent,
-        remaining_balance=remaining_balance,
-        by_category=category_summaries,
-        spent_last_month=spent_last_month,
-        spent_last_quarter=spent_last_quarter,
-        spent_last_year=spent_last_year
-    )
\ No newline at end of file
+# ---------------- TIMESERIES ----------------
+TIMESERIES_MAX_BUCKETS = 1000
+
+
+def _bucket_count(bucket: str, start_date: date, end_date: date) -> int:
+    if bucket == "day":
+        return (end_date - start_date).days + 1
+    if bucket == "week":
+        return (end_date - (start_date - timedelta(days=start_date.weekday()))).days // 7 + 1
+    return (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+
+
+@router.get("/timeseries", response_model=schemas.TimeseriesResponse)
+async def get_timeseries(
+    bucket: str = Query("month", pattern="^(day|week|month)$", description="day, week (starting Monday) or month"),
+    start_date: Optional[date] = Query(None, alias="from", description="First day, default one year before `to`"),
+    end_date: Optional[date] = Query(None, alias="to", description="Last day, default today"),
+    category_id: Optional[int] = Query(None, description="Only this category"),
+    by_category: bool = Query(False, description="Also return one series per category"),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Spending per bucket between `from` and `to`, with empty buckets as zero.
+
+    Buckets are labelled by their first day; the first and last one only
+    count the days inside the range.
+    """
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - relativedelta(years=1)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="`from` must not be after `to`")
+    if _bucket_count(bucket, start_date, end_date) > TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"More than {TIMESERIES_MAX_BUCKETS} buckets, use a larger bucket")
+
+    daily = models.ExpenseDailyTotal
+    # Inlined rather than bound (bucket is one of three literals), so the
+    # date_trunc in GROUP BY matches the one in the select list.
+    unit = literal_column(f"'{bucket}'")
+
+    def truncate(value):
+        return cast(func.date_trunc(unit, cast(value, TIMESTAMP)), Date)
+
+    # Every bucket of the range, so gaps come back as zero rows.
+    buckets = select(
+        cast(func.generate_series(
+            func.date_trunc(unit, cast(start_date, TIMESTAMP)),
+            func.date_trunc(unit, cast(end_date, TIMESTAMP)),
+            literal_column(f"interval '1 {bucket}'")
+        ), Date).label("bucket")
+    ).cte("buckets")
+
+    # In the user's currency, as in the summary
+    spent = (
+        select(
+            truncate(daily.day).label("bucket"),
+            daily.category_id,
+            func.sum(daily.converted).label("total"),
+            func.sum(daily.count).label("count")
+        )
+        .where(daily.user_id == current_user.id, daily.day.between(start_date, end_date))
+        .group_by(truncate(daily.day), daily.category_id)
+    )
+    if category_id is not None:
+        spent = spent.where(daily.category_id == category_id)
+    spent = spent.cte("spent")
+
+    # float8 and int4 come back as Python floats and ints, cheaper per row
+    # than Decimal for a series that is serialized as JSON numbers anyway.
+    total = cast(func.coalesce(func.sum(spent.c.total), 0), Float).label("total")
+    count = cast(func.coalesce(func.sum(spent.c.count), 0), Integer).label("count")
+
+    if not by_category:
+        rows = (await db.execute(
+            select(buckets.c.bucket, total, count)
+            .select_from(buckets.outerjoin(spent, spent.c.bucket == buckets.c.bucket))
+            .group_by(buckets.c.bucket)
+            .order_by(buckets.c.bucket)
+        )).all()
+        points = [{"bucket": day, "total": amount, "count": number} for day, amount, number in rows]
+        return {
+            "currency": current_user.currency, "bucket": bucket,
+            "start_date": start_date, "end_date": end_date, "points": points
+        }
+
+    # Each bucket crossed with every category that has spending in the range.
+    # GROUPING SETS returns the per category rows and the bucket totals from
+    # the same scan (grouping() = 1 marks a total).
+    series = (
+        select(models.Category.id, models.Category.name)
+        .where(models.Category.id.in_(select(spent.c.category_id)))
+        .cte("series")
+    )
+    rows = (await db.execute(
+        select(
+            buckets.c.bucket,
+            series.c.id.label("category_id"),
+            series.c.name,
+            func.grouping(series.c.id, series.c.name).label("is_total"),
+            total,
+            count
+        )
+        .select_from(
+            buckets
+            .outerjoin(series, true())
+            .outerjoin(spent, and_(spent.c.bucket == buckets.c.bucket, spent.c.category_id == series.c.id))
+        )
+        .group_by(func.grouping_sets(
+            tuple_(buckets.c.bucket),
+            tuple_(buckets.c.bucket, series.c.id, series.c.name)
+        ))
+        .order_by(buckets.c.bucket, series.c.name, series.c.id)
+    )).all()
+
+    points = []
+    per_category: dict = {}
+    for day, series_id, name, is_total, amount, number in rows:
+        point = {"bucket": day, "total": amount, "count": number}
+        if is_total:
+            points.append(point)
+        elif series_id is not None:
+            per_category.setdefault((series_id, name), []).append(point)
+
+    return {
+        "currency": current_user.currency,
+        "bucket": bucket,
+        "start_date": start_date,
+        "end_date": end_date,
+        "points": points,
+        "by_category": [
+            {"category_id": series_id, "category": name, "points": series_points}
+            for (series_id, name), series_points in per_category.items()
+        ]
+    }
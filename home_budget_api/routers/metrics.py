@@ -0,0 +1,45 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from .. import cache, database, instrumentation, ratelimit
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request latency and SQL statements per route of this worker process, in
+    the Prometheus text format. Served with PERF_METRICS=1 only, like the rest
+    of this router."""
+    return PlainTextResponse(instrumentation.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/slow-queries")
+async def get_slow_queries():
+    """The latest statements slower than PERF_SLOW_QUERY_MS, newest first."""
+    return {
+        "enabled": instrumentation.PERF_METRICS,
+        "threshold_ms": instrumentation.PERF_SLOW_QUERY_MS,
+        "samples": list(reversed(instrumentation.registry.slow_samples))
+    }
+
+
+@router.get("/pool")
+async def get_pool_stats():
+    """Connection pool usage of this worker process, per engine."""
+    return {
+        "async_mode": database.DB_ASYNC,
+        "pgbouncer": database.DB_PGBOUNCER,
+        "pools": database.pool_status()
+    }
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    """Response cache counters of this worker process."""
+    return cache.status()
+
+
+@router.get("/ratelimit")
+async def get_rate_limit_stats():
+    """Requests let through and refused per rate limit by this worker process."""
+    return ratelimit.status()
@@ -0,0 +1,81 @@
+from datetime import date
+from decimal import Decimal
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, schemas, database, recurring
+from .auth import Principal, get_current_principal
+
+router = APIRouter(prefix="/recurring-expenses", tags=["recurring expenses"])
+
+
+@router.get("/", response_model=list[schemas.RecurringExpenseResponse])
+async def list_recurring_expenses(
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    return (await db.scalars(
+        select(models.RecurringExpense)
+        .where(models.RecurringExpense.user_id == current_user.id)
+        .order_by(models.RecurringExpense.id)
+    )).all()
+
+
+@router.post("/", response_model=schemas.RecurringExpenseResponse)
+async def create_recurring_expense(
+    recurrence: schemas.RecurringExpenseCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Post the expense on every date of `rule` from start_date on.
+
+    Due dates, past ones included, are posted by the scheduler (see
+    recurring.py) within RECURRING_INTERVAL seconds.
+    """
+    start_date = recurrence.start_date or date.today()
+    try:
+        next_date = recurring.first_date(recurrence.rule, start_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_date is None:
+        raise HTTPException(status_code=400, detail="The rule has no dates from start_date on")
+
+    category = await db.scalar(select(models.Category.id).where(
+        (models.Category.id == recurrence.category_id) &
+        ((models.Category.user_id == current_user.id) | (models.Category.user_id == None))
+    ))
+    if category is None:
+        raise HTTPException(status_code=404, detail="Category not found or not accessible")
+
+    db_recurrence = models.RecurringExpense(
+        user_id=current_user.id,
+        category_id=category,
+        description=recurrence.description,
+        amount=Decimal(str(recurrence.amount)),
+        rule=recurrence.rule.strip(),
+        start_date=start_date,
+        next_date=next_date
+    )
+    db.add(db_recurrence)
+    await db.commit()
+    return db_recurrence
+
+
+@router.delete("/{recurrence_id}")
+async def delete_recurring_expense(
+    recurrence_id: int,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    # Expenses already posted stay, unlinked by ON DELETE SET NULL.
+    deleted = await db.scalar(
+        delete(models.RecurringExpense)
+        .where(models.RecurringExpense.id == recurrence_id, models.RecurringExpense.user_id == current_user.id)
+        .returning(models.RecurringExpense.id)
+        .execution_options(synchronize_session=False)
+    )
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Recurring expense not found")
+    await db.commit()
+    return {"detail": "Recurring expense deleted"}
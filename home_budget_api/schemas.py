@@ -1,16 +1,21 @@
 import datetime
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Annotated, List, Literal, Optional, Union
+
+# ISO 4217 currency code
+CURRENCY_PATTERN = "^[A-Z]{3}$"
 
 # ---------- AUTH ----------
 class UserCreate(BaseModel):
     username: str
     password: str
+    currency: str = Field("EUR", pattern=CURRENCY_PATTERN, description="Currency of the balance and budgets; cannot be changed")
 
 class UserResponse(BaseModel):
     id: int
     username: str
     initial_balance: float
+    currency: str
 
     class Config:
         from_attributes = True
@@ -44,7 +49,7 @@ class ExpenseBase(BaseModel):
     category_id: int
 
 class ExpenseCreate(ExpenseBase):
-    pass
+    currency: Optional[str] = Field(None, pattern=CURRENCY_PATTERN, description="Default the user's currency")
 
 class CategoryNested(BaseModel):
     id: int
@@ -57,18 +62,55 @@ class ExpenseResponse(BaseModel):
     id: int
     description: str
     amount: float
+    currency: str
     date: datetime.date
     category: CategoryNested
 
     class Config:
         from_attributes = True
 
+class BulkImportError(BaseModel):
+    row: int
+    error: str
+
+class BulkImportResponse(BaseModel):
+    imported: int
+    failed: int
+    errors: List[BulkImportError]
+
+class BatchCreate(ExpenseCreate):
+    op: Literal["create"]
+
+class BatchDelete(BaseModel):
+    op: Literal["delete"]
+    id: int
+
+class ExpenseBatchRequest(BaseModel):
+    operations: List[Annotated[Union[BatchCreate, BatchDelete], Field(discriminator="op")]] = Field(
+        min_length=1, max_length=1000
+    )
+
+class ExpenseBatchResult(BaseModel):
+    index: int
+    op: str
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class ExpenseBatchResponse(BaseModel):
+    applied: bool
+    error: Optional[str] = None
+    balance: Optional[float] = None
+    overspent_budgets: List[int] = []
+    results: List[ExpenseBatchResult]
+
 # ---------- SUMMARY (EXPENSES) ----------
 class CategorySummary(BaseModel):
     category: str
     total: float
 
 class SummaryResponse(BaseModel):
+    # Totals are converted into the user's currency
+    currency: str
     total_spent: float
     remaining_balance: float
     by_category: List[CategorySummary]
@@ -76,3 +118,74 @@ class SummaryResponse(BaseModel):
     spent_last_quarter: float
     spent_last_year: float
 
+
+# ---------- TIMESERIES (EXPENSES) ----------
+class TimeseriesPoint(BaseModel):
+    bucket: datetime.date
+    total: float
+    count: int
+
+class CategoryTimeseries(BaseModel):
+    category_id: int
+    category: str
+    points: List[TimeseriesPoint]
+
+class TimeseriesResponse(BaseModel):
+    currency: str
+    bucket: str
+    start_date: datetime.date
+    end_date: datetime.date
+    points: List[TimeseriesPoint]
+    by_category: Optional[List[CategoryTimeseries]] = None
+
+
+# ---------- BUDGETS ----------
+class BudgetCreate(BaseModel):
+    category_id: int
+    amount: float = Field(gt=0, description="Monthly limit")
+
+class BudgetUpdate(BaseModel):
+    amount: float = Field(gt=0, description="Monthly limit")
+
+class BudgetResponse(BaseModel):
+    id: int
+    category_id: int
+    category: str
+    amount: float
+
+class BudgetStatus(BaseModel):
+    budget_id: int
+    category_id: int
+    category: str
+    amount: float
+    spent: float
+    remaining: float
+    over_budget: bool
+
+class BudgetStatusResponse(BaseModel):
+    month: datetime.date
+    budgets: List[BudgetStatus]
+
+
+# ---------- RECURRING EXPENSES ----------
+class RecurringExpenseCreate(BaseModel):
+    description: str
+    amount: float = Field(gt=0)
+    category_id: int
+    rule: str = Field(
+        max_length=500,
+        description="RFC 5545 RRULE, at most daily, e.g. FREQ=MONTHLY;BYMONTHDAY=1 or FREQ=WEEKLY;INTERVAL=2;BYDAY=FR"
+    )
+    start_date: Optional[datetime.date] = Field(default_factory=datetime.date.today)
+
+class RecurringExpenseResponse(BaseModel):
+    id: int
+    description: str
+    amount: float
+    category_id: int
+    rule: str
+    start_date: datetime.date
+    next_date: Optional[datetime.date]
+
+    class Config:
+        from_attributes = True
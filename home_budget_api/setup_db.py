@@ -1,17 +1,38 @@
 # setup_db.py
+"""One-shot database setup, run before the app starts (the app itself never
+creates tables or rows on startup):
+
+    python setup_db.py [superuser_password]
+    python -m home_budget_api.setup_db [superuser_password]
+
+With the postgres superuser password it first creates the database and its
+user. It then runs the Alembic migrations, seeds the preset categories and
+creates the coming months' expense partitions, against DATABASE_URL. Every
+step skips what already exists, so it is safe to run on every deploy.
+"""
+import argparse
 import sys
 import os
 import subprocess
 import psycopg2
 from psycopg2 import sql
+from sqlalchemy import text
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python setup_db.py <superuser_password>")
-        sys.exit(1)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from home_budget_api import database, partitions  # noqa: E402
 
-    super_pass = sys.argv[1]
+PRESET_CATEGORIES = ["food", "car", "recreation"]
 
+# ix_categories_preset_name is unique, so the presets that exist are skipped.
+SEED_PRESET_CATEGORIES = text("""
+INSERT INTO categories (name) SELECT unnest(CAST(:names AS varchar[]))
+ON CONFLICT (name) WHERE user_id IS NULL DO NOTHING
+""")
+
+
+def create_database(super_pass: str) -> None:
     super_conn_info = {
         "host": "localhost",
         "dbname": "postgres",
@@ -69,13 +90,35 @@ def main():
 
     print(f"Database '{db_name}' is ready with user '{db_user}'")
 
+
+def seed_preset_categories(connection) -> int:
+    """Insert the preset categories that are missing; returns how many were inserted."""
+    return connection.execute(SEED_PRESET_CATEGORIES, {"names": PRESET_CATEGORIES}).rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create, migrate and seed the database.")
+    parser.add_argument(
+        "superuser_password", nargs="?",
+        help="postgres superuser password; creates the database and its user first (skip if they exist)"
+    )
+    args = parser.parse_args()
+
+    if args.superuser_password is not None:
+        create_database(args.superuser_password)
+
     print("Running Alembic migrations...")
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
     subprocess.run(
         [sys.executable, "-m", "alembic", "upgrade", "head"],
         check=True,
         cwd=project_root
     )
+    try:
+        with database.engine.begin() as connection:
+            print(f"Seeded {seed_preset_categories(connection)} preset categories")
+            print(f"Created {partitions.ensure(connection)} partitions")
+    finally:
+        database.engine.dispose()
     print("Database setup complete!")
 
 if __name__ == "__main__":
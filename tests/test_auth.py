@@ -0,0 +1,25 @@
+"""Registration: a username taken by another registration is refused with a 400,
+including one taken while this registration was hashing its password."""
+import uuid
+
+from home_budget_api import database, models, passwords
+
+
+def test_taken_username_is_refused(client, monkeypatch, db_mode):
+    username = f"test_{uuid.uuid4().hex[:12]}"
+    hash_password = passwords.hash_password
+
+    async def hash_while_another_registers(password: str) -> str:
+        # Past the username check, so only the unique constraint catches it.
+        password_hash = await hash_password(password)
+        with database.SessionLocal() as other:
+            other.add(models.User(username=username, password_hash=password_hash))
+            other.commit()
+        return password_hash
+
+    monkeypatch.setattr(passwords, "hash_password", hash_while_another_registers)
+    response = client.post("/auth/register", json={"username": username, "password": "first"})
+    assert (response.status_code, response.json()) == (400, {"detail": "Username already registered"})
+
+    again = client.post("/auth/register", json={"username": username, "password": "second"})
+    assert again.status_code == 400
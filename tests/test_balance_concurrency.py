@@ -0,0 +1,103 @@
+"""Concurrent writes against one balance: none lost, none applied twice, the
+balance never negative and the rollups in step with the expenses.
+
+benchmarks/concurrency.py runs the same kind of mix at volume against a server
+to measure throughput.
+"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from home_budget_api import budgets, models, rollups
+
+STARTING_BALANCE = Decimal("1000")
+
+
+def balance_of(client, user) -> Decimal:
+    return Decimal(str(client.get("/auth/userinfo", headers=user.headers).json()["initial_balance"]))
+
+
+def spent_by(db, user) -> Decimal:
+    return db.scalar(select(func.coalesce(func.sum(models.Expense.amount), 0)).where(models.Expense.user_id == user.id))
+
+
+def assert_consistent(db, user) -> None:
+    assert rollups.verify(db, user.id) == []
+    assert budgets.verify(db, user.id) == []
+
+
+def test_concurrent_debits_stop_at_zero(client, db, new_user, db_mode):
+    user = new_user()
+    client.post("/budgets/", json={"category_id": user.category_id, "amount": 500}, headers=user.headers)
+
+    def create(_):
+        return client.post(
+            "/expenses/", json={"description": "debit", "amount": 70, "category_id": user.category_id},
+            headers=user.headers
+        )
+
+    with ThreadPoolExecutor(16) as pool:
+        responses = list(pool.map(create, range(40)))
+
+    assert sorted({response.status_code for response in responses}) == [200, 400]
+    accepted = sum(response.status_code == 200 for response in responses)
+    assert accepted == 1000 // 70
+    assert balance_of(client, user) == STARTING_BALANCE - 70 * accepted
+    assert spent_by(db, user) == 70 * accepted
+    assert_consistent(db, user)
+
+
+def test_concurrent_mixed_writes_keep_the_balance(client, db, new_user, db_mode):
+    user = new_user()
+    categories = [user.category_id] + [
+        client.post("/categories/", json={"name": f"extra {i}"}, headers=user.headers).json()["id"] for i in range(3)
+    ]
+    rng = random.Random(0)
+    plan = [rng.choice(["create", "create_delete_twice", "balance", "bulk"]) for _ in range(120)]
+    plan[::40] = ["delete_category"] * len(plan[::40])
+
+    def create(category_id: int):
+        return client.post(
+            "/expenses/", json={"description": "mixed", "amount": rng.choice([1, 2.5, 7, 13.25]), "category_id": category_id},
+            headers=user.headers
+        )
+
+    def run(step):
+        index, action = step
+        category_id = categories[index % len(categories)]
+        if action == "create":
+            return action, create(category_id).status_code, Decimal(0)
+        if action == "create_delete_twice":
+            # In the category no step deletes, so exactly one delete finds it.
+            response = create(user.category_id)
+            if response.status_code != 200:
+                return action, response.status_code, Decimal(0)
+            path = f"/expenses/{response.json()['id']}"
+            with ThreadPoolExecutor(2) as pair:
+                deletes = [r.status_code for r in pair.map(lambda _: client.delete(path, headers=user.headers), range(2))]
+            assert sorted(deletes) == [200, 404]
+            return action, 200, Decimal(0)
+        if action == "balance":
+            amount = rng.choice([-20, -5, 5, 20])
+            response = client.patch("/auth/me/balance", json={"amount": amount}, headers=user.headers)
+            return action, response.status_code, Decimal(amount) if response.status_code == 200 else Decimal(0)
+        if action == "bulk":
+            rows = "".join(f'{{"description": "bulk", "amount": 1.5, "category_id": {category_id}}}\n' for _ in range(10))
+            response = client.post(
+                "/expenses/bulk?format=ndjson", files={"file": ("rows.ndjson", rows)}, headers=user.headers
+            )
+            return action, response.status_code, Decimal(0)
+        response = client.delete(f"/categories/{categories[-1 - index // 40]}", headers=user.headers)
+        return action, response.status_code, Decimal(0)
+
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(run, enumerate(plan)))
+
+    assert all(status in (200, 400, 404) for _, status, _ in results), results
+    accepted_changes = sum(change for _, _, change in results)
+    balance = balance_of(client, user)
+    assert balance >= 0
+    assert balance == STARTING_BALANCE + accepted_changes - spent_by(db, user)
+    assert_consistent(db, user)
@@ -0,0 +1,73 @@
+"""POST /expenses/batch with an Idempotency-Key: a retry gets the first response
+back without applying the batch again, even while the first is still running;
+the key with another body is a 422, and a batch that failed does not keep it."""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+
+def balance_of(client, user) -> Decimal:
+    return Decimal(str(client.get("/auth/userinfo", headers=user.headers).json()["initial_balance"]))
+
+
+def creates(user, *amounts, category_id=None) -> dict:
+    return {"operations": [
+        {"op": "create", "description": "batch", "amount": amount, "category_id": category_id or user.category_id}
+        for amount in amounts
+    ]}
+
+
+def post(client, user, body: dict, key: str):
+    return client.post("/expenses/batch", json=body, headers={**user.headers, "Idempotency-Key": key})
+
+
+def test_retry_gets_the_first_response(client, new_user, db_mode):
+    user = new_user()
+    key = str(uuid.uuid4())
+    first = post(client, user, creates(user, 10, 5), key)
+    retry = post(client, user, creates(user, 10, 5), key)
+
+    assert first.status_code == retry.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert first.json()["balance"] == 985
+    assert balance_of(client, user) == 985
+
+
+def test_key_with_another_body_is_refused(client, new_user, db_mode):
+    user = new_user()
+    key = str(uuid.uuid4())
+    assert post(client, user, creates(user, 10), key).status_code == 200
+    assert post(client, user, creates(user, 11), key).status_code == 422
+
+    # Fingerprinted as sent, so spelling out the default date is another body.
+    today = {"operations": [{**creates(user, 10)["operations"][0], "date": str(date.today())}]}
+    assert post(client, user, today, key).status_code == 422
+    assert balance_of(client, user) == 990
+
+
+def test_failed_batch_does_not_keep_its_key(client, new_user, db_mode):
+    user = new_user()
+    key = str(uuid.uuid4())
+    failed = post(client, user, creates(user, 10, category_id=2**31 - 1), key)
+    assert failed.status_code == 400
+    assert failed.json()["applied"] is False
+
+    again = post(client, user, creates(user, 10, category_id=2**31 - 1), key)
+    assert again.status_code == 400 and "Idempotent-Replayed" not in again.headers
+    assert post(client, user, creates(user, 10), key).status_code == 200
+    assert balance_of(client, user) == 990
+
+
+def test_concurrent_retries_apply_once(client, new_user, db_mode):
+    user = new_user()
+    key = str(uuid.uuid4())
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(lambda _: post(client, user, creates(user, 7), key), range(8)))
+
+    assert [response.status_code for response in responses] == [200] * 8
+    assert sum("Idempotent-Replayed" not in response.headers for response in responses) == 1
+    assert all(response.json() == responses[0].json() for response in responses)
+    assert balance_of(client, user) == 993
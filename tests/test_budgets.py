@@ -0,0 +1,112 @@
+"""Budget counters: kept by the expense writes, started from the rollup when a
+budget is created (even while expense writes are in progress), rebuilt from
+the expenses, and the X-Budget-Overspent header of a write that goes over."""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import update
+
+from home_budget_api import budgets, database, models, rollups
+
+MAY, JUNE = "2026-05-10", "2026-06-10"
+
+
+def add_expense(client, user, amount, day, category_id=None):
+    return client.post(
+        "/expenses/", json={"description": "x", "amount": amount, "date": day, "category_id": category_id or user.category_id},
+        headers=user.headers
+    )
+
+
+def spent_in(client, user, day) -> list:
+    status = client.get("/budgets/status", params={"month": day}, headers=user.headers).json()
+    return [(budget["spent"], budget["over_budget"]) for budget in status["budgets"]]
+
+
+def test_counters_follow_expense_writes(client, db, new_user, db_mode):
+    user = new_user()
+    budget_id = client.post("/budgets/", json={"category_id": user.category_id, "amount": 50}, headers=user.headers).json()["id"]
+    other = client.post("/categories/", json={"name": "other"}, headers=user.headers).json()["id"]
+
+    first = add_expense(client, user, 20, MAY).json()["id"]
+    add_expense(client, user, 7.5, JUNE)
+    add_expense(client, user, 100, MAY, category_id=other)
+    assert spent_in(client, user, MAY) == [(20, False)]
+    assert spent_in(client, user, JUNE) == [(7.5, False)]
+
+    client.delete(f"/expenses/{first}", headers=user.headers)
+    assert spent_in(client, user, MAY) == [(0, False)]
+    client.patch(f"/budgets/{budget_id}", json={"amount": 5}, headers=user.headers)
+    assert spent_in(client, user, JUNE) == [(7.5, True)]
+    assert budgets.verify(db, user.id) == []
+
+
+def test_new_budget_starts_from_earlier_expenses(client, db, new_user, db_mode):
+    user = new_user()
+    for amount, day in [(10, MAY), (2.25, MAY), (4, JUNE)]:
+        add_expense(client, user, amount, day)
+    response = client.post("/budgets/", json={"category_id": user.category_id, "amount": 12}, headers=user.headers)
+    assert response.status_code == 200
+
+    assert spent_in(client, user, MAY) == [(12.25, True)]
+    assert spent_in(client, user, JUNE) == [(4, False)]
+    again = client.post("/budgets/", json={"category_id": user.category_id, "amount": 1}, headers=user.headers)
+    assert again.status_code == 409
+    assert budgets.verify(db, user.id) == []
+
+
+def test_overspent_header_lists_the_budgets_gone_over(client, new_user, db_mode):
+    user = new_user()
+    budget_id = client.post("/budgets/", json={"category_id": user.category_id, "amount": 10}, headers=user.headers).json()["id"]
+
+    assert "X-Budget-Overspent" not in add_expense(client, user, 10, MAY).headers
+    assert add_expense(client, user, 0.01, MAY).headers["X-Budget-Overspent"] == str(budget_id)
+    # Each month has its own counter.
+    assert "X-Budget-Overspent" not in add_expense(client, user, 3, JUNE).headers
+
+
+def test_rebuild_repairs_drifted_counters(client, db, new_user):
+    user = new_user()
+    budget_id = client.post("/budgets/", json={"category_id": user.category_id, "amount": 10}, headers=user.headers).json()["id"]
+    add_expense(client, user, 4, MAY)
+    add_expense(client, user, 6, JUNE)
+
+    # Rolled back with the db fixture; no request may write counters meanwhile.
+    db.execute(update(models.BudgetSpend).where(models.BudgetSpend.budget_id == budget_id).values(spent=0))
+    assert [(row.month.month, row.expected_spent) for row in budgets.verify(db, user.id)] == [(5, 4), (6, 6)]
+    assert budgets.rebuild(db, user.id) == 2
+    assert budgets.verify(db, user.id) == []
+
+
+def test_new_budget_waits_for_expense_writes_in_progress(client, db, new_user, db_mode):
+    user = new_user()
+    # An expense write between its balance change and its commit, done as
+    # create_expense does it: the counters of a budget it cannot see yet are
+    # left to start_counters.
+    with database.SessionLocal() as writer:
+        expense = models.Expense(
+            description="in flight", amount=Decimal("5"), currency="EUR", date=date.today(),
+            user_id=user.id, category_id=user.category_id
+        )
+        writer.add(expense)
+        writer.flush()
+        writer.execute(
+            update(models.User).where(models.User.id == user.id)
+            .values(initial_balance=models.User.initial_balance - expense.amount)
+        )
+        rollups.add_expense(writer, expense)
+
+        with ThreadPoolExecutor(1) as pool:
+            pending = pool.submit(
+                client.post, "/budgets/", json={"category_id": user.category_id, "amount": 100}, headers=user.headers
+            )
+            time.sleep(0.5)
+            assert not pending.done()
+            writer.commit()
+            assert pending.result().status_code == 200
+
+    status = client.get("/budgets/status", headers=user.headers).json()
+    assert status["budgets"][0]["spent"] == 5
+    assert budgets.verify(db, user.id) == []
@@ -0,0 +1,94 @@
+"""RedisCache against an in-process fake server: reads, writes, invalidation on
+writes and failing open when the server is unreachable; and the per worker
+memory backend refused when there are several workers."""
+import asyncio
+
+import pytest
+from fakeredis import FakeAsyncRedis
+from redis.exceptions import ConnectionError
+
+from home_budget_api import cache
+
+
+class UnreachableRedis:
+    """A client whose every command fails as if the server were down."""
+
+    async def get(self, key):
+        raise ConnectionError("Connection refused")
+
+    async def set(self, key, value, ex=None):
+        raise ConnectionError("Connection refused")
+
+    async def delete(self, *keys):
+        raise ConnectionError("Connection refused")
+
+
+@pytest.fixture
+def redis_cache():
+    previous = cache.backend
+    backend = cache.RedisCache(FakeAsyncRedis())
+    cache.set_backend(backend)
+    try:
+        yield backend
+    finally:
+        cache.set_backend(previous)
+
+
+def test_get_set_and_delete(redis_cache):
+    async def run():
+        assert await redis_cache.get("a") is None
+        await redis_cache.set("a", b"1")
+        await redis_cache.set("b", b"2")
+        assert await redis_cache.get("a") == b"1"
+        assert await redis_cache.client.ttl("home_budget:a") == int(cache.CACHE_TTL)
+        await redis_cache.delete("a", "missing")
+        return await redis_cache.get("a"), await redis_cache.get("b")
+
+    assert asyncio.run(run()) == (None, b"2")
+    stats = redis_cache.stats
+    assert (stats.hits, stats.misses, stats.invalidations, stats.errors) == (2, 2, 1, 0)
+
+
+def test_writes_invalidate_only_their_user(client, new_user, redis_cache):
+    user, other = new_user(), new_user()
+    for someone in (user, other):
+        client.get("/expenses/summary", headers=someone.headers)
+        client.get("/categories/", headers=someone.headers)
+    keys = [cache.summary_key(u.id) for u in (user, other)] + [cache.categories_key(u.id) for u in (user, other)]
+    assert all(asyncio.run(redis_cache.get(key)) for key in keys)
+
+    client.post("/expenses/", json={"description": "x", "amount": 5, "category_id": user.category_id}, headers=user.headers)
+    client.post("/categories/", json={"name": "new"}, headers=user.headers)
+
+    cached = {key: asyncio.run(redis_cache.get(key)) is not None for key in keys}
+    assert cached == {
+        cache.summary_key(user.id): False, cache.summary_key(other.id): True,
+        cache.categories_key(user.id): False, cache.categories_key(other.id): True
+    }
+    summary = client.get("/expenses/summary", headers=user.headers).json()
+    assert summary["total_spent"] == 5
+
+
+def test_unreachable_server_fails_open(client, new_user):
+    previous = cache.backend
+    backend = cache.RedisCache(UnreachableRedis())
+    cache.set_backend(backend)
+    try:
+        user = new_user()
+        assert client.get("/expenses/summary", headers=user.headers).status_code == 200
+        response = client.post(
+            "/expenses/", json={"description": "x", "amount": 5, "category_id": user.category_id}, headers=user.headers
+        )
+        assert response.status_code == 200
+        assert client.get("/expenses/summary", headers=user.headers).json()["total_spent"] == 5
+    finally:
+        cache.set_backend(previous)
+    assert backend.stats.errors >= 5
+    assert backend.stats.hits == 0
+
+
+def test_memory_backend_is_refused_with_several_workers(monkeypatch):
+    monkeypatch.setattr(cache, "WEB_CONCURRENCY", 2)
+    with pytest.raises(RuntimeError):
+        cache.create_backend("memory")
+    assert cache.create_backend("none").name == "none"
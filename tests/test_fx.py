@@ -0,0 +1,85 @@
+"""Expenses in another currency: the balance, refunds, budgets and reports all
+add up the same per expense amounts, rounded to cents once when written; rates
+filled in for days without a quote give way to quotes loaded later."""
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+# XTS is the ISO 4217 code reserved for testing. At 3 XTS to the euro, 1 XTS
+# is 0.33 euro per expense, while a day of three adds up to 1.00 euro.
+DAY = "2026-05-02"
+RATES = [("EUR", DAY, 1), ("XTS", DAY, 3)]
+
+
+@pytest.fixture(scope="module")
+def rates(database_schema):
+    from home_budget_api import database
+
+    with database.engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO fx_rates (currency, day, rate) VALUES (:currency, :day, :rate) ON CONFLICT DO NOTHING"),
+            [{"currency": currency, "day": day, "rate": rate} for currency, day, rate in RATES]
+        )
+
+
+def balance_of(client, user) -> Decimal:
+    return Decimal(str(client.get("/auth/userinfo", headers=user.headers).json()["initial_balance"]))
+
+
+def spent(client, user) -> dict:
+    summary = client.get("/expenses/summary", headers=user.headers).json()
+    series = client.get(
+        "/expenses/timeseries", params={"bucket": "month", "from": DAY, "to": DAY}, headers=user.headers
+    ).json()
+    status = client.get("/budgets/status", params={"month": DAY}, headers=user.headers).json()
+    return {
+        "summary": Decimal(str(summary["total_spent"])),
+        "timeseries": Decimal(str(series["points"][0]["total"])),
+        "budget": Decimal(str(status["budgets"][0]["spent"]))
+    }
+
+
+def test_reports_add_up_what_the_balance_was_debited(client, db, new_user, rates, db_mode):
+    from home_budget_api import budgets, rollups
+
+    user = new_user()
+    category_id = client.post("/categories/", json={"name": "travel"}, headers=user.headers).json()["id"]
+    ids = [
+        client.post(
+            "/expenses/", json={"description": "ticket", "amount": 1, "currency": "XTS", "date": DAY, "category_id": category_id},
+            headers=user.headers
+        ).json()["id"]
+        for _ in range(3)
+    ]
+    # Started from the rollup after the expenses were written
+    client.post("/budgets/", json={"category_id": category_id, "amount": 100}, headers=user.headers)
+
+    assert balance_of(client, user) == Decimal("999.01")
+    assert spent(client, user) == dict.fromkeys(["summary", "timeseries", "budget"], Decimal("0.99"))
+
+    client.delete(f"/expenses/{ids[0]}", headers=user.headers)
+    assert balance_of(client, user) == Decimal("999.34")
+    assert spent(client, user) == dict.fromkeys(["summary", "timeseries", "budget"], Decimal("0.66"))
+    assert rollups.verify(db, user.id) == []
+    assert budgets.verify(db, user.id) == []
+
+    client.delete(f"/categories/{category_id}", headers=user.headers)
+    assert balance_of(client, user) == Decimal("1000")
+
+
+def test_load_replaces_filled_in_rates_only(db):
+    from home_budget_api import fx
+
+    quoted, filled = date(2026, 6, 1), date(2026, 6, 3)
+    db.execute(text("INSERT INTO fx_rates (currency, day, rate) VALUES ('XTS', :day, 4)"), {"day": quoted})
+    assert fx.fill(db, [("XTS", filled)]) == {("XTS", filled): Decimal("4")}
+
+    rows = io.StringIO(f"date,currency,rate\n{filled},XTS,5\n{quoted},XTS,7\n")
+    assert fx.load(db, rows, "EUR") == 3
+    stored = db.execute(text(
+        "SELECT day, rate, derived FROM fx_rates WHERE currency = 'XTS' AND day BETWEEN :quoted AND :filled ORDER BY day"
+    ), {"quoted": quoted, "filled": filled}).all()
+    assert stored == [(quoted, Decimal("4"), False), (filled, Decimal("5"), False)]
@@ -0,0 +1,97 @@
+"""Token buckets of the memory backend and of RedisLimiter on a fake Redis
+server, and the middleware's concurrency cap."""
+import asyncio
+
+import pytest
+from fakeredis import FakeAsyncRedis
+from redis.exceptions import ConnectionError
+
+from home_budget_api import ratelimit
+from home_budget_api.routers.auth import create_access_token
+
+ROUTE = ratelimit.Limit.parse("5/60")
+DEFAULT = ratelimit.Limit.parse("1/60")
+
+
+class UnreachableRedis:
+    """register_script of a client whose server is down."""
+
+    def register_script(self, script):
+        async def run(keys, args):
+            raise ConnectionError("Connection refused")
+
+        return run
+
+
+@pytest.fixture(params=["memory", "redis"])
+def limiter(request):
+    if request.param == "memory":
+        return ratelimit.MemoryLimiter()
+    return ratelimit.RedisLimiter(FakeAsyncRedis())
+
+
+def test_refused_request_takes_no_tokens(limiter):
+    buckets = [("route:a", ROUTE), ("all:a", DEFAULT)]
+
+    async def run():
+        first = await limiter.acquire(buckets)
+        second = await limiter.acquire(buckets)
+        # The route bucket still has the four tokens the first request left.
+        route_only = [await limiter.acquire([("route:a", ROUTE)]) for _ in range(5)]
+        return first, second, route_only
+
+    first, second, route_only = asyncio.run(run())
+    assert first == [0, 0]
+    assert second[0] == 0 and 59 < second[1] <= 60
+    assert [any(waits) for waits in route_only] == [False] * 4 + [True]
+
+
+def test_buckets_are_per_client(limiter):
+    async def run():
+        return [await limiter.acquire([(f"all:{client}", DEFAULT)]) for client in ("a", "b", "a")]
+
+    assert [any(waits) for waits in asyncio.run(run())] == [False, False, True]
+
+
+def test_unreachable_server_fails_open():
+    limiter = ratelimit.RedisLimiter(UnreachableRedis())
+    assert asyncio.run(limiter.acquire([("route:a", ROUTE), ("all:a", DEFAULT)])) == [0.0, 0.0]
+    assert limiter.stats.errors == 1
+
+
+def scope(headers: list, client: str = "10.0.0.1") -> dict:
+    return {"type": "http", "method": "GET", "path": "/", "headers": headers, "client": (client, 1234)}
+
+
+async def requests_in_parallel(headers: list, count: int, concurrency: int) -> list:
+    """Statuses of `count` requests that are all in progress at once."""
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = ratelimit.RateLimitMiddleware(app, default=None, route_limits=[], concurrency=concurrency)
+
+    async def call() -> int:
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware(scope(headers), None, send)
+        return sent[0]["status"]
+
+    calls = [asyncio.create_task(call()) for _ in range(count)]
+    await asyncio.sleep(0.1)
+    release.set()
+    return sorted(await asyncio.gather(*calls))
+
+
+def test_concurrency_cap_applies_to_users_only():
+    token = create_access_token({"sub": "1"})
+    signed_in = [(b"authorization", f"Bearer {token}".encode())]
+    assert asyncio.run(requests_in_parallel(signed_in, 4, concurrency=2)) == [200, 200, 429, 429]
+    # Everyone behind one address shares it, so addresses are not capped.
+    assert asyncio.run(requests_in_parallel([], 4, concurrency=2)) == [200, 200, 200, 200]
@@ -0,0 +1,55 @@
+"""Paging through description search results: whole-word matches first, then
+prefix matches, each newest first, with no row skipped or repeated."""
+import json
+
+import pytest
+
+# The prefix matches are newer than some whole-word ones, so a page boundary
+# between the two ranks has rows on both sides of the cursor's date.
+EXPENSES = [
+    ("fuel a", "2026-01-10"),
+    ("fuelling b", "2026-03-05"),
+    ("fuel c", "2026-02-20"),
+    ("fuelling d", "2026-01-01"),
+    ("fuel e", "2026-02-20"),
+    ("groceries", "2026-03-01")
+]
+
+
+@pytest.fixture
+def searcher(client, new_user):
+    user = new_user()
+    for description, day in EXPENSES:
+        client.post(
+            "/expenses/", json={"description": description, "amount": 1, "date": day, "category_id": user.category_id},
+            headers=user.headers
+        )
+    # "fuel c" and "fuel e" share a day, so the newer id comes first.
+    return user, ["fuel e", "fuel c", "fuel a", "fuelling b", "fuelling d"]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5])
+def test_pages_cover_every_match_once(client, searcher, limit):
+    user, expected = searcher
+    descriptions, cursor = [], None
+    while True:
+        params = {"q": "fuel", "limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/expenses/", params=params, headers=user.headers)
+        assert response.status_code == 200
+        descriptions += [expense["description"] for expense in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert descriptions == expected
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4])
+def test_stream_resumes_after_a_page(client, searcher, limit):
+    user, expected = searcher
+    page = client.get("/expenses/", params={"q": "fuel", "limit": limit}, headers=user.headers)
+    rest = client.get(
+        "/expenses/", params={"q": "fuel", "stream": "true", "cursor": page.headers["X-Next-Cursor"]},
+        headers=user.headers
+    )
+    streamed = [json.loads(line)["description"] for line in rest.text.splitlines()]
+    assert [expense["description"] for expense in page.json()] + streamed == expected